@@ -0,0 +1,490 @@
+"""
+================================================================================
+STITCHING BENCHMARK AND ACCURACY SUITE
+================================================================================
+
+File: benchmark_stitching.py
+
+DESCRIPTION:
+    Synthetic benchmark for the stages of sequential_stitch3_FINAL.py.
+    A large source image is sliced into overlapping tiles with known
+    shifts, small rotations and exposure (gamma) offsets, so every stage
+    can be timed and the registration checked against ground truth.
+
+STAGES:
+    - adaptive_resize                        (per tile)
+    - detect_features                        (per proxy)
+    - match_features                         (per consecutive pair)
+    - compute_homography_ransac              (per pair, registration error)
+    - compute_translation_transform          (per pair, registration error)
+    - estimate_translation_phase_correlation (per pair, registration error;
+                                              weak or inconsistent peaks
+                                              count as failures)
+    - match_exposure_pair                    (per pair, gamma error)
+    - merge_exposure                         (whole chain, level error of
+                                              each tile against the reference)
+    - stitch_with_pyramid_blending           (two-image path, repeated)
+    - blend_into_canvas                      (preallocated canvas path)
+    - intelligent_merge                      (distance-weighted merge path)
+    - stitch_sequential                      (end to end)
+    - write_deep_zoom                        (odd-sized panorama, PNG tiles;
+                                              memmap input must match)
+    - order_images                           (shuffled tiles, order recovered
+                                              exactly or not)
+
+METRICS:
+    - time_s: median and minimum over --repeat runs
+    - peak_mb: peak Python/NumPy allocation during one extra traced run
+      (tracemalloc; OpenCV-internal buffers are not traced)
+    - error_px: mean/max distance between tile corners mapped by the
+      estimated and the true transform (render resolution)
+    - gamma_error: |estimated - true| relative gamma
+    - level_error: per tile, |mean level - mean level without the gamma
+      offset| after correction, and the same before correction (raw)
+    - deterministic: a second seeded stitch_sequential run is byte-identical
+    - memmap_match: write_deep_zoom from an np.memmap writes the same tiles
+      as from an in-memory array
+    - order_correct / misplaced: whether order_images returned the true
+      tile order, and how many positions differ
+    - meta.max_rss_mb: process peak resident memory (Unix only)
+
+ACCURACY:
+    The registration stages estimate a translation only, so they cannot
+    model the ±MAX_ROTATION_DEG rotation of the default tiles. With
+    rotation, error_px therefore contains the unmodelled rotation (up to
+    about tile_w · sin θ at the far corners; ~14 px mean and 30 px max
+    for 5 tiles × 1024 px). This is a known failure of the translation
+    model, not a regression. Accuracy figures are only meaningful for the
+    pure-translation case, --max-rotation 0 (feature registration ~0.02 px
+    there). Phase shifts are only counted when they pass both
+    PHASE_MIN_RESPONSE and PHASE_MIN_OVERLAP_NCC, as in stitch_sequential.
+
+USAGE:
+    python benchmark_stitching.py
+    python benchmark_stitching.py --max-rotation 0          (pure translation)
+    python benchmark_stitching.py --tiles 3 5 8 --widths 1024 2048 -o results.json
+    python benchmark_stitching.py -o new.json --compare results.json
+
+OUTPUT:
+    JSON with environment metadata and one record per
+    (tile count, tile width, stage); diff two runs with --compare.
+
+================================================================================
+"""
+
+import argparse
+import contextlib
+import filecmp
+import io
+import json
+import os
+import platform
+import statistics
+import tempfile
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+
+import sequential_stitch3_FINAL as stitch
+
+try:
+    import resource
+except ImportError:   # Windows
+    resource = None
+
+# Default source image: a finished panorama from the repo
+DEFAULT_SOURCE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..",
+                              "Results", "Final_Output", "panorama_sequential final 1.jpg")
+
+# Synthetic tile parameters
+TILE_OVERLAP = 0.3          # overlap fraction between neighbours
+TILE_ASPECT = 0.75          # tile height / width
+MAX_ROTATION_DEG = 1.0      # rotations drawn from ±MAX_ROTATION_DEG
+MAX_JITTER = 0.02           # shift jitter as a fraction of tile width
+MAX_GAMMA_OFFSET = 0.15     # tile gammas drawn from 1 ± MAX_GAMMA_OFFSET
+
+def _matrix(R=None, t=(0.0, 0.0)):
+    """3x3 affine matrix from a 2x2 linear part and a translation."""
+    M = np.eye(3)
+    if R is not None:
+        M[:2, :2] = R
+    M[:2, 2] = t
+    return M
+
+def make_tiles(source, n_tiles, tile_w, overlap=TILE_OVERLAP, max_rotation_deg=MAX_ROTATION_DEG,
+               max_jitter=MAX_JITTER, max_gamma_offset=MAX_GAMMA_OFFSET, seed=0):
+    """
+    Slice a source image into overlapping tiles with known geometry.
+
+    ALGORITHM:
+        1. Scale the source so the whole strip of tiles fits (plus margins)
+        2. Tile i has origin (i × step + jitter, margin + jitter) and a small
+           rotation about its centre; A_i maps source to tile coordinates
+        3. Render each tile with warpAffine and apply its gamma offset
+        4. True pairwise transform (tile i-1 -> tile i) = A_i @ inv(A_{i-1})
+
+    PARAMETERS:
+        source: Source image (BGR)
+        n_tiles: Number of tiles
+        tile_w: Tile width (height = tile_w × TILE_ASPECT)
+        overlap: Overlap fraction between neighbours (TILE_OVERLAP)
+        max_rotation_deg: Rotation range in degrees (MAX_ROTATION_DEG)
+        max_jitter: Shift jitter as a fraction of tile width (MAX_JITTER)
+        max_gamma_offset: Gamma range around 1.0 (MAX_GAMMA_OFFSET)
+        seed: Random seed
+
+    RETURNS:
+        tiles: List of tile images
+        truth: Dict with "pairwise" (true tile i-1 -> i transforms, None
+               for the first tile), "placement" (tile -> source transforms),
+               "gammas", "overlap_width" and "source_shape"
+    """
+    rng = np.random.default_rng(seed)
+    tile_h = int(tile_w * TILE_ASPECT)
+    step = int(tile_w * (1 - overlap))
+    margin = int(tile_w * (max_jitter + np.sin(np.radians(max_rotation_deg)))) + 4
+    need_w = step * (n_tiles - 1) + tile_w + 2 * margin
+    need_h = tile_h + 2 * margin
+
+    # Upscale the source if it is too small for this configuration
+    scale = max(need_w / source.shape[1], need_h / source.shape[0], 1.0)
+    if scale > 1.0:
+        source = cv2.resize(source, (int(np.ceil(source.shape[1] * scale)),
+                                     int(np.ceil(source.shape[0] * scale))),
+                            interpolation=cv2.INTER_CUBIC)
+
+    centre = np.array([tile_w / 2, tile_h / 2])
+    tiles, pairwise, placement, gammas = [], [], [], []
+    prev_A = None
+    for i in range(n_tiles):
+        jitter = rng.uniform(-max_jitter, max_jitter, 2) * tile_w
+        origin = np.array([margin + i * step, margin]) + jitter
+        theta = np.radians(rng.uniform(-max_rotation_deg, max_rotation_deg))
+        R = np.array([[np.cos(theta), -np.sin(theta)],
+                      [np.sin(theta), np.cos(theta)]])
+        # p_tile = R (p_src - origin - centre) + centre
+        A = _matrix(t=centre) @ _matrix(R) @ _matrix(t=-(origin + centre))
+
+        tile = cv2.warpAffine(source, A[:2], (tile_w, tile_h), flags=cv2.INTER_LINEAR,
+                              borderMode=cv2.BORDER_REFLECT)
+        gamma = 1.0 + rng.uniform(-max_gamma_offset, max_gamma_offset) if i > 0 else 1.0
+        tiles.append(stitch.apply_gamma_correction(tile, gamma))
+        gammas.append(gamma)
+        placement.append(np.linalg.inv(A))
+        pairwise.append(None if prev_A is None else A @ np.linalg.inv(prev_A))
+        prev_A = A
+
+    truth = dict(pairwise=pairwise, placement=placement, gammas=gammas,
+                 overlap_width=tile_w - step, source_shape=source.shape[:2])
+    return tiles, truth
+
+def registration_error(T_est, T_true, w, h):
+    """
+    Mean and max distance (pixels) between the corners of a w × h image
+    mapped by the estimated and the true transform. None if T_est is None.
+    """
+    if T_est is None:
+        return None
+    corners = np.array([[0, 0, 1], [w, 0, 1], [w, h, 1], [0, h, 1]], dtype=np.float64).T
+    p_est = T_est @ corners
+    p_true = T_true @ corners
+    d = np.linalg.norm(p_est[:2] / p_est[2] - p_true[:2] / p_true[2], axis=0)
+    return float(d.mean()), float(d.max())
+
+def _timed(fn, repeat):
+    """Run fn repeat times (output silenced); return (last result, list of seconds)."""
+    times = []
+    result = None
+    for _ in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()):
+            t = time.perf_counter()
+            result = fn()
+            times.append(time.perf_counter() - t)
+    return result, times
+
+def _traced_peak_mb(fn):
+    """Peak traced allocation (MB) of one silenced run of fn."""
+    tracemalloc.start()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak / (1024 * 1024)
+
+def benchmark_config(source, n_tiles, tile_w, repeat=3, seed=0, trace_memory=True,
+                     max_rotation_deg=MAX_ROTATION_DEG):
+    """
+    Benchmark every stage for one tile count and tile width.
+
+    PARAMETERS:
+        source: Source image
+        n_tiles: Number of tiles
+        tile_w: Tile width in pixels
+        repeat: Timed runs per stage (3)
+        seed: Random seed for tiles, RANSAC and OpenCV (0)
+        trace_memory: Measure peak allocation with an extra traced run (True)
+        max_rotation_deg: Tile rotation range in degrees (MAX_ROTATION_DEG)
+
+    RETURNS:
+        List of result records (one per stage)
+    """
+    tiles, truth = make_tiles(source, n_tiles, tile_w, max_rotation_deg=max_rotation_deg, seed=seed)
+    h, w = tiles[0].shape[:2]
+    pairs = list(range(1, n_tiles))
+    records = []
+
+    def run(stage, fn, **extra):
+        cv2.setRNGSeed(seed)
+        result, times = _timed(fn, repeat)
+        record = dict(tiles=n_tiles, tile_width=tile_w, tile_height=h, stage=stage,
+                      calls=extra.pop("calls", 1),
+                      time_s=dict(median=statistics.median(times), min=min(times)))
+        if trace_memory:
+            cv2.setRNGSeed(seed)
+            record["peak_mb"] = round(_traced_peak_mb(fn), 3)
+        record.update(extra)
+        records.append(record)
+        return result
+
+    proxies = run("adaptive_resize",
+                  lambda: [stitch.adaptive_resize(t, report_keypoints=False) for t in tiles],
+                  calls=n_tiles)
+    scales = [(p.shape[1] / w, p.shape[0] / h) for p in proxies]
+
+    features = run("detect_features",
+                   lambda: [stitch.detect_features(p) for p in proxies], calls=n_tiles)
+    keypoints = [kp for kp, _ in features]
+    descriptors = [des for _, des in features]
+
+    matches = run("match_features",
+                  lambda: [stitch.match_features(descriptors[i-1], descriptors[i]) for i in pairs],
+                  calls=len(pairs))
+
+    def estimator(stage, fn):
+        estimates = run(stage, lambda: [fn(i) for i in pairs], calls=len(pairs))
+        errors = []
+        for i, T in zip(pairs, estimates):
+            if T is not None:
+                T = stitch.rescale_transform(T, scales[i-1], scales[i])
+            errors.append(registration_error(T, truth["pairwise"][i], w, h))
+        found = [e for e in errors if e is not None]
+        records[-1]["success"] = len(found)
+        records[-1]["error_px"] = dict(
+            mean=float(np.mean([e[0] for e in found])) if found else None,
+            max=float(np.max([e[1] for e in found])) if found else None)
+
+    estimator("compute_homography_ransac",
+              lambda i: stitch.compute_homography_ransac(keypoints[i-1], keypoints[i], matches[i-1]))
+    estimator("compute_translation_transform",
+              lambda i: stitch.compute_translation_transform(keypoints[i-1], keypoints[i],
+                                                             matches[i-1], seed=seed))
+    # Weak or inconsistent peaks count as failures, as in stitch_sequential (SIFT fallback)
+    def phase(i):
+        T, response = stitch.estimate_translation_phase_correlation(proxies[i-1], proxies[i])
+        if response < stitch.PHASE_MIN_RESPONSE:
+            return None
+        return T if stitch.overlap_correlation(proxies[i-1], proxies[i], T) >= stitch.PHASE_MIN_OVERLAP_NCC else None
+    estimator("estimate_translation_phase_correlation", phase)
+
+    # Correction that maps tile i's exposure back onto tile i-1's
+    gammas = run("match_exposure_pair",
+                 lambda: [stitch.match_exposure_pair(tiles[i-1], tiles[i], truth["pairwise"][i], seed=seed)
+                          for i in pairs], calls=len(pairs))
+    true_gammas = [truth["gammas"][i-1] / truth["gammas"][i] for i in pairs]
+    gamma_errors = np.abs(np.array(gammas) - np.array(true_gammas))
+    records[-1]["gamma_error"] = dict(mean=float(gamma_errors.mean()), max=float(gamma_errors.max()))
+
+    # Chain correction towards tile 0 against the same tiles without gamma offsets
+    clean, _ = make_tiles(source, n_tiles, tile_w, max_rotation_deg=max_rotation_deg,
+                          max_gamma_offset=0.0, seed=seed)
+    corrected = run("merge_exposure",
+                    lambda: stitch._merge_exposure_corrected(tiles, truth["placement"], seed=seed),
+                    calls=n_tiles)
+    records[-1]["level_error"] = dict(
+        tiles=[round(abs(float(c.mean()) - float(r.mean())), 2) for c, r in zip(corrected, clean)],
+        raw=[round(abs(float(t.mean()) - float(r.mean())), 2) for t, r in zip(tiles, clean)])
+
+    overlap_width = truth["overlap_width"]
+
+    def pairwise_blend():
+        pano = tiles[0]
+        for i in pairs:
+            pano = stitch.stitch_with_pyramid_blending(pano, tiles[i], overlap_width)
+        return pano
+    run("stitch_with_pyramid_blending", pairwise_blend, calls=len(pairs))
+
+    def canvas_blend():
+        canvas = np.zeros((h, w + len(pairs) * (w - overlap_width), 3), dtype=np.uint8)
+        canvas[:, :w] = tiles[0]
+        x_end = w
+        for i in pairs:
+            x_end = stitch.blend_into_canvas(canvas, tiles[i], x_end, overlap_width, filled_h=h)
+        return canvas
+    run("blend_into_canvas", canvas_blend, calls=len(pairs))
+
+    # Distance-weighted merge with the true placements, cropped to the tiles
+    placement = [np.array(P) for P in truth["placement"]]
+    x_min = min(P[0, 2] for P in placement) - w * 0.05
+    y_min = min(P[1, 2] for P in placement) - h * 0.05
+    shift = _matrix(t=(-x_min, -y_min))
+    merge_transforms = [shift @ P for P in placement]
+    merge_w = int(max(P[0, 2] for P in placement) - x_min + w * 1.1)
+    merge_h = int(h * 1.1)
+    run("intelligent_merge",
+        lambda: stitch.intelligent_merge(tiles, merge_transforms, merge_h, merge_w),
+        calls=n_tiles)
+
+    def sequential():
+        return stitch.stitch_sequential(proxies, keypoints, descriptors, render_images=tiles, seed=seed)
+    pano = run("stitch_sequential", sequential, calls=1)
+    records[-1]["shape"] = list(pano.shape)
+    records[-1]["expected_width"] = int(w + len(pairs) * (w - overlap_width))
+    # Seeded runs must be byte-identical
+    with contextlib.redirect_stdout(io.StringIO()):
+        again = sequential()
+    records[-1]["deterministic"] = again.shape == pano.shape and again.tobytes() == pano.tobytes()
+
+    # Deep Zoom from an odd-sized panorama (odd levels are the edge case);
+    # the in-memory and memmap paths must write identical PNG tiles
+    odd = pano[:pano.shape[0] - 1 + pano.shape[0] % 2, :pano.shape[1] - 1 + pano.shape[1] % 2]
+    with tempfile.TemporaryDirectory() as tmp:
+        dzi = os.path.join(tmp, "memory.dzi")
+        run("write_deep_zoom", lambda: stitch.write_deep_zoom(odd, dzi, fmt="png"), calls=1)
+        mapped = np.lib.format.open_memmap(os.path.join(tmp, "odd.npy"), mode="w+",
+                                           dtype=odd.dtype, shape=odd.shape)
+        mapped[:] = odd
+        stitch.write_deep_zoom(mapped, os.path.join(tmp, "memmap.dzi"), fmt="png")
+        del mapped
+        tiles_written = [os.path.relpath(os.path.join(d, f), os.path.join(tmp, "memory_files"))
+                         for d, _, files in os.walk(os.path.join(tmp, "memory_files")) for f in files]
+        records[-1]["memmap_match"] = all(
+            os.path.exists(os.path.join(tmp, "memmap_files", t))
+            and filecmp.cmp(os.path.join(tmp, "memory_files", t), os.path.join(tmp, "memmap_files", t),
+                            shallow=False)
+            for t in tiles_written)
+
+    # Ordering from a shuffled set; map the result back to tile indices
+    shuffle = np.random.default_rng(seed).permutation(n_tiles)
+    order = run("order_images",
+                lambda: stitch.order_images([proxies[k] for k in shuffle],
+                                            [keypoints[k] for k in shuffle],
+                                            [descriptors[k] for k in shuffle]),
+                calls=1)
+    recovered = [int(shuffle[k]) for k in order]
+    records[-1]["order_correct"] = recovered == list(range(n_tiles))
+    records[-1]["misplaced"] = int(np.count_nonzero(np.array(recovered) != np.arange(n_tiles)))
+
+    return records
+
+def environment():
+    """Versions and machine details recorded with every result file."""
+    return dict(
+        timestamp=time.strftime("%Y-%m-%dT%H:%M:%S"),
+        python=platform.python_version(),
+        numpy=np.__version__,
+        opencv=cv2.__version__,
+        platform=platform.platform(),
+        cpu_count=os.cpu_count(),
+        opencv_threads=cv2.getNumThreads(),
+    )
+
+def max_rss_mb():
+    """Process peak resident memory in MB (None where unsupported)."""
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return rss / (1024 * 1024) if platform.system() == "Darwin" else rss / 1024
+
+def compare(results, baseline):
+    """
+    Print per-stage time ratios and error changes against a baseline file.
+
+    Ratios < 1.0 are speedups. Stages missing from either file are listed
+    but not compared.
+    """
+    def key(r):
+        return (r["tiles"], r["tile_width"], r["stage"])
+    old = {key(r): r for r in baseline["results"]}
+    print(f"\n{'tiles':>5} {'width':>6} {'stage':<40} {'old s':>9} {'new s':>9} {'ratio':>6}  error")
+    for r in results["results"]:
+        b = old.get(key(r))
+        if b is None:
+            print(f"{r['tiles']:>5} {r['tile_width']:>6} {r['stage']:<40} {'(new)':>9}")
+            continue
+        t_old, t_new = b["time_s"]["median"], r["time_s"]["median"]
+        ratio = t_new / t_old if t_old > 0 else float("nan")
+        err = ""
+        for metric in ("error_px", "gamma_error"):
+            if metric in r and metric in b and r[metric]["mean"] is not None and b[metric]["mean"] is not None:
+                err = f"{b[metric]['mean']:.3f} -> {r[metric]['mean']:.3f}"
+        print(f"{r['tiles']:>5} {r['tile_width']:>6} {r['stage']:<40} "
+              f"{t_old:>9.4f} {t_new:>9.4f} {ratio:>6.2f}  {err}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the stitching pipeline on synthetic tiles")
+    parser.add_argument("--source", default=DEFAULT_SOURCE, help="source image to slice into tiles")
+    parser.add_argument("--tiles", type=int, nargs="+", default=[3, 5], help="tile counts")
+    parser.add_argument("--widths", type=int, nargs="+", default=[1024, 2048], help="tile widths (pixels)")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per stage")
+    parser.add_argument("--seed", type=int, default=0, help="random seed")
+    parser.add_argument("--max-rotation", type=float, default=MAX_ROTATION_DEG,
+                        help="tile rotation range in degrees (0 = pure translation)")
+    parser.add_argument("--no-trace", action="store_true", help="skip the tracemalloc peak-memory runs")
+    parser.add_argument("-o", "--output", default="benchmark_results.json", help="results file (JSON)")
+    parser.add_argument("--compare", help="baseline results file to compare against")
+    args = parser.parse_args(argv)
+
+    source = cv2.imread(args.source)
+    if source is None:
+        raise SystemExit(f"Could not read source image: {args.source}")
+
+    results = dict(meta=environment(),
+                   config=dict(source=os.path.basename(args.source), tiles=args.tiles, widths=args.widths,
+                               repeat=args.repeat, seed=args.seed, overlap=TILE_OVERLAP,
+                               max_rotation_deg=args.max_rotation, max_gamma_offset=MAX_GAMMA_OFFSET),
+                   results=[])
+
+    for tile_w in args.widths:
+        for n_tiles in args.tiles:
+            print(f"Benchmarking {n_tiles} tiles × {tile_w}px...")
+            records = benchmark_config(source, n_tiles, tile_w, repeat=args.repeat, seed=args.seed,
+                                       trace_memory=not args.no_trace,
+                                       max_rotation_deg=args.max_rotation)
+            for r in records:
+                line = f"  {r['stage']:<40} {r['time_s']['median']:8.4f}s"
+                if "peak_mb" in r:
+                    line += f"  {r['peak_mb']:8.1f} MB"
+                if "error_px" in r:
+                    err = r["error_px"]["mean"]
+                    line += f"  err {err:.2f}px" if err is not None else "  err -"
+                    line += f" ({r['success']}/{r['calls']})"
+                if "gamma_error" in r:
+                    line += f"  gamma err {r['gamma_error']['mean']:.3f}"
+                if "deterministic" in r:
+                    line += "  deterministic" if r["deterministic"] else "  NOT DETERMINISTIC"
+                if "level_error" in r:
+                    line += (f"  level err max {max(r['level_error']['tiles']):.2f}"
+                             f" (raw {max(r['level_error']['raw']):.2f})")
+                if "memmap_match" in r:
+                    line += "  memmap tiles match" if r["memmap_match"] else "  MEMMAP TILES DIFFER"
+                if "order_correct" in r:
+                    line += f"  order {'ok' if r['order_correct'] else 'WRONG'} ({r['misplaced']} misplaced)"
+                print(line)
+            results["results"].extend(records)
+
+    results["meta"]["max_rss_mb"] = max_rss_mb()
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=1)
+    print(f"\n✓ Results written to: {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            compare(results, json.load(f))
+
+if __name__ == "__main__":
+    main()
@@ -15,32 +15,50 @@ DESCRIPTION:
     advanced computer vision techniques including:
     - Adaptive image resizing (preserves features)
     - Enhanced SIFT feature detection (5,000 keypoints)
-    - FLANN-based feature matching
+    - Selectable feature engines (SIFT default, ORB/AKAZE for throughput)
+    - FLANN-based feature matching (KD-tree for SIFT, LSH for binary)
     - Homography estimation with RANSAC
     - Translation-only fallback (prevents tilting)
-    - Pyramid blending with confidence mapping
+    - Multi-band (Laplacian pyramid) blending on the overlap strip, along a
+      minimum-error seam (dynamic programming on a downscaled strip)
     - Exposure matching via gamma correction
-    - Artifact removal and reflection filtering
-    - Global shift adjustment
+    - Global alignment: all tile positions solved together (sparse least
+      squares) for grid mosaics and unordered sets; optional (off by
+      default) in sequential stitching, where it does not move tiles
+    - 2D grid mosaics: only spatially overlapping tiles are matched
+    - Overlap-restricted features: optionally detect and match only in the
+      bands expected to overlap
+    - Unordered sets: capture order recovered from thumbnail descriptors,
+      matching only nearest-neighbour candidate pairs
+    - Tiled output: a .dzi output path writes a Deep Zoom tile pyramid
+      (tiles encoded in parallel) instead of one JPEG
+    - Optional structured metrics (stage timings, per-pair counts) as JSON
+      lines or a Chrome trace
 
 ALGORITHM SUMMARY:
-    1. Load images and adaptively resize (400-1024px range)
+    1. Load images and adaptively resize (400-1024px range) for registration
     2. Detect 5,000+ SIFT features per image
     3. Match features using FLANN (10x faster than BFMatcher)
     4. Estimate transformations using RANSAC
     5. Switch to translation-only if near-identity homography
-    6. Match exposures using gamma correction in LAB space
-    7. Blend images using pyramid method with confidence maps
-    8. Remove artifacts via median filtering
-    9. Apply global shift adjustment
-    10. Crop borders and save panorama
+    6. Optionally (GLOBAL_ALIGNMENT) refine the pairwise translations and
+       overlap widths from a global solve
+    7. Match exposures using gamma correction in LAB space
+    8. Blend images with multi-band pyramids on the overlap strip
+    9. Place non-overlapping image regions directly
+    10. Crop borders and save panorama (rendered from full-resolution originals)
 
 PERFORMANCE:
-    - Time: ~7-10 seconds for 5 images (1024×768 each)
-    - Memory: ~50-60 MB RAM
+    - Measured with the synthetic benchmark (tiles with known shifts):
+      python benchmark_stitching.py --tiles 5 --widths 1024
+    - Time: stitch_sequential ~1.2 s end to end for 5 tiles (1024×768 each),
+      median of 3 runs on one CPU core (OpenCV 5.0, NumPy 2.4)
+    - Memory: ~19 MB peak traced allocation in stitch_sequential
+      (OpenCV-internal buffers not traced)
+    - Registration: ~0.02 px corner error for pure translation
+      (--max-rotation 0); rotated tiles are a known failure, see
+      benchmark_stitching.py
     - Output: 768 × 3,072 pixels (5 images stitched)
-    - All images properly aligned with smooth transitions
-    - No visible seams, tilting, or reflections
 
 REQUIREMENTS:
     - Python 3.7+
@@ -50,6 +68,23 @@ REQUIREMENTS:
 
 USAGE:
     python sequential_stitch3_FINAL.py
+    python sequential_stitch3_FINAL.py -i <image folder> -o <panorama.jpg>
+    python sequential_stitch3_FINAL.py -i <image folder> -o <panorama.jpg> --metrics run.jsonl --trace run.json
+    python sequential_stitch3_FINAL.py -i <image folder> -o <mosaic.jpg> --grid 4x6 --grid-overlap 0.2
+    python sequential_stitch3_FINAL.py -i <image folder> -o <panorama.jpg> --unordered
+    python sequential_stitch3_FINAL.py -i <image folder> -o <panorama.jpg> --workers 4
+    python sequential_stitch3_FINAL.py -i <image folder> -o <panorama.jpg> --overlap-features
+    python sequential_stitch3_FINAL.py -i <image folder> -o <panorama.dzi>
+    python sequential_stitch3_FINAL.py -i <watched folder> -o <panorama.jpg> --watch --idle-timeout 30
+    python sequential_stitch3_FINAL.py --root <folder of capture sets> --output-dir <dir>
+    python sequential_stitch3_FINAL.py --manifest <sets.txt> --jobs 4 --memory-budget-mb 8000
+
+LIBRARY USE:
+    from sequential_stitch3_FINAL import Stitcher, StitcherConfig
+    stitcher = Stitcher(StitcherConfig())      # long-lived, engines stay warm
+    result = stitcher.stitch(images)           # in-memory BGR arrays, no prints
+    result.panorama, result.transforms, result.metrics
+    write_deep_zoom(result.panorama, "pano.dzi")   # tiled pyramid for viewers
 
 INPUT:
     - Folder: "nature_images/" with 5-10 overlapping images
@@ -58,40 +93,477 @@ INPUT:
 
 OUTPUT:
     - File: "nature_images output/panorama_sequential.jpg"
-    - Format: JPEG (8-bit, 3-channel, BGR)
+    - Format: JPEG (8-bit, 3-channel, BGR), or a Deep Zoom tile pyramid
+      (<name>.dzi + <name>_files/<level>/<col>_<row>.jpg) for .dzi paths
     - Resolution: Depends on input images
 
 ================================================================================
 """
 
+import argparse
+import contextlib
 import cv2
+import hashlib
+import json
 import numpy as np
 import os
-from scipy import signal
-from scipy.ndimage import distance_transform_edt
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from dataclasses import asdict, dataclass
+from multiprocessing import Pool
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import breadth_first_order, connected_components, minimum_spanning_tree
+from scipy.sparse.linalg import spsolve
+
+# Default single-set input folder and output file (used when no arguments are given)
+DEFAULT_INPUT_FOLDER = r"C:\Users\dhirender.pandey\meat cross-section stitching\nature (code, image, output)\nature_images"
+DEFAULT_OUTPUT_PATH = r"C:\Users\dhirender.pandey\meat cross-section stitching\nature (code, image, output)\nature_images output\panorama_sequential.jpg"
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+
+# Batch mode: concurrent capture sets are admitted while their estimated
+# peak memory fits in the budget (estimate = pixels × bytes/pixel + base)
+BATCH_JOBS = os.cpu_count() or 1
+BATCH_MEMORY_BUDGET_MB = 4096
+BATCH_BYTES_PER_PIXEL = 12     # originals + canvas + blend/exposure scratch
+BATCH_BASE_MEMORY_MB = 200     # interpreter, OpenCV, proxies, features
+
+# Watch-folder streaming mode
+STREAM_POLL_INTERVAL = 0.25        # seconds between folder scans
+STREAM_SETTLE_TIME = 0.5           # seconds a new file must be unchanged before reading
+STREAM_IDLE_TIMEOUT = None         # stop after this many idle seconds (None = until Ctrl+C)
+STREAM_PREVIEW_MAX_WIDTH = 4096    # preview is downscaled to this width
 
 # Parameters for adaptive resizing (minimum width 400 pixels)
 MIN_WIDTH = 400           # minimum width threshold
 MAX_DIM = 1024            # absolute maximum dimension
 MIN_KEYPOINTS = 500       # minimum number of keypoints to preserve
 
-# Initialize SIFT globally
-sift = cv2.SIFT_create()
+# Render the panorama from full-resolution originals; the resized copies
+# are only used for registration (feature detection and matching)
+RENDER_FULL_RESOLUTION = True
+
+# Feature engine used by detect_features/match_features: "sift" (default),
+# "orb" or "akaze", or a SIFTConfig/ORBConfig/AKAZEConfig instance
+FEATURE_ENGINE = "sift"
+
+# FLANN index algorithms
+FLANN_INDEX_KDTREE = 1    # float descriptors (SIFT)
+FLANN_INDEX_LSH = 6       # binary descriptors (ORB, AKAZE)
+
+# Number of worker processes for feature extraction (1 = serial)
+FEATURE_WORKERS = os.cpu_count() or 1
+
+# Registration backend: "sift" (features + RANSAC) or "phase" (FFT phase
+# correlation of the expected overlap bands, SIFT fallback on weak peaks or
+# shifts whose overlap does not line up)
+REGISTRATION_MODE = "sift"
+PHASE_EXPECTED_OVERLAP = 0.3   # expected overlap fraction between neighbours
+PHASE_MIN_RESPONSE = 0.2       # minimum normalized correlation peak to accept
+# A peak that passes PHASE_MIN_RESPONSE can still be a wrong one (partial
+# overlap, small rotations). The shifted overlap must also correlate this
+# well (normalized cross-correlation) before the phase shift replaces SIFT
+PHASE_MIN_OVERLAP_NCC = 0.9
+
+# Overlap-restricted features: detect and match only in the band of each
+# image expected to overlap its neighbour. The band is the expected overlap
+# (previous pair, else a coarse phase-correlation estimate, else the prior)
+# widened by OVERLAP_BAND_SLACK of itself, and never narrower than
+# OVERLAP_MIN_BAND of the image width
+OVERLAP_FEATURES = False
+OVERLAP_PRIOR = PHASE_EXPECTED_OVERLAP
+OVERLAP_BAND_SLACK = 0.25
+OVERLAP_MIN_BAND = 0.1
+
+# Translation RANSAC: hypotheses scored per array operation, and the seed
+# for reproducible runs, also used for exposure sampling (None =
+# nondeterministic; read at call time, so it can be set at runtime)
+RANSAC_BATCH_SIZE = 32
+RANSAC_SEED = None
+
+# Multi-band blending: context columns around the overlap strip and
+# pyramid band precision (np.float32 or np.float64)
+BLEND_MARGIN = 16
+BLEND_DTYPE = np.float32
+
+# Pyramid scratch buffers: strip sizes are rounded up to a multiple of
+# BLEND_SCRATCH_ALIGN so strips of similar size share one buffer set, and at
+# most BLEND_SCRATCH_SIZE sets are kept (least recently used evicted)
+BLEND_SCRATCH_ALIGN = 64
+BLEND_SCRATCH_SIZE = 16
+
+# Seam cut: the blend seam follows the minimum-difference path through the
+# overlap (instead of its centre line), searched on a strip downscaled by
+# SEAM_SCALE
+SEAM_CUT = True
+SEAM_SCALE = 0.25
+
+# Global alignment: all tile positions solved together (sparse least squares)
+# from adjacent and non-adjacent pairwise translations, with robust reweighting.
+# stitch_grid and order_images always solve globally. In stitch_sequential it
+# is off by default: the strip canvas does not draw tiles at the solved
+# positions (only the overlap widths change), and a non-adjacent pair needs
+# over 50% neighbour overlap (plus GLOBAL_MIN_OVERLAP) to add a loop closure,
+# so at the usual 25-35% overlap the solve reproduces the pairwise chain
+GLOBAL_ALIGNMENT = False
+GLOBAL_MAX_SKIP = 3            # also try pairs (i, i+2) .. (i, i+GLOBAL_MAX_SKIP)
+GLOBAL_MIN_OVERLAP = 0.15      # predicted overlap fraction needed to try a pair
+GLOBAL_OUTLIER_PX = 3.0        # robust scale (proxy pixels) for downweighting mismatched pairs
+GLOBAL_IRLS_ITERS = 20         # maximum reweighting iterations
+
+# Grid mosaicking: expected overlap between grid neighbours, tolerance on
+# the initial positions (fraction of tile size), and minimum footprint
+# overlap for a pair to be matched
+GRID_EXPECTED_OVERLAP = 0.2
+GRID_POSITION_TOLERANCE = 0.1
+GRID_MIN_OVERLAP = 0.05
+
+# Unordered sets: thumbnail size for the global descriptors, nearest
+# neighbours per image that become candidate pairs, and what a candidate
+# pair needs to count as overlapping: ratio-test matches, translation
+# inliers (absolute and as a fraction of the matches; chance matches
+# between unrelated images rarely agree on more than one or two), and
+# agreement with the spanning tree of the strongest links (fraction of
+# the image width)
+ORDER_THUMB_SIZE = 64
+ORDER_NEIGHBOURS = 4
+ORDER_MIN_MATCHES = 10
+ORDER_MIN_INLIERS = 8
+ORDER_MIN_INLIER_RATIO = 0.05
+ORDER_TREE_TOLERANCE = 0.05
+
+# Blend-weight masks memoized by image shape and valid-region signature
+WEIGHT_MASK_CACHE_SIZE = 32
+
+# Working-memory ceiling for out-of-core merging (intelligent_merge with out_path)
+MERGE_MEMORY_LIMIT_MB = 512
+
+# Tiled output (output path ending in .dzi): Deep Zoom tile pyramid, tiles
+# encoded on DZI_WORKERS threads
+DZI_TILE_SIZE = 254
+DZI_OVERLAP = 1
+DZI_FORMAT = "jpg"
+DZI_QUALITY = 90
+DZI_WORKERS = os.cpu_count() or 1
+
+# Persistent keypoint/descriptor cache (LRU-evicted above the size cap)
+USE_FEATURE_CACHE = True
+FEATURE_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "image_stitching", "features")
+FEATURE_CACHE_MAX_BYTES = 512 * 1024 * 1024   # 512 MB
+
+# Structured metrics (stage timings, per-pair counts, allocations); off by
+# default, enabled from the command line with --metrics / --trace
+METRICS_ENABLED = False
+
+# Console diagnostics (Stitcher turns them off for library use)
+VERBOSE = True
+
+def _log(*args, **kwargs):
+    """Print a diagnostic line when VERBOSE is set."""
+    if VERBOSE:
+        print(*args, **kwargs)
+
+@contextlib.contextmanager
+def _run_context(verbose, metrics):
+    """
+    Temporarily set VERBOSE and swap in a MetricsRecorder for one run.
+    
+    Module state is swapped, so one run at a time per process (concurrent
+    jobs use separate processes, as in run_batch).
+    """
+    global VERBOSE, METRICS
+    saved = VERBOSE, METRICS
+    VERBOSE, METRICS = verbose, metrics
+    try:
+        yield
+    finally:
+        VERBOSE, METRICS = saved
+
+class _Stage:
+    """Timed span of a MetricsRecorder (see MetricsRecorder.stage)."""
+    __slots__ = ("recorder", "name", "fields", "start")
+    
+    def __init__(self, recorder, name, fields):
+        self.recorder = recorder
+        self.name = name
+        self.fields = fields
+    
+    def __enter__(self):
+        self.recorder._stack.append(self.fields)
+        self.start = time.perf_counter_ns()
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        end = time.perf_counter_ns()
+        recorder = self.recorder
+        recorder._stack.pop()
+        event = dict(type="stage", name=self.name,
+                     ts_us=(self.start - recorder._t0) / 1000.0,
+                     dur_us=(end - self.start) / 1000.0,
+                     depth=len(recorder._stack))
+        if exc_type is not None:
+            event["error"] = exc_type.__name__
+        event.update(self.fields)
+        recorder.events.append(event)
+        return False
+
+_NULL_STAGE = contextlib.nullcontext()
+
+class MetricsRecorder:
+    """
+    Low-overhead recorder for stage timings and per-run counters.
+    
+    EVENTS:
+        stage:  wall time of a named span (nested spans allowed), plus any
+                fields attached with annotate() while it was open
+        count:  named value (e.g. cache hits), tagged with the open stage
+        alloc:  named allocation size in bytes (also summed into the open
+                stage's alloc_bytes)
+    
+    When disabled every call returns immediately (stage() hands back a
+    shared null context), so instrumentation can stay on hot paths.
+    
+    OUTPUT:
+        write_jsonl: one JSON object per event
+        write_chrome_trace: Chrome trace format (chrome://tracing, Perfetto)
+    """
+    
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.reset()
+    
+    def reset(self):
+        """Drop recorded events and restart the clock."""
+        self.events = []
+        self._stack = []
+        self._t0 = time.perf_counter_ns()
+    
+    def _now_us(self):
+        return (time.perf_counter_ns() - self._t0) / 1000.0
+    
+    def stage(self, name, **fields):
+        """Context manager timing a named stage (no-op when disabled)."""
+        if not self.enabled:
+            return _NULL_STAGE
+        return _Stage(self, name, fields)
+    
+    def annotate(self, **fields):
+        """Attach fields to the innermost open stage."""
+        if self.enabled and self._stack:
+            self._stack[-1].update(fields)
+    
+    def count(self, name, value=1, **fields):
+        """Record a named counter value."""
+        if not self.enabled:
+            return
+        self.events.append(dict(type="count", name=name, value=value,
+                                ts_us=self._now_us(), **fields))
+    
+    def alloc(self, name, nbytes):
+        """Record an allocation of nbytes (array.nbytes for arrays)."""
+        if not self.enabled:
+            return
+        self.events.append(dict(type="alloc", name=name, bytes=int(nbytes), ts_us=self._now_us()))
+        if self._stack:
+            self._stack[-1]["alloc_bytes"] = self._stack[-1].get("alloc_bytes", 0) + int(nbytes)
+    
+    def summary(self):
+        """Total wall time (seconds) and call count per stage name."""
+        totals = {}
+        for e in self.events:
+            if e["type"] == "stage":
+                t = totals.setdefault(e["name"], dict(calls=0, seconds=0.0))
+                t["calls"] += 1
+                t["seconds"] += e["dur_us"] / 1e6
+        return totals
+    
+    def write_jsonl(self, path):
+        """Write all events as JSON lines."""
+        with open(path, "w", encoding="utf-8") as f:
+            for e in self.events:
+                f.write(json.dumps(e, default=float) + "\n")
+    
+    def write_chrome_trace(self, path):
+        """
+        Write a Chrome trace: stages become complete ("X") events, counts
+        and allocations counter ("C") events.
+        """
+        pid = os.getpid()
+        trace = []
+        for e in self.events:
+            if e["type"] == "stage":
+                args = {k: v for k, v in e.items() if k not in ("type", "name", "ts_us", "dur_us", "depth")}
+                trace.append(dict(name=e["name"], ph="X", ts=e["ts_us"], dur=e["dur_us"],
+                                  pid=pid, tid=0, args=args))
+            elif e["type"] == "count":
+                trace.append(dict(name=e["name"], ph="C", ts=e["ts_us"], pid=pid,
+                                  args={"value": e["value"]}))
+            else:
+                trace.append(dict(name=e["name"], ph="C", ts=e["ts_us"], pid=pid,
+                                  args={"bytes": e["bytes"]}))
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": trace, "displayTimeUnit": "ms"}, f, default=float)
+
+# Process-wide recorder used by the pipeline
+METRICS = MetricsRecorder(enabled=METRICS_ENABLED)
+
+@dataclass(frozen=True)
+class SIFTConfig:
+    """
+    SIFT detector matched with a FLANN KD-tree (default engine).
+    
+    Robust to scale and rotation; 128-dimensional float descriptors.
+    """
+    nfeatures: int = 5000              # Increase max features to detect
+    nOctaveLayers: int = 5             # More octave layers for multi-scale detection
+    contrastThreshold: float = 0.01    # Lower threshold to detect more features
+    edgeThreshold: float = 15          # Edge threshold
+    sigma: float = 1.6                 # Gaussian kernel sigma
+    ratio: float = 0.7                 # Lowe's ratio test threshold
+    flann_trees: int = 5
+    flann_checks: int = 50
+    matcher: str = "flann"             # "flann" (KD-tree) or "bf" (L2 brute force)
+    
+    name = "sift"
+    norm = cv2.NORM_L2
+    
+    def create_detector(self):
+        return cv2.SIFT_create(
+            nfeatures=self.nfeatures,
+            nOctaveLayers=self.nOctaveLayers,
+            contrastThreshold=self.contrastThreshold,
+            edgeThreshold=self.edgeThreshold,
+            sigma=self.sigma
+        )
+    
+    def flann_params(self):
+        return dict(algorithm=FLANN_INDEX_KDTREE, trees=self.flann_trees)
+    
+    def search_params(self):
+        return dict(checks=self.flann_checks)
+
+class _BinaryMatching:
+    """Matcher construction shared by the binary-descriptor engines."""
+    
+    norm = cv2.NORM_HAMMING
+    
+    def flann_params(self):
+        return dict(algorithm=FLANN_INDEX_LSH, table_number=self.lsh_table_number,
+                    key_size=self.lsh_key_size, multi_probe_level=self.lsh_multi_probe_level)
+    
+    def search_params(self):
+        return dict(checks=self.flann_checks)
+
+@dataclass(frozen=True)
+class ORBConfig(_BinaryMatching):
+    """
+    ORB detector with binary descriptors (fast, less robust than SIFT).
+    
+    Matched through FLANN LSH (matcher="lsh") or Hamming brute force (matcher="bf").
+    """
+    nfeatures: int = 5000
+    scaleFactor: float = 1.2
+    nlevels: int = 8
+    edgeThreshold: int = 31
+    fastThreshold: int = 20
+    ratio: float = 0.75
+    matcher: str = "lsh"
+    lsh_table_number: int = 6
+    lsh_key_size: int = 12
+    lsh_multi_probe_level: int = 1
+    flann_checks: int = 50
+    
+    name = "orb"
+    
+    def create_detector(self):
+        return cv2.ORB_create(
+            nfeatures=self.nfeatures,
+            scaleFactor=self.scaleFactor,
+            nlevels=self.nlevels,
+            edgeThreshold=self.edgeThreshold,
+            fastThreshold=self.fastThreshold
+        )
+
+@dataclass(frozen=True)
+class AKAZEConfig(_BinaryMatching):
+    """
+    AKAZE detector with binary (MLDB) descriptors, matched like ORB.
+    
+    Requires an OpenCV build that provides cv2.AKAZE_create.
+    """
+    threshold: float = 0.001
+    nOctaves: int = 4
+    nOctaveLayers: int = 4
+    ratio: float = 0.75
+    matcher: str = "lsh"
+    lsh_table_number: int = 6
+    lsh_key_size: int = 12
+    lsh_multi_probe_level: int = 1
+    flann_checks: int = 50
+    
+    name = "akaze"
+    
+    def create_detector(self):
+        if not hasattr(cv2, "AKAZE_create"):
+            raise RuntimeError("AKAZE is not available in this OpenCV build; use ORBConfig")
+        return cv2.AKAZE_create(threshold=self.threshold, nOctaves=self.nOctaves,
+                                nOctaveLayers=self.nOctaveLayers)
+
+FEATURE_ENGINES = {
+    "sift": SIFTConfig,
+    "orb": ORBConfig,
+    "akaze": AKAZEConfig,
+}
+
+def resolve_feature_config(config=None):
+    """
+    Turn None, an engine name or a config object into a feature engine config.
+    
+    PARAMETERS:
+        config: None (use FEATURE_ENGINE), "sift"/"orb"/"akaze", or a config instance
+    
+    RETURNS:
+        SIFTConfig, ORBConfig or AKAZEConfig instance
+    """
+    if config is None:
+        config = FEATURE_ENGINE
+    if isinstance(config, str):
+        try:
+            return FEATURE_ENGINES[config.lower()]()
+        except KeyError:
+            raise ValueError(f"Unknown feature engine: {config!r}") from None
+    return config
+
+# Warm detectors, one per engine configuration (see get_detector)
+_DETECTORS = {}
+
+def get_detector(feature_config=None):
+    """
+    Shared detector for an engine configuration, created on first use and
+    kept for the life of the process (configs are frozen, so hashable).
+    """
+    feature_config = resolve_feature_config(feature_config)
+    detector = _DETECTORS.get(feature_config)
+    if detector is None:
+        detector = _DETECTORS[feature_config] = feature_config.create_detector()
+    return detector
 
-def adaptive_resize(img, min_width=MIN_WIDTH, max_dim=MAX_DIM, min_keypoints=MIN_KEYPOINTS):
+def adaptive_resize(img, min_width=MIN_WIDTH, max_dim=MAX_DIM, min_keypoints=MIN_KEYPOINTS,
+                    report_keypoints=True):
     """
     Adaptively resize image based on content and requirements.
     
     ALGORITHM:
         1. If width < 400px: Upscale using cubic interpolation
         2. If max dimension > 1024px: Downscale using area interpolation
-        3. Detect SIFT keypoints to verify feature preservation
+        3. Detect keypoints (FEATURE_ENGINE) to verify feature preservation
     
     PARAMETERS:
         img: Input image (numpy array)
         min_width: Minimum width threshold (400)
         max_dim: Maximum dimension limit (1024)
         min_keypoints: Feature threshold (500)
+        report_keypoints: Run feature detection to report keypoint count (True)
     
     RETURNS:
         Resized image preserving features
@@ -106,7 +578,7 @@ def adaptive_resize(img, min_width=MIN_WIDTH, max_dim=MAX_DIM, min_keypoints=MIN
         scale = min_width / w
         new_w, new_h = int(w * scale), int(h * scale)
         img = cv2.resize(img, (new_w, new_h), interpolation=cv2.INTER_CUBIC)
-        print(f"    Upscaled to {new_w}x{new_h}")
+        _log(f"    Upscaled to {new_w}x{new_h}")
         h, w = new_h, new_w
     
     # Second check: if max dimension > max_dim, scale down
@@ -117,45 +589,57 @@ def adaptive_resize(img, min_width=MIN_WIDTH, max_dim=MAX_DIM, min_keypoints=MIN
             scale = max_dim / h
         new_w, new_h = int(w * scale), int(h * scale)
         img = cv2.resize(img, (new_w, new_h), interpolation=cv2.INTER_AREA)
-        print(f"    Downscaled to {new_w}x{new_h}")
+        _log(f"    Downscaled to {new_w}x{new_h}")
         h, w = new_h, new_w
     
-    # Detect keypoints
-    keypoints = sift.detect(img, None)
-    print(f"    Final size: {w}x{h} with {len(keypoints)} keypoints")
+    # Detect keypoints (skipped when features come from the cache)
+    if not report_keypoints:
+        _log(f"    Final size: {w}x{h}")
+        return img
+    keypoints = get_detector().detect(img, None)
+    _log(f"    Final size: {w}x{h} with {len(keypoints)} keypoints")
     return img
 
-def load_images_from_folder(folder, use_adaptive_resize=True):
+def load_images_from_folder(folder, use_adaptive_resize=True, report_keypoints=True,
+                            return_originals=False):
     """
     Load all images from a folder and optionally resize.
     
     PARAMETERS:
         folder: Path to image directory
         use_adaptive_resize: Enable adaptive resizing (True)
+        report_keypoints: Count SIFT keypoints after resizing (True)
+        return_originals: Also return the full-resolution images (False)
     
     RETURNS:
-        images: List of image arrays
+        images: List of image arrays (registration proxies when resized)
         filenames: List of corresponding filenames
+        originals: List of full-resolution images (only if return_originals)
     """
     images = []
     filenames = []
+    originals = []
     for filename in sorted(os.listdir(folder)):
-        if filename.lower().endswith((".jpg", ".jpeg", ".png")):
+        if filename.lower().endswith(IMAGE_EXTENSIONS):
             filepath = os.path.join(folder, filename)
             img = cv2.imread(filepath)
             if img is not None:
+                if return_originals:
+                    originals.append(img)
                 if use_adaptive_resize:
-                    print(f"  Processing {filename}...")
-                    img = adaptive_resize(img)
+                    _log(f"  Processing {filename}...")
+                    img = adaptive_resize(img, report_keypoints=report_keypoints)
                 images.append(img)
                 filenames.append(filename)
+    if return_originals:
+        return images, filenames, originals
     return images, filenames
 
-def detect_features(img):
+def detect_features(img, feature_config=None):
     """
-    Detect SIFT features with enhanced parameters.
+    Detect features with the configured engine (SIFT by default).
     
-    SIFT PARAMETERS:
+    SIFT PARAMETERS (SIFTConfig defaults):
         - nfeatures: 5000 (max features to detect)
         - nOctaveLayers: 5 (multi-scale layers)
         - contrastThreshold: 0.01 (lower = more features)
@@ -164,65 +648,459 @@ def detect_features(img):
     
     PARAMETERS:
         img: Input image
+        feature_config: Engine config or name (None = FEATURE_ENGINE)
+    
+    RETURNS:
+        kp: KeypointArrays
+        des: Descriptors (128-d float for SIFT, binary uint8 for ORB/AKAZE)
+    """
+    kp, des = get_detector(feature_config).detectAndCompute(img, None)
+    return KeypointArrays.from_cv(kp), des
+
+class KeypointArrays:
+    """
+    Struct-of-arrays keypoint set used throughout the pipeline.
+    
+    FIELDS (contiguous, one entry per keypoint):
+        pts: (N, 2) float32 x, y coordinates
+        size, angle, response: (N,) float32
+        octave, class_id: (N,) int32
+    
+    Coordinates for a set of matches are gathered with plain fancy indexing
+    (kp.pts[matches[:, 0]]) instead of per-keypoint Python objects.
+    """
+    __slots__ = ("pts", "size", "angle", "response", "octave", "class_id")
+    
+    def __init__(self, pts, size, angle, response, octave, class_id):
+        self.pts = np.ascontiguousarray(pts, dtype=np.float32).reshape(-1, 2)
+        self.size = np.ascontiguousarray(size, dtype=np.float32)
+        self.angle = np.ascontiguousarray(angle, dtype=np.float32)
+        self.response = np.ascontiguousarray(response, dtype=np.float32)
+        self.octave = np.ascontiguousarray(octave, dtype=np.int32)
+        self.class_id = np.ascontiguousarray(class_id, dtype=np.int32)
+    
+    def __len__(self):
+        return len(self.pts)
+    
+    @classmethod
+    def from_cv(cls, kp):
+        """Convert detector output (cv2.KeyPoint sequence) once, at detection time."""
+        fields = np.array([(k.size, k.angle, k.response, k.octave, k.class_id) for k in kp],
+                          dtype=np.float64).reshape(-1, 5)
+        return cls(cv2.KeyPoint_convert(kp) if len(kp) else np.zeros((0, 2)),
+                   fields[:, 0], fields[:, 1], fields[:, 2], fields[:, 3], fields[:, 4])
+    
+    @classmethod
+    def from_array(cls, arr):
+        """Rebuild from keypoints_to_array output."""
+        return cls(arr[:, :2], arr[:, 2], arr[:, 3], arr[:, 4],
+                   arr[:, 5].astype(np.int64), arr[:, 6].astype(np.int64))
+    
+    def subset(self, idx):
+        """Keypoints at the given indices (or boolean mask)."""
+        return KeypointArrays(self.pts[idx], self.size[idx], self.angle[idx],
+                              self.response[idx], self.octave[idx], self.class_id[idx])
+    
+    def to_cv(self):
+        """cv2.KeyPoint tuple, for drawing and other OpenCV APIs."""
+        return array_to_keypoints(keypoints_to_array(self))
+
+def as_keypoint_arrays(kp):
+    """Accept KeypointArrays or a cv2.KeyPoint sequence; return KeypointArrays."""
+    if isinstance(kp, KeypointArrays):
+        return kp
+    return KeypointArrays.from_cv(kp)
+
+def as_match_array(matches):
+    """Accept an (M, 2) index array or a DMatch sequence; return (M, 2) int32."""
+    if isinstance(matches, np.ndarray):
+        return matches.reshape(-1, 2).astype(np.int32, copy=False)
+    return np.array([(m.queryIdx, m.trainIdx) for m in matches], dtype=np.int32).reshape(-1, 2)
+
+def match_points(kp1, kp2, matches):
+    """
+    Gather matched coordinates.
+    
+    RETURNS:
+        src_pts, dst_pts: (M, 2) float32 arrays
+    """
+    matches = as_match_array(matches)
+    return (as_keypoint_arrays(kp1).pts[matches[:, 0]],
+            as_keypoint_arrays(kp2).pts[matches[:, 1]])
+
+def keypoints_to_array(kp):
+    """
+    Pack keypoints into a picklable float32 array.
+    
+    LAYOUT (one row per keypoint):
+        x, y, size, angle, response, octave, class_id
+    
+    PARAMETERS:
+        kp: KeypointArrays or sequence of cv2.KeyPoint
+    
+    RETURNS:
+        (N, 7) float32 array
+    """
+    kp = as_keypoint_arrays(kp)
+    return np.column_stack([kp.pts, kp.size, kp.angle, kp.response,
+                            kp.octave, kp.class_id]).astype(np.float32)
+
+def array_to_keypoints(arr):
+    """
+    Rebuild cv2.KeyPoint objects from keypoints_to_array output.
+    
+    PARAMETERS:
+        arr: (N, 7) float32 array
     
     RETURNS:
-        kp: SIFT keypoints
-        des: SIFT descriptors (128-dimensional vectors)
+        Tuple of cv2.KeyPoint (same type as detectAndCompute returns)
     """
-    # SIFT with adjusted parameters for better feature detection
-    sift = cv2.SIFT_create(
-        nfeatures=5000,           # Increase max features to detect
-        nOctaveLayers=5,          # More octave layers for multi-scale detection
-        contrastThreshold=0.01,   # Lower threshold to detect more features
-        edgeThreshold=15,         # Edge threshold
-        sigma=1.6                 # Gaussian kernel sigma
+    return tuple(
+        cv2.KeyPoint(float(x), float(y), float(size), float(angle),
+                     float(response), int(octave), int(class_id))
+        for x, y, size, angle, response, octave, class_id in arr
     )
-    kp, des = sift.detectAndCompute(img, None)
-    return kp, des
 
-def match_features(des1, des2):
+# Per-process detector instance, created once by the pool initializer
+_worker_detector = None
+
+def _init_feature_worker(feature_config):
+    """Pool initializer: build one detector for the worker's lifetime."""
+    global _worker_detector
+    cv2.setNumThreads(1)  # parallelism comes from the pool, not OpenCV
+    _worker_detector = get_detector(feature_config)
+
+def _detect_features_worker(img):
+    """Detect features in a worker and return picklable arrays."""
+    kp, des = _worker_detector.detectAndCompute(img, None)
+    return keypoints_to_array(kp), des
+
+def detect_features_parallel(images, n_workers=FEATURE_WORKERS, feature_config=None):
     """
-    Match SIFT descriptors between two images.
+    Detect features for many images using a process pool.
     
     ALGORITHM:
-        1. Use FLANN-based KD-Tree matching (10x faster)
-        2. Apply Lowe's ratio test (threshold: 0.7)
-        3. Fallback to BFMatcher if FLANN fails
+        1. Start n_workers processes, each holding one detector instance
+        2. Map images to workers (results keep input order)
+        3. Workers return keypoints as float32 arrays (cv2.KeyPoint is not picklable)
+        4. Unpack the arrays into KeypointArrays in the parent process
     
     PARAMETERS:
-        des1: Descriptors from image 1
-        des2: Descriptors from image 2
+        images: List of images
+        n_workers: Number of worker processes (1 = serial detect_features)
+        feature_config: Engine config or name (None = FEATURE_ENGINE)
     
     RETURNS:
-        good: List of good matches (DMatch objects)
+        keypoints: List of KeypointArrays (identical to detect_features)
+        descriptors: List of descriptor arrays
     """
-    if des1 is None or des2 is None or len(des1) < 2 or len(des2) < 2:
-        return []
+    feature_config = resolve_feature_config(feature_config)
+    n_workers = max(1, min(n_workers, len(images)))
+    with METRICS.stage("detect_features", images=len(images), workers=n_workers):
+        if n_workers == 1:
+            results = [detect_features(img, feature_config) for img in images]
+            keypoints = [kp for kp, _ in results]
+        else:
+            with Pool(processes=n_workers, initializer=_init_feature_worker,
+                      initargs=(feature_config,)) as pool:
+                results = pool.map(_detect_features_worker, images, chunksize=1)
+            keypoints = [KeypointArrays.from_array(kp_arr) for kp_arr, _ in results]
+        descriptors = [des for _, des in results]
+        METRICS.annotate(keypoints=sum(len(kp) for kp in keypoints))
+    return keypoints, descriptors
+
+def feature_cache_key(image_bytes, resize_params=None, feature_config=None):
+    """
+    Build a content-addressed cache key for one image's features.
+    
+    KEY INPUTS:
+        - SHA-256 of the image bytes (file contents or raw pixels)
+        - Resize parameters (None when the image is used as-is)
+        - Feature engine name and parameters
+    
+    PARAMETERS:
+        image_bytes: Bytes identifying the image content
+        resize_params: Dict of adaptive_resize parameters or None
+        feature_config: Engine config or name (None = FEATURE_ENGINE)
+    
+    RETURNS:
+        Hex digest string
+    """
+    feature_config = resolve_feature_config(feature_config)
+    engine = [feature_config.name, asdict(feature_config)]
+    h = hashlib.sha256()
+    h.update(image_bytes)
+    h.update(json.dumps([resize_params, engine], sort_keys=True).encode())
+    return h.hexdigest()
+
+def _image_cache_bytes(img):
+    """Raw pixel bytes plus shape, for images that did not come from a file."""
+    return str(img.shape).encode() + np.ascontiguousarray(img).tobytes()
+
+def load_cached_features(key, cache_dir=FEATURE_CACHE_DIR):
+    """
+    Load keypoints and descriptors from the feature cache.
+    
+    PARAMETERS:
+        key: Cache key from feature_cache_key
+        cache_dir: Cache directory
     
-    # Use FLANN for better matching
-    FLANN_INDEX_KDTREE = 1
-    index_params = dict(algorithm=FLANN_INDEX_KDTREE, trees=5)
-    search_params = dict(checks=50)
+    RETURNS:
+        (kp, des) on a hit, None on a miss
     
+    SIDE EFFECTS:
+        Touches the entry's mtime so eviction is least-recently-used
+    """
+    path = os.path.join(cache_dir, key + ".npz")
     try:
-        flann = cv2.FlannBasedMatcher(index_params, search_params)
-        matches = flann.knnMatch(des1, des2, k=2)
-    except:
-        # Fallback to BFMatcher if FLANN fails
-        bf = cv2.BFMatcher()
-        matches = bf.knnMatch(des1, des2, k=2)
+        with np.load(path) as data:
+            kp_arr = data["kp"]
+            des = data["des"]
+            des_dtype = str(data["des_dtype"])
+        os.utime(path, None)
+    except (OSError, KeyError, ValueError):
+        return None
+    
+    if not des_dtype:
+        des = None
+    else:
+        des = des.astype(des_dtype, copy=False)
+    return KeypointArrays.from_array(kp_arr), des
+
+def save_cached_features(key, kp, des, cache_dir=FEATURE_CACHE_DIR,
+                         max_bytes=FEATURE_CACHE_MAX_BYTES):
+    """
+    Store keypoints and descriptors in the feature cache.
+    
+    FORMAT (uncompressed .npz):
+        kp: (N, 7) float32 keypoint rows (see keypoints_to_array)
+        des: descriptors, stored as uint8 when that is lossless (SIFT values are 0-255)
+        des_dtype: original descriptor dtype ("" when detection returned none)
+    
+    PARAMETERS:
+        key: Cache key from feature_cache_key
+        kp: Keypoints
+        des: Descriptors (or None)
+        cache_dir: Cache directory
+        max_bytes: Size cap; least-recently-used entries are evicted above it
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    if des is None:
+        des_store = np.zeros((0, 0), dtype=np.uint8)
+    else:
+        des_u8 = des.astype(np.uint8)
+        des_store = des_u8 if np.array_equal(des_u8, des) else des
+    
+    path = os.path.join(cache_dir, key + ".npz")
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        np.savez(f, kp=keypoints_to_array(kp), des=des_store,
+                 des_dtype="" if des is None else des.dtype.str)
+    os.replace(tmp_path, path)
+    evict_feature_cache(cache_dir, max_bytes)
+
+def evict_feature_cache(cache_dir=FEATURE_CACHE_DIR, max_bytes=FEATURE_CACHE_MAX_BYTES):
+    """
+    Delete least-recently-used cache entries until the cache fits in max_bytes.
+    
+    RETURNS:
+        Number of entries removed
+    """
+    entries = []
+    total = 0
+    for name in os.listdir(cache_dir):
+        if not name.endswith(".npz"):
+            continue
+        try:
+            st = os.stat(os.path.join(cache_dir, name))
+        except OSError:
+            continue
+        entries.append((st.st_mtime, st.st_size, name))
+        total += st.st_size
+    
+    removed = 0
+    for _, size, name in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(os.path.join(cache_dir, name))
+        except OSError:
+            continue
+        total -= size
+        removed += 1
+    return removed
+
+def extract_features(images, sources=None, resize_params=None, n_workers=FEATURE_WORKERS,
+                     use_cache=USE_FEATURE_CACHE, cache_dir=FEATURE_CACHE_DIR, feature_config=None):
+    """
+    Detect features for a list of images, reusing the persistent cache.
+    
+    ALGORITHM:
+        1. Key each image by its source bytes, resize and engine parameters
+        2. Load hits from the cache
+        3. Detect misses in parallel (detect_features_parallel)
+        4. Store new results in the cache
+    
+    PARAMETERS:
+        images: List of images (as passed to stitching)
+        sources: Optional list of bytes identifying each image (e.g. file contents);
+                 defaults to the raw pixel bytes
+        resize_params: Resize parameters applied to the sources (None if not resized)
+        n_workers: Worker processes for cache misses
+        use_cache: Enable the cache (True)
+        cache_dir: Cache directory
+        feature_config: Engine config or name (None = FEATURE_ENGINE)
+    
+    RETURNS:
+        keypoints: List of KeypointArrays
+        descriptors: List of descriptor arrays
+    """
+    feature_config = resolve_feature_config(feature_config)
+    if not use_cache:
+        return detect_features_parallel(images, n_workers=n_workers, feature_config=feature_config)
+    
+    if sources is None:
+        sources = [_image_cache_bytes(img) for img in images]
+    keys = [feature_cache_key(src, resize_params, feature_config) for src in sources]
+    
+    keypoints = [None] * len(images)
+    descriptors = [None] * len(images)
+    missing = []
+    for i, key in enumerate(keys):
+        cached = load_cached_features(key, cache_dir)
+        if cached is None:
+            missing.append(i)
+        else:
+            keypoints[i], descriptors[i] = cached
+    
+    _log(f"  Feature cache: {len(images) - len(missing)} hit(s), {len(missing)} miss(es)")
+    METRICS.count("feature_cache_hits", len(images) - len(missing))
+    METRICS.count("feature_cache_misses", len(missing))
+    if missing:
+        kps, dess = detect_features_parallel([images[i] for i in missing], n_workers=n_workers,
+                                             feature_config=feature_config)
+        for i, kp, des in zip(missing, kps, dess):
+            keypoints[i], descriptors[i] = kp, des
+            save_cached_features(keys[i], kp, des, cache_dir)
+    
+    return keypoints, descriptors
+
+# Matcher counters for the current run (see reset_matcher_stats)
+MATCHER_STATS = {"indices_built": 0, "queries": 0, "bf_fallbacks": 0}
+
+def reset_matcher_stats():
+    """Zero the MATCHER_STATS counters."""
+    for key in MATCHER_STATS:
+        MATCHER_STATS[key] = 0
+
+def _count_bf_fallback(reason):
+    """Record (and report) a brute-force fallback."""
+    MATCHER_STATS["bf_fallbacks"] += 1
+    _log(f"  ⚠️  FLANN failed ({reason}), using brute-force matching "
+          f"[{MATCHER_STATS['bf_fallbacks']} fallback(s) this run]")
+
+class DescriptorIndex:
+    """
+    Search index built once on one image's descriptors and queried many times.
+    
+    The FLANN index (KD-tree or LSH, per feature engine) is built in the
+    constructor, so every later query against this image reuses it. Queries
+    return plain (N, k) index/distance arrays. If the index cannot be built
+    or queried, brute force (cv2.batchDistance) is used instead and the
+    fallback is counted in MATCHER_STATS.
+    """
+    
+    def __init__(self, descriptors, feature_config=None):
+        self.descriptors = descriptors
+        self.feature_config = resolve_feature_config(feature_config)
+        self.index = None
+        if self.feature_config.matcher == "bf":
+            return
+        try:
+            self.index = cv2.flann_Index(descriptors, self.feature_config.flann_params())
+            MATCHER_STATS["indices_built"] += 1
+        except cv2.error:
+            _count_bf_fallback("index build")
+    
+    def knn_match(self, query, k=2):
+        """
+        k nearest neighbours in this image for each query descriptor.
+        
+        RETURNS:
+            idx: (N, k) int32 train indices (-1 where no neighbour was found)
+            dist: (N, k) float32 distances (L2 or Hamming, per engine)
+        """
+        MATCHER_STATS["queries"] += 1
+        if self.index is not None:
+            try:
+                idx, dist = self.index.knnSearch(query, k, params=self.feature_config.search_params())
+                dist = dist.astype(np.float32)
+                if self.feature_config.norm == cv2.NORM_L2:
+                    dist = np.sqrt(dist)  # KD-tree reports squared L2
+                return idx, dist
+            except cv2.error:
+                _count_bf_fallback("query")
+        norm = self.feature_config.norm
+        dtype = cv2.CV_32S if norm == cv2.NORM_HAMMING else cv2.CV_32F
+        dist, idx = cv2.batchDistance(query, self.descriptors, dtype, normType=norm, K=k)
+        return idx, dist.astype(np.float32)
+
+class DescriptorIndexCache:
+    """
+    Per-run store of DescriptorIndex objects, keyed by image id.
+    
+    Build one per stitching run; an image's index is created on first use
+    and reused for every later pair that matches against it.
+    """
+    
+    def __init__(self, feature_config=None):
+        self.feature_config = resolve_feature_config(feature_config)
+        self._indices = {}
+    
+    def get(self, key, descriptors):
+        index = self._indices.get(key)
+        if index is None:
+            index = DescriptorIndex(descriptors, self.feature_config)
+            self._indices[key] = index
+        return index
     
-    good = []
-    for match_pair in matches:
-        if len(match_pair) == 2:
-            m, n = match_pair
-            # Lowe's ratio test with adjusted threshold
-            if m.distance < 0.7 * n.distance:
-                good.append(m)
+    def clear(self):
+        self._indices.clear()
+
+def match_features(des1, des2, feature_config=None, index=None):
+    """
+    Match descriptors between two images.
+    
+    ALGORITHM:
+        1. Use the engine's index: FLANN KD-Tree for SIFT (10x faster),
+           FLANN LSH or Hamming brute force for binary descriptors
+        2. Reuse a prebuilt index of des2 when given (DescriptorIndex)
+        3. Apply Lowe's ratio test (threshold: 0.7 for SIFT), vectorized
+        4. Fallback to brute force if FLANN fails (counted in MATCHER_STATS)
+    
+    PARAMETERS:
+        des1: Descriptors from image 1 (queries)
+        des2: Descriptors from image 2 (indexed)
+        feature_config: Engine config or name (None = FEATURE_ENGINE)
+        index: Optional DescriptorIndex built on des2
+    
+    RETURNS:
+        good: (M, 2) int32 array of (query index, train index) pairs
+    """
+    if des1 is None or des2 is None or len(des1) < 2 or len(des2) < 2:
+        return np.zeros((0, 2), dtype=np.int32)
     
-    return good
+    if index is None:
+        index = DescriptorIndex(des2, feature_config)
+    idx, dist = index.knn_match(des1, k=2)
+    
+    # Lowe's ratio test with adjusted threshold
+    good = (idx[:, 0] >= 0) & (idx[:, 1] >= 0) & \
+           (dist[:, 0] < index.feature_config.ratio * dist[:, 1])
+    query_idx = np.flatnonzero(good).astype(np.int32)
+    return np.column_stack([query_idx, idx[good, 0]]).astype(np.int32)
 
-def compute_homography_ransac(kp1, kp2, matches, prefer_translation=True):
+def compute_homography_ransac(kp1, kp2, matches, prefer_translation=True, seed=None):
     """
     Compute homography using RANSAC with intelligent method selection.
     
@@ -233,10 +1111,11 @@ def compute_homography_ransac(kp1, kp2, matches, prefer_translation=True):
         4. Prevents unnecessary perspective distortion
     
     PARAMETERS:
-        kp1: Keypoints from image 1
-        kp2: Keypoints from image 2
-        matches: Feature matches
+        kp1: Keypoints from image 1 (KeypointArrays or cv2.KeyPoint list)
+        kp2: Keypoints from image 2 (KeypointArrays or cv2.KeyPoint list)
+        matches: (M, 2) int32 match index pairs (or DMatch list)
         prefer_translation: Switch to translation if detected (True)
+        seed: Seed for the translation estimate (None = RANSAC_SEED)
     
     RETURNS:
         H: 3x3 homography matrix or translation matrix
@@ -244,14 +1123,16 @@ def compute_homography_ransac(kp1, kp2, matches, prefer_translation=True):
     if len(matches) < 4:
         return None
     
-    src_pts = np.float32([kp1[m.queryIdx].pt for m in matches]).reshape(-1, 1, 2)
-    dst_pts = np.float32([kp2[m.trainIdx].pt for m in matches]).reshape(-1, 1, 2)
+    src_pts, dst_pts = match_points(kp1, kp2, matches)
+    src_pts = src_pts.reshape(-1, 1, 2)
+    dst_pts = dst_pts.reshape(-1, 1, 2)
     
     # RANSAC with strict threshold to avoid tilting
     H, mask = cv2.findHomography(src_pts, dst_pts, cv2.RANSAC, ransacReprojThreshold=3.0)
     
     if mask is not None:
         inliers = np.where(mask.ravel() == 1)[0]
+        METRICS.annotate(homography_inliers=len(inliers))
         if len(inliers) < 4:
             return None
         
@@ -261,13 +1142,33 @@ def compute_homography_ransac(kp1, kp2, matches, prefer_translation=True):
             if abs(H[0, 0] - 1.0) < 0.05 and abs(H[1, 1] - 1.0) < 0.05 and \
                abs(H[0, 1]) < 0.05 and abs(H[1, 0]) < 0.05:
                 # Homography is close to identity + translation, use translation instead
-                T = compute_translation_transform(kp1, kp2, matches)
+                T = compute_translation_transform(kp1, kp2, matches, seed=seed)
                 if T is not None:
                     return T
     
     return H
 
-def compute_translation_transform(kp1, kp2, matches):
+def _ransac_iterations(inlier_ratio, confidence, sample_size=1):
+    """Iterations needed to draw one all-inlier sample with the given confidence."""
+    if inlier_ratio <= 0:
+        return np.inf
+    p_good = inlier_ratio ** sample_size
+    if p_good >= 1:
+        return 1
+    return int(np.ceil(np.log(1 - confidence) / np.log(1 - p_good)))
+
+def _seed_opencv(seed=None):
+    """
+    Reset OpenCV's random generator (FLANN randomized KD-trees draw from it)
+    so a seeded run builds the same indices and finds the same matches.
+    No-op when neither seed nor RANSAC_SEED is set.
+    """
+    seed = RANSAC_SEED if seed is None else seed
+    if seed is not None:
+        cv2.setRNGSeed(int(seed))
+
+def compute_translation_transform(kp1, kp2, matches, threshold=2.0, max_iters=100,
+                                  confidence=0.99, seed=None, return_inliers=False):
     """
     Compute translation-only transformation using RANSAC.
     
@@ -277,50 +1178,66 @@ def compute_translation_transform(kp1, kp2, matches):
         - Simpler model with fewer degrees of freedom
     
     ALGORITHM:
-        1. RANSAC with 100 iterations
-        2. For each iteration, estimate translation from random point
-        3. Count inliers within 2.0 pixel threshold
+        1. Draw hypotheses (one match each) in batches
+        2. Score a whole batch in one array operation (inliers within 2.0 pixels)
+        3. Shrink the iteration count adaptively from the best inlier ratio
         4. Use median if RANSAC finds too few inliers (<30%)
-        5. Create 3x3 translation matrix
+        5. Otherwise refine: mean displacement over the inlier set
+        6. Create 3x3 translation matrix
     
     PARAMETERS:
-        kp1: Keypoints from image 1
-        kp2: Keypoints from image 2
-        matches: Feature matches
+        kp1: Keypoints from image 1 (KeypointArrays or cv2.KeyPoint list)
+        kp2: Keypoints from image 2 (KeypointArrays or cv2.KeyPoint list)
+        matches: (M, 2) int32 match index pairs (or DMatch list)
+        threshold: Inlier distance in pixels (2.0)
+        max_iters: Maximum number of hypotheses (100)
+        confidence: Probability of drawing at least one all-inlier sample (0.99)
+        seed: Random seed (None = RANSAC_SEED, read at call time)
+        return_inliers: Also return the inlier count of the best hypothesis (False)
     
     RETURNS:
         T: 3x3 translation matrix
+        n_inliers: Matches within threshold of the best hypothesis
+                   (only if return_inliers)
     """
     if len(matches) < 1:
-        return None
+        return (None, 0) if return_inliers else None
     
-    src_pts = np.float32([kp1[m.queryIdx].pt for m in matches])
-    dst_pts = np.float32([kp2[m.trainIdx].pt for m in matches])
+    src_pts, dst_pts = match_points(kp1, kp2, matches)
+    displacements = dst_pts - src_pts
+    n = len(displacements)
     
-    # Use RANSAC for robust estimation of translation
-    best_dx, best_dy = 0, 0
+    # Batched RANSAC: each hypothesis is one match's displacement
+    rng = np.random.default_rng(RANSAC_SEED if seed is None else seed)
+    threshold_sq = threshold * threshold
     best_inliers = 0
-    threshold = 2.0  # pixel threshold for inliers
-    
-    for _ in range(100):  # RANSAC iterations
-        idx = np.random.randint(0, len(matches))
-        dx = dst_pts[idx, 0] - src_pts[idx, 0]
-        dy = dst_pts[idx, 1] - src_pts[idx, 1]
+    best_d = displacements[0]
+    needed = max_iters
+    done = 0
+    while done < needed:
+        batch = min(RANSAC_BATCH_SIZE, needed - done)
+        hypotheses = displacements[rng.integers(0, n, batch)]
         
-        # Count inliers
-        errors = np.sqrt((dst_pts[:, 0] - src_pts[:, 0] - dx)**2 + 
-                        (dst_pts[:, 1] - src_pts[:, 1] - dy)**2)
-        inliers = np.sum(errors < threshold)
+        # (batch, n) squared errors, one row per hypothesis
+        diff = displacements[None, :, :] - hypotheses[:, None, :]
+        counts = np.count_nonzero(np.einsum("bnk,bnk->bn", diff, diff) < threshold_sq, axis=1)
         
-        if inliers > best_inliers:
-            best_inliers = inliers
-            best_dx = dx
-            best_dy = dy
-    
-    # Use median if RANSAC finds too few inliers
-    if best_inliers < len(matches) * 0.3:
-        best_dx = np.median(dst_pts[:, 0] - src_pts[:, 0])
-        best_dy = np.median(dst_pts[:, 1] - src_pts[:, 1])
+        j = int(np.argmax(counts))
+        if counts[j] > best_inliers:
+            best_inliers = int(counts[j])
+            best_d = hypotheses[j]
+        done += batch
+        needed = min(max_iters, _ransac_iterations(best_inliers / n, confidence))
+    METRICS.annotate(translation_inliers=best_inliers, translation_hypotheses=done)
+    
+    if best_inliers < n * 0.3:
+        # Use median if RANSAC finds too few inliers
+        best_dx = np.median(displacements[:, 0])
+        best_dy = np.median(displacements[:, 1])
+    else:
+        # Least-squares translation over the inlier set
+        err = np.sum((displacements - best_d) ** 2, axis=1)
+        best_dx, best_dy = displacements[err < threshold_sq].mean(axis=0)
     
     # Create translation matrix
     T = np.array([
@@ -329,26 +1246,27 @@ def compute_translation_transform(kp1, kp2, matches):
         [0, 0, 1]
     ], dtype=np.float32)
     
+    if return_inliers:
+        return T, best_inliers
     return T
 
 def stitch_with_pyramid_blending(img1, img2, overlap_width, levels=3):
     """
-    Stitch two images using pyramid blending with advanced features.
+    Stitch two images using multi-band (Laplacian pyramid) blending.
     
     FEATURES:
-        - Quadratic blending masks (smooth transitions)
-        - Content confidence mapping (favor high-variance regions)
-        - Dark region filtering (removes reflections)
-        - Median filtering (removes artifacts)
+        - Multi-band blending: low frequencies blend over a wide zone,
+          fine detail switches sharply at the seam (no ghosting)
+        - Seam follows the minimum-difference path through the overlap
+          (find_seam), so moving or misaligned content is not cut in two
+        - Only the overlap strip (plus a small margin) is processed
+        - Band buffers reused across calls
     
     ALGORITHM:
-        1. Pad images to same height
-        2. Create overlap region
-        3. Generate quadratic blend mask (x²)
-        4. Compute content confidence (avoid dark/reflection regions)
-        5. Apply adaptive blending
-        6. Apply median filter to reduce artifacts
-        7. Return stitched image
+        1. Allocate canvas of width w1 + w2 - overlap (max height)
+        2. Place first image
+        3. Blend second image in place (blend_into_canvas)
+        4. Return stitched image
     
     PARAMETERS:
         img1: Left image
@@ -361,141 +1279,344 @@ def stitch_with_pyramid_blending(img1, img2, overlap_width, levels=3):
     """
     h1, w1 = img1.shape[:2]
     h2, w2 = img2.shape[:2]
-    
-    # Ensure same height
     max_h = max(h1, h2)
-    if h1 < max_h:
-        img1 = cv2.copyMakeBorder(img1, 0, max_h - h1, 0, 0, cv2.BORDER_CONSTANT, value=0)
-    if h2 < max_h:
-        img2 = cv2.copyMakeBorder(img2, 0, max_h - h2, 0, 0, cv2.BORDER_CONSTANT, value=0)
     
     # Create canvas
-    new_width = w1 + w2 - overlap_width
-    result = np.zeros((max_h, new_width, 3), dtype=np.float32)
+    result = np.zeros((max_h, w1 + w2 - overlap_width, 3), dtype=img1.dtype)
+    result[:h1, :w1] = img1
     
-    # Place first image
-    result[:, :w1] = img1.astype(np.float32)
+    blend_into_canvas(result, img2, w1, overlap_width, filled_h=h1, levels=levels)
+    return result
+
+# Reusable pyramid buffers for blend_into_canvas, keyed by rounded-up
+# capacity/levels/dtype, in least-recently-used order
+_BLEND_SCRATCH = {}
+
+def _pyramid_shapes(h, w, levels):
+    """(h, w) of each pyramid level, halving with rounding up."""
+    shapes = [(h, w)]
+    for _ in range(levels):
+        ph, pw = shapes[-1]
+        shapes.append(((ph + 1) // 2, (pw + 1) // 2))
+    return shapes
+
+def _pyramid_buffers(h, w, levels, dtype):
+    """
+    Band buffers for multi-band blending of an h×w strip.
     
-    # Advanced blending in overlap region with content filtering
-    if overlap_width > 0:
-        overlap_start = w1 - overlap_width
-        overlap_end = w1
-        
-        # Extract overlap regions
-        left_overlap = img1[:, overlap_start:overlap_end].astype(np.float32)
-        right_overlap = img2[:, :overlap_width].astype(np.float32)
-        
-        # Create smooth blending mask
-        x = np.linspace(0, 1, overlap_width)
-        blend_mask = np.power(x, 2)  # Quadratic blend
-        blend_mask = blend_mask.reshape(1, -1, 1)
-        
-        # Compute confidence map - favor regions with higher variance (content-rich)
-        left_gray = cv2.cvtColor(left_overlap.astype(np.uint8), cv2.COLOR_BGR2GRAY).astype(np.float32)
-        right_gray = cv2.cvtColor(right_overlap.astype(np.uint8), cv2.COLOR_BGR2GRAY).astype(np.float32)
-        
-        # Smooth variance estimation
-        left_gray = cv2.GaussianBlur(left_gray, (5, 5), 0)
-        right_gray = cv2.GaussianBlur(right_gray, (5, 5), 0)
-        
-        # Create content confidence mask (avoid reflections and artifacts)
-        left_conf = np.where(left_gray > 10, left_gray / 256.0, 0)  # Filter out very dark regions
-        right_conf = np.where(right_gray > 10, right_gray / 256.0, 0)
-        
-        content_conf = (left_conf + right_conf) / (left_conf + right_conf + 1e-6)
-        content_conf = np.tile(content_conf.reshape(max_h, overlap_width, 1), (1, 1, 3))
-        content_conf = content_conf / (content_conf.max() + 1e-6)
-        
-        # Apply adaptive blending
-        blended = left_overlap * (1 - blend_mask) + right_overlap * blend_mask
-        
-        # Confidence-weighted blending to reduce artifacts
-        result[:, overlap_start:overlap_end] = blended * content_conf + \
-                                               left_overlap * (1 - content_conf) * 0.7
+    Buffers are allocated for h and w rounded up to BLEND_SCRATCH_ALIGN and
+    handed out as [:h, :w] views, so consecutive strips whose widths differ
+    by a few pixels reuse the same memory. Level sizes only grow with the
+    base size, so every level's view fits its buffer.
     
-    # Place the non-overlapping part of second image
-    result[:, w1 - overlap_width + overlap_width:] = img2[:, overlap_width:].astype(np.float32)
+    RETURNS:
+        shapes: (h, w) of each level
+        bufs: dict of per-level arrays: "a", "b" (3-channel bands),
+              "up" (3-channel upsampling scratch), "mask" (1-channel weights)
+    """
+    align = BLEND_SCRATCH_ALIGN
+    cap_h, cap_w = -(-h // align) * align, -(-w // align) * align
+    key = (cap_h, cap_w, levels, np.dtype(dtype).str)
+    cached = _BLEND_SCRATCH.pop(key, None)
+    if cached is None:
+        cap_shapes = _pyramid_shapes(cap_h, cap_w, levels)
+        cached = {
+            "a": [np.empty((sh, sw, 3), dtype=dtype) for sh, sw in cap_shapes],
+            "b": [np.empty((sh, sw, 3), dtype=dtype) for sh, sw in cap_shapes],
+            "up": [np.empty((sh, sw, 3), dtype=dtype) for sh, sw in cap_shapes[:-1]],
+            "mask": [np.empty((sh, sw), dtype=dtype) for sh, sw in cap_shapes],
+        }
+        METRICS.alloc("blend_scratch", sum(b.nbytes for bands in cached.values() for b in bands))
+        while len(_BLEND_SCRATCH) >= BLEND_SCRATCH_SIZE:
+            del _BLEND_SCRATCH[next(iter(_BLEND_SCRATCH))]
+    _BLEND_SCRATCH[key] = cached    # (re)insert as most recently used
+    
+    shapes = _pyramid_shapes(h, w, levels)
+    bufs = {name: [buf[:sh, :sw] for buf, (sh, sw) in zip(bands, shapes)]
+            for name, bands in cached.items()}
+    return shapes, bufs
+
+def multiband_blend(shapes, bufs):
+    """
+    Laplacian pyramid blend of bufs["a"][0] and bufs["b"][0] under bufs["mask"][0].
+    
+    ALGORITHM:
+        1. Gaussian pyramids of both images and of the mask (weight of "b")
+        2. Laplacian bands: G_l - pyrUp(G_l+1)
+        3. Blend each band with the mask at the same level
+        4. Collapse the blended pyramid
+    
+    All work happens in the preallocated buffers; the result is left in
+    bufs["a"][0].
+    """
+    a, b, up, mask = bufs["a"], bufs["b"], bufs["up"], bufs["mask"]
+    levels = len(shapes) - 1
+    
+    # Gaussian pyramids
+    for l in range(levels):
+        size = (shapes[l + 1][1], shapes[l + 1][0])
+        cv2.pyrDown(a[l], dst=a[l + 1], dstsize=size)
+        cv2.pyrDown(b[l], dst=b[l + 1], dstsize=size)
+        cv2.pyrDown(mask[l], dst=mask[l + 1], dstsize=size)
+    
+    # Laplacian bands (level l uses the still-Gaussian level l+1)
+    for l in range(levels):
+        size = (shapes[l][1], shapes[l][0])
+        cv2.pyrUp(a[l + 1], dst=up[l], dstsize=size)
+        np.subtract(a[l], up[l], out=a[l])
+        cv2.pyrUp(b[l + 1], dst=up[l], dstsize=size)
+        np.subtract(b[l], up[l], out=b[l])
+    
+    # Blend bands: a + (b - a) * mask
+    for l in range(levels + 1):
+        np.subtract(b[l], a[l], out=b[l])
+        np.multiply(b[l], mask[l][:, :, None], out=b[l])
+        np.add(a[l], b[l], out=a[l])
+    
+    # Collapse
+    for l in range(levels - 1, -1, -1):
+        cv2.pyrUp(a[l + 1], dst=up[l], dstsize=(shapes[l][1], shapes[l][0]))
+        np.add(a[l], up[l], out=a[l])
+
+def find_seam(a, b, x0, x1, scale=SEAM_SCALE):
+    """
+    Minimum-error top-to-bottom seam between two aligned strips.
     
-    # Remove reflections: apply median filter to overlap region
-    if overlap_width > 0:
-        overlap_region = result[:, overlap_start:overlap_end].astype(np.uint8)
-        # Median filter reduces salt-and-pepper reflections
-        overlap_region = cv2.medianBlur(overlap_region, 3)
-        result[:, overlap_start:overlap_end] = overlap_region.astype(np.float32)
+    ALGORITHM:
+        1. Per-pixel error |a - b|, downscaled by scale (INTER_AREA) and
+           summed over channels, so the search costs O(h × overlap × scale²)
+        2. Dynamic programming over rows, restricted to columns x0:x1:
+           E(r, x) = e(r, x) + min(E(r-1, x-1), E(r-1, x), E(r-1, x+1))
+        3. Backtrack from the cheapest bottom-row column
+        4. Upsample the path to full resolution (linear in rows)
     
-    # Clip values to valid range
-    result = np.clip(result, 0, 255).astype(img1.dtype)
+    PARAMETERS:
+        a, b: Strips of equal shape (left and right image content)
+        x0, x1: Column range the seam must stay in (the overlap)
+        scale: Search resolution (SEAM_SCALE)
     
-    return result
+    RETURNS:
+        seam: (h,) int array; row r takes columns < seam[r] from a and
+              the rest from b
+    """
+    h, w = a.shape[:2]
+    sh, sw = max(1, int(round(h * scale))), max(1, int(round(w * scale)))
+    err = cv2.resize(cv2.absdiff(a, b), (sw, sh), interpolation=cv2.INTER_AREA)
+    if err.ndim == 3:
+        err = err.sum(axis=2)
+    lo = min(sw - 1, int(x0 * sw / w))
+    hi = max(lo + 1, min(sw, int(np.ceil(x1 * sw / w))))
+    err = err[:, lo:hi].astype(np.float64)
+    
+    n = err.shape[1]
+    cols = np.arange(n)
+    total = err[0].copy()
+    step = np.zeros((sh, n), dtype=np.int8)
+    choices = np.full((3, n), np.inf)
+    for r in range(1, sh):
+        # Straight down first, so ties keep the seam straight
+        choices[0] = total
+        choices[1, 1:] = total[:-1]
+        choices[2, :-1] = total[1:]
+        k = np.argmin(choices, axis=0)
+        total = err[r] + choices[k, cols]
+        step[r] = np.array([0, -1, 1], dtype=np.int8)[k]
+    
+    path = np.empty(sh, dtype=np.intp)
+    path[-1] = int(np.argmin(total))
+    for r in range(sh - 1, 0, -1):
+        path[r - 1] = path[r] + step[r, path[r]]
+    
+    xs = (path + lo + 0.5) * (w / sw)
+    seam = np.interp(np.arange(h) + 0.5, (np.arange(sh) + 0.5) * (h / sh), xs)
+    return np.clip(np.rint(seam).astype(np.intp), x0, x1)
+
+def blend_into_canvas(canvas, img, x_end, overlap_width, filled_h=None, levels=3,
+                      margin=BLEND_MARGIN, dtype=BLEND_DTYPE, seam=SEAM_CUT):
+    """
+    Blend an image into a preallocated panorama canvas, in place.
+    
+    The panorama so far occupies canvas[:filled_h, :x_end]. The new image is
+    placed at column x_end - overlap_width. Multi-band blending runs only on
+    the overlap strip plus `margin` columns of context on each side; the
+    rest of the image is a plain copy.
+    
+    ALGORITHM:
+        1. Build the left ("a") and right ("b") strips; outside the overlap
+           both hold the same pixels, so the margins come back unchanged
+        2. Seam mask: 0 left of the seam, 1 right of it. The seam is the
+           minimum-difference path through the overlap (find_seam, on a
+           downscaled strip), so it avoids parallax and moving content,
+           or the overlap centre line when seam is False
+        3. Multi-band blend (multiband_blend) in reusable buffers: fine
+           detail switches within a few pixels of the seam
+        4. Write the strip back and copy the non-overlapping part of the image
+    
+    PARAMETERS:
+        canvas: Panorama canvas (uint8, modified in place)
+        img: Image to add on the right
+        x_end: Current panorama width (first free column)
+        overlap_width: Width of overlap region (pixels)
+        filled_h: Current panorama height (default: canvas height)
+        levels: Pyramid levels (3); reduced for narrow strips
+        margin: Context columns on each side of the overlap (BLEND_MARGIN)
+        dtype: Band buffer precision, np.float32 or np.float64 (BLEND_DTYPE)
+        seam: Cut along the minimum-error seam (SEAM_CUT)
+    
+    RETURNS:
+        New panorama width (x_end + image width - overlap_width)
+    """
+    h2, w2 = img.shape[:2]
+    if filled_h is None:
+        filled_h = canvas.shape[0]
+    max_h = max(filled_h, h2)
+    overlap_width = max(0, min(overlap_width, x_end, w2))
+    overlap_start = x_end - overlap_width
+    new_end = x_end + w2 - overlap_width
+    
+    if overlap_width == 0:
+        canvas[:h2, x_end:new_end] = img
+        return new_end
+    
+    # Strip = overlap plus context margins
+    m_left = min(margin, overlap_start)
+    m_right = min(margin, w2 - overlap_width)
+    strip_x0 = overlap_start - m_left
+    strip_x1 = x_end + m_right
+    strip_w = strip_x1 - strip_x0
+    seam_end = x_end - strip_x0    # end of the overlap in strip coordinates
+    img_cols = overlap_width + m_right
+    
+    levels = max(0, min(levels, int(np.log2(max(1, min(max_h, strip_w) // 4)))))
+    shapes, bufs = _pyramid_buffers(max_h, strip_w, levels, dtype)
+    a0, b0, m0 = bufs["a"][0], bufs["b"][0], bufs["mask"][0]
+    
+    # Left strip: panorama so far, right margin from the new image,
+    # rows the panorama does not cover yet taken from the new image
+    a0[:] = canvas[:max_h, strip_x0:strip_x1]
+    a0[:h2, seam_end:] = img[:, overlap_width:img_cols]
+    if filled_h < h2:
+        a0[filled_h:h2, m_left:seam_end] = img[filled_h:h2, :overlap_width]
+    
+    # Right strip: same context, new image over the overlap
+    b0[:] = a0
+    b0[:h2, m_left:] = img[:, :img_cols]
+    
+    if seam:
+        with METRICS.stage("seam"):
+            cut = find_seam(a0, b0, m_left, seam_end)
+        np.greater_equal(np.arange(strip_w)[None, :], cut[:, None], out=m0, casting="unsafe")
+    else:
+        # Seam at the centre of the overlap
+        m0[:] = 0
+        m0[:, m_left + overlap_width // 2:] = 1
+    
+    multiband_blend(shapes, bufs)
+    
+    canvas[:max_h, strip_x0:strip_x1] = np.clip(np.rint(a0), 0, 255)
+    
+    # Place the non-overlapping part of the image
+    canvas[:h2, strip_x1:new_end] = img[:, img_cols:]
+    
+    return new_end
 
-def match_exposure_pair(img1, img2, transform, sample_ratio=0.01, n_iters=100):
+def match_exposure_pair(img1, img2, transform, sample_ratio=0.01, n_iters=100, seed=None):
     """
     Match exposure between two images using gamma correction.
     
     ALGORITHM:
-        1. Convert images to LAB color space (perceptually uniform)
-        2. Sample corresponding points across overlap
-        3. Fit gamma correction curve using L (lightness) channel
-        4. Iteratively optimize gamma value
+        1. Find the overlap region in both images from the transform
+        2. Convert only the overlap regions to LAB (perceptually uniform)
+        3. Sample points in the overlap and map them all at once (one matmul)
+        4. Fit gamma on the L (lightness) channel: closed-form log-domain
+           least squares, refined with bounded Newton steps
         5. Clamp gamma to [0.5, 2.0] range
     
     PARAMETERS:
         img1: First image
         img2: Second image
-        transform: Transformation matrix relating images
-        sample_ratio: Fraction of pixels to sample (0.01 = 1%)
-        n_iters: Optimization iterations (100)
+        transform: 3x3 matrix mapping img1 pixel coordinates to img2
+                   (as estimated from matches between img1 and img2)
+        sample_ratio: Fraction of overlap pixels to sample (0.01 = 1%)
+        n_iters: Maximum Newton iterations (100)
+        seed: Random seed for sampling (None = RANSAC_SEED, read at call time)
     
     RETURNS:
-        gamma: Gamma correction value (1.0 = no correction)
+        gamma: Gamma correction value for img2 (1.0 = no correction)
     """
+    h1, w1 = img1.shape[:2]
+    h2, w2 = img2.shape[:2]
+    transform = np.asarray(transform, dtype=np.float64)
     try:
-        # Convert to LAB color space
-        lab1 = cv2.cvtColor(img1, cv2.COLOR_BGR2LAB).astype(np.float32)
-        lab2 = cv2.cvtColor(img2, cv2.COLOR_BGR2LAB).astype(np.float32)
-        
-        h, w = img1.shape[:2]
-        n_samples = max(10, int(h * w * sample_ratio))
-        
-        # Sample corresponding points
-        samples = []
-        for _ in range(n_samples):
-            y, x = np.random.randint(0, h), np.random.randint(0, w)
-            
-            # Transform point from img2 to img1
-            p = np.array([x, y, 1])
-            p_transformed = transform @ p
-            p_transformed = p_transformed / p_transformed[2]
-            
-            x_t, y_t = int(p_transformed[0]), int(p_transformed[1])
-            
-            if 0 <= x_t < w and 0 <= y_t < h:
-                # Sample L (lightness) channel
-                l1 = lab1[y_t, x_t, 0] / 100.0
-                l2 = lab2[y, x, 0] / 100.0
-                
-                if l1 > 5 and l2 > 5:  # Avoid dark regions
-                    samples.append((l1, l2))
-        
-        if len(samples) < 5:
-            return 1.0
-        
-        samples = np.array(samples)
-        
-        # Fit gamma correction curve
-        gamma = 1.0
-        for _ in range(n_iters):
-            gamma_prev = gamma
-            residuals = samples[:, 1] ** gamma - samples[:, 0]
-            gradient = np.sum(residuals * np.log(samples[:, 1]) * (samples[:, 1] ** gamma))
-            gamma = gamma - 0.01 * gradient / len(samples)
-            
-            if abs(gamma - gamma_prev) < 0.001:
-                break
-        
-        return max(0.5, min(2.0, gamma))
-    except:
+        inv_transform = np.linalg.inv(transform)
+    except np.linalg.LinAlgError:
+        return 1.0
+    
+    # Overlap region in each image
+    roi1 = warped_bbox(inv_transform, w2, h2, w1, h1)
+    roi2 = warped_bbox(transform, w1, h1, w2, h2)
+    if roi1 is None or roi2 is None:
+        return 1.0
+    x0, y0, x1, y1 = roi1
+    u0, v0, u1, v1 = roi2
+    
+    # Lightness of the overlap regions only, normalized to [0, 1]
+    l1 = cv2.cvtColor(img1[y0:y1, x0:x1], cv2.COLOR_BGR2LAB)[:, :, 0]
+    l2 = cv2.cvtColor(img2[v0:v1, u0:u1], cv2.COLOR_BGR2LAB)[:, :, 0]
+    
+    # Sample points in img1's overlap and transform them in one batch
+    rng = np.random.default_rng(RANSAC_SEED if seed is None else seed)
+    n_samples = max(10, int((x1 - x0) * (y1 - y0) * sample_ratio))
+    xs = rng.integers(x0, x1, n_samples)
+    ys = rng.integers(y0, y1, n_samples)
+    p = transform @ np.vstack([xs, ys, np.ones(n_samples)])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        xt = np.floor(p[0] / p[2])
+        yt = np.floor(p[1] / p[2])
+    inside = (xt >= u0) & (xt < u1) & (yt >= v0) & (yt < v1)
+    if np.count_nonzero(inside) < 5:
+        return 1.0
+    
+    s1 = l1[ys[inside] - y0, xs[inside] - x0].astype(np.float64) / 255.0
+    s2 = l2[yt[inside].astype(np.intp) - v0, xt[inside].astype(np.intp) - u0].astype(np.float64) / 255.0
+    
+    # Avoid dark regions and saturated pixels (log(1) carries no information)
+    keep = (s1 > 0.05) & (s2 > 0.05) & (s1 < 1.0) & (s2 < 1.0)
+    if np.count_nonzero(keep) < 5:
         return 1.0
+    s1, s2 = s1[keep], s2[keep]
+    
+    # Closed form: log(s1) ≈ gamma · log(s2)
+    log1, log2 = np.log(s1), np.log(s2)
+    gamma = float(np.sum(log1 * log2) / np.sum(log2 * log2))
+    gamma = max(0.5, min(2.0, gamma))
+    
+    # Bounded Newton refinement of sum((s2^gamma - s1)^2)
+    for _ in range(n_iters):
+        pg = s2 ** gamma
+        residuals = pg - s1
+        d1 = pg * log2
+        gradient = np.sum(residuals * d1)
+        hessian = np.sum(d1 * d1 + residuals * d1 * log2)
+        if hessian <= 0:
+            break
+        gamma_new = max(0.5, min(2.0, gamma - gradient / hessian))
+        if abs(gamma_new - gamma) < 1e-4:
+            gamma = gamma_new
+            break
+        gamma = gamma_new
+    
+    return gamma
+
+def gamma_lut(gamma):
+    """
+    256-entry lookup table for gamma correction of 8-bit images.
+    
+    FORMULA:
+        lut[v] = (v/255)^γ × 255
+    """
+    levels = np.arange(256, dtype=np.float32) / 255.0
+    return (np.power(levels, gamma) * 255).astype(np.uint8)
 
 def apply_gamma_correction(img, gamma):
     """
@@ -504,6 +1625,9 @@ def apply_gamma_correction(img, gamma):
     FORMULA:
         output = (input/255)^γ × 255
     
+    8-bit images go through a 256-entry lookup table (cv2.LUT) instead of
+    per-pixel float math.
+    
     PARAMETERS:
         img: Input image (uint8)
         gamma: Gamma value (1.0 = no correction)
@@ -514,12 +1638,15 @@ def apply_gamma_correction(img, gamma):
     if gamma == 1.0:
         return img
     
-    try:
-        img_float = img.astype(np.float32) / 255.0
-        corrected = np.power(img_float, gamma)
-        return (corrected * 255).astype(img.dtype)
-    except:
-        return img
+    if img.dtype == np.uint8:
+        return cv2.LUT(img, gamma_lut(gamma))
+    
+    img_float = img.astype(np.float32) / 255.0
+    corrected = np.power(img_float, gamma)
+    return (corrected * 255).astype(img.dtype)
+
+# Memoized weight masks: (h, w, valid-region signature) -> read-only float32 mask
+_WEIGHT_MASKS = {}
 
 def create_distance_mask(img):
     """
@@ -527,204 +1654,943 @@ def create_distance_mask(img):
     
     ALGORITHM:
         1. Create binary mask of non-zero regions
-        2. Compute Euclidean distance transform
-        3. Normalize to [0, 1]
+        2. Signature of the valid region: "full" when every pixel is valid
+           (the usual case), otherwise a hash of the packed mask
+        3. Return the memoized mask for (shape, signature) if present
+        4. Otherwise: distance to the nearest invalid pixel or image edge
+           (cv2.distanceTransform, exact L2), normalized to [0, 1]
     
     PARAMETERS:
         img: Input image
     
     RETURNS:
-        Distance mask (float32, [0, 1] range)
+        Distance mask (float32, [0, 1] range, single channel, read-only;
+        shared between images with the same shape and valid region)
     """
     h, w = img.shape[:2]
     
     # Create binary mask of non-zero regions
-    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-    mask = (gray > 0).astype(np.uint8)
-    
-    # Compute distance transform
-    dist_transform = distance_transform_edt(mask).astype(np.float32)
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if img.ndim == 3 else img
+    n_valid = cv2.countNonZero(gray)
+    if n_valid == h * w:
+        signature = "full"
+        mask = None
+    else:
+        mask = (gray > 0).astype(np.uint8)
+        signature = hashlib.sha1(np.packbits(mask).tobytes()).hexdigest()
+    
+    key = (h, w, signature)
+    cached = _WEIGHT_MASKS.get(key)
+    if cached is not None:
+        return cached
+    
+    if mask is None:
+        mask = np.ones((h, w), dtype=np.uint8)
+    
+    # Distance to the nearest invalid pixel, counting outside the image as invalid
+    padded = cv2.copyMakeBorder(mask, 1, 1, 1, 1, cv2.BORDER_CONSTANT, value=0)
+    dist_transform = cv2.distanceTransform(padded, cv2.DIST_L2, cv2.DIST_MASK_PRECISE)[1:-1, 1:-1]
     
     # Normalize distance
-    if dist_transform.max() > 0:
-        dist_transform = dist_transform / dist_transform.max()
-    
+    max_dist = float(dist_transform.max())
+    if max_dist > 0:
+        dist_transform = dist_transform / max_dist
+    dist_transform = np.ascontiguousarray(dist_transform, dtype=np.float32)
+    dist_transform.flags.writeable = False
+    
+    METRICS.alloc("weight_mask", dist_transform.nbytes)
+    if len(_WEIGHT_MASKS) >= WEIGHT_MASK_CACHE_SIZE:
+        _WEIGHT_MASKS.clear()
+    _WEIGHT_MASKS[key] = dist_transform
     return dist_transform
 
-def intelligent_merge(imgs, transforms, output_h, output_w):
+def warped_bbox(T, w, h, output_w, output_h):
     """
-    Merge multiple images with distance-based weighting and exposure matching.
-    
-    ALGORITHM:
-        1. Match exposures between consecutive images (gamma values)
-        2. Apply gamma corrections
-        3. Merge with distance-based weighting
-        4. Normalize by accumulated weights
+    Bounding box of a w×h image warped by T, clipped to the output canvas.
     
     PARAMETERS:
-        imgs: List of images
-        transforms: List of transformation matrices
+        T: 3x3 transformation matrix
+        w, h: Input image size
+        output_w, output_h: Output canvas size
+    
+    RETURNS:
+        (x0, y0, x1, y1) half-open integer box, or None if it misses the canvas
+    """
+    corners = np.float32([[0, 0], [w, 0], [w, h], [0, h]]).reshape(-1, 1, 2)
+    warped = cv2.perspectiveTransform(corners, np.asarray(T, dtype=np.float64)).reshape(-1, 2)
+    x0 = max(0, int(np.floor(warped[:, 0].min())))
+    y0 = max(0, int(np.floor(warped[:, 1].min())))
+    x1 = min(output_w, int(np.ceil(warped[:, 0].max())) + 1)
+    y1 = min(output_h, int(np.ceil(warped[:, 1].max())) + 1)
+    if x0 >= x1 or y0 >= y1:
+        return None
+    return x0, y0, x1, y1
+
+def _warp_to_roi(img, T, x0, y0, x1, y1):
+    """Warp img by T into the output sub-rectangle [x0, x1) × [y0, y1) only."""
+    shift = np.array([[1, 0, -x0], [0, 1, -y0], [0, 0, 1]], dtype=np.float64)
+    return cv2.warpPerspective(img, shift @ np.asarray(T, dtype=np.float64), (x1 - x0, y1 - y0))
+
+def _merge_exposure_corrected(imgs, transforms, seed=None):
+    """
+    Match exposures across overlapping images and apply the gammas.
+    
+    ALGORITHM:
+        1. Footprint boxes in output space; overlapping pairs from a
+           spatial hash (FootprintIndex), so grids pair real neighbours
+           rather than consecutive indices
+        2. Maximum spanning tree over the pairs weighted by overlap area,
+           walked breadth-first from the first image (the reference)
+        3. Fit each image against its tree parent (match_exposure_pair)
+           and compose with the parent's gamma: (x^g)^g_parent =
+           x^(g·g_parent), so every image converges to the reference level
+           rather than to its raw neighbour
+    
+    PARAMETERS:
+        seed: Exposure sampling seed (None = RANSAC_SEED)
+    
+    RETURNS:
+        List of gamma-corrected images
+    """
+    n_images = len(imgs)
+    boxes = []
+    for img, T in zip(imgs, transforms):
+        h, w = img.shape[:2]
+        corners = np.array([[[0, 0]], [[w, 0]], [[w, h]], [[0, h]]], dtype=np.float64)
+        warped = cv2.perspectiveTransform(corners, np.asarray(T, dtype=np.float64)).reshape(-1, 2)
+        boxes.append((*warped.min(axis=0), *warped.max(axis=0)))
+    index = FootprintIndex(max(max(x1 - x0, y1 - y0) for x0, y0, x1, y1 in boxes))
+    for k, box in enumerate(boxes):
+        index.insert(k, box)
+    pairs = index.overlapping_pairs()
+    
+    gammas = np.ones(n_images)
+    if pairs:
+        links = np.array(pairs, dtype=np.intp)
+        area = np.array([(min(boxes[i][2], boxes[j][2]) - max(boxes[i][0], boxes[j][0]))
+                         * (min(boxes[i][3], boxes[j][3]) - max(boxes[i][1], boxes[j][1]))
+                         for i, j in pairs])
+        # Maximum spanning tree: minimum over costs that fall as the area rises (all > 0)
+        tree = minimum_spanning_tree(coo_matrix((area.max() + 1.0 - area, (links[:, 0], links[:, 1])),
+                                                shape=(n_images, n_images)).tocsr())
+        reached = np.zeros(n_images, dtype=bool)
+        for root in range(n_images):
+            if reached[root]:
+                continue
+            visited, parents = breadth_first_order(tree, root, directed=False)
+            reached[visited] = True
+            for m in visited[1:]:
+                p = parents[m]
+                # Relative transform: image p -> output -> image m
+                relative = np.linalg.inv(transforms[m]) @ np.asarray(transforms[p], dtype=np.float64)
+                gammas[m] = match_exposure_pair(imgs[p], imgs[m], relative, seed=seed) * gammas[p]
+    
+    _log(f"  Exposure gammas: {[f'{g:.3f}' for g in gammas]}")
+    
+    return [apply_gamma_correction(img, float(gammas[i])) for i, img in enumerate(imgs)]
+
+def intelligent_merge(imgs, transforms, output_h, output_w, out_path=None,
+                      max_memory_mb=MERGE_MEMORY_LIMIT_MB, seed=None):
+    """
+    Merge multiple images with distance-based weighting and exposure matching.
+    
+    ALGORITHM:
+        1. Match exposures between overlapping images, composed towards
+           the first image (_merge_exposure_corrected)
+        2. Apply gamma corrections
+        3. Merge with distance-based weighting, warping and accumulating
+           only within each image's warped bounding box
+        4. Normalize by accumulated weights
+    
+    PARAMETERS:
+        imgs: List of images
+        transforms: List of transformation matrices
         output_h: Output height
         output_w: Output width
+        out_path: If set, merge out of core into this .npy file
+                  (see intelligent_merge_out_of_core)
+        max_memory_mb: Working-memory ceiling for the out-of-core merge
+        seed: Exposure sampling seed (None = RANSAC_SEED)
     
     RETURNS:
-        Merged image
+        Merged image (np.memmap cropped to the image footprints when out_path is set)
     """
-    n_imgs = len(imgs)
-    result = np.zeros((output_h, output_w, 3), dtype=np.float32)
-    weights = np.zeros((output_h, output_w, 3), dtype=np.float32)
+    if out_path is not None:
+        return intelligent_merge_out_of_core(imgs, transforms, output_h, output_w,
+                                             out_path, max_memory_mb=max_memory_mb, seed=seed)
     
-    # Match exposures between consecutive images
-    gammas = [1.0]
-    for i in range(1, n_imgs):
-        gamma = match_exposure_pair(imgs[i-1], imgs[i], transforms[i])
-        gammas.append(gamma)
+    result = np.zeros((output_h, output_w, 3), dtype=np.float32)
+    weights = np.zeros((output_h, output_w), dtype=np.float32)
+    METRICS.alloc("merge_accumulators", result.nbytes + weights.nbytes)
     
-    print(f"  Exposure gammas: {[f'{g:.3f}' for g in gammas]}")
+    # Match exposures and apply gamma corrections
+    corrected_imgs = _merge_exposure_corrected(imgs, transforms, seed=seed)
     
-    # Apply gamma corrections
-    corrected_imgs = []
-    for i, img in enumerate(imgs):
-        corrected = apply_gamma_correction(img, gammas[i])
-        corrected_imgs.append(corrected)
+    # Distance masks, shared between images with the same shape and valid region
+    masks = [create_distance_mask(img) for img in corrected_imgs]
     
     # Merge with distance-based weighting
-    for i, img in enumerate(corrected_imgs):
+    for img, mask, T in zip(corrected_imgs, masks, transforms):
         h, w = img.shape[:2]
-        T = transforms[i]
         
-        # Create distance mask for this image
-        mask = create_distance_mask(img)
-        
-        # Warp image to output space
-        img_warped = cv2.warpPerspective(img, T, (output_w, output_h))
-        mask_warped = cv2.warpPerspective(mask, T, (output_w, output_h))
+        # Only the image's warped bounding box is touched
+        box = warped_bbox(T, w, h, output_w, output_h)
+        if box is None:
+            continue
+        x0, y0, x1, y1 = box
         
-        # Expand mask to 3 channels
-        mask_3d = np.dstack([mask_warped] * 3)
+        # Warp image to output space (ROI only)
+        img_warped = _warp_to_roi(img, T, x0, y0, x1, y1)
+        mask_warped = _warp_to_roi(mask, T, x0, y0, x1, y1)
         
-        # Accumulate weighted image
-        result += img_warped.astype(np.float32) * mask_3d
-        weights += mask_3d
+        # Accumulate weighted image (single-channel weights broadcast over BGR)
+        result[y0:y1, x0:x1] += img_warped * mask_warped[:, :, None]
+        weights[y0:y1, x0:x1] += mask_warped
     
     # Normalize by weights
     weights = np.maximum(weights, 1e-6)  # Avoid division by zero
-    result = result / weights
+    result /= weights[:, :, None]
     
     return np.clip(result, 0, 255).astype(np.uint8)
 
-def stitch_sequential(images, keypoints, descriptors):
+def intelligent_merge_out_of_core(imgs, transforms, output_h, output_w, out_path,
+                                  max_memory_mb=MERGE_MEMORY_LIMIT_MB, seed=None):
+    """
+    Distance-weighted merge for panoramas larger than RAM.
+    
+    The output is processed as horizontal strips sized so the float32
+    accumulators and warp buffers stay under max_memory_mb. Each strip is
+    accumulated, normalized and written straight into a memory-mapped .npy
+    file, so only one strip of the canvas is ever resident.
+    
+    ALGORITHM:
+        1. Match exposures and apply gamma corrections
+        2. Crop box = union of warped image footprints (no black borders written)
+        3. For each strip of rows:
+           a. Warp each intersecting image over its footprint ∩ strip only
+           b. Accumulate weighted pixels and weights
+           c. Normalize and write the strip to disk
+    
+    PARAMETERS:
+        imgs: List of images
+        transforms: List of transformation matrices (to output space)
+        output_h: Output height
+        output_w: Output width
+        out_path: Destination .npy file (opened with np.load(..., mmap_mode="r"))
+        max_memory_mb: Working-memory ceiling for strip buffers (512)
+        seed: Exposure sampling seed (None = RANSAC_SEED)
+    
+    RETURNS:
+        Merged image as a read-only np.memmap of shape (crop_h, crop_w, 3)
+    """
+    corrected_imgs = _merge_exposure_corrected(imgs, transforms, seed=seed)
+    masks = [create_distance_mask(img) for img in corrected_imgs]
+    
+    # Final crop: union of the warped footprints
+    boxes = [warped_bbox(T, img.shape[1], img.shape[0], output_w, output_h)
+             for img, T in zip(corrected_imgs, transforms)]
+    valid = [b for b in boxes if b is not None]
+    if not valid:
+        raise ValueError("No image falls inside the output canvas")
+    cx0 = min(b[0] for b in valid)
+    cy0 = min(b[1] for b in valid)
+    cx1 = max(b[2] for b in valid)
+    cy1 = max(b[3] for b in valid)
+    crop_w, crop_h = cx1 - cx0, cy1 - cy0
+    
+    # Bytes per output row: result (float32 x3), weights (float32), warped
+    # image (uint8 x3), warped mask (float32), weighted product (float32 x3)
+    bytes_per_row = crop_w * (12 + 4 + 3 + 4 + 12)
+    strip_h = max(1, min(crop_h, int(max_memory_mb * 1024 * 1024) // bytes_per_row))
+    _log(f"  Out-of-core merge: {crop_w}x{crop_h} in strips of {strip_h} rows")
+    
+    out = np.lib.format.open_memmap(out_path, mode="w+", dtype=np.uint8,
+                                    shape=(crop_h, crop_w, 3))
+    
+    for y0 in range(cy0, cy1, strip_h):
+        y1 = min(y0 + strip_h, cy1)
+        sh = y1 - y0
+        result = np.zeros((sh, crop_w, 3), dtype=np.float32)
+        weights = np.zeros((sh, crop_w), dtype=np.float32)
+        
+        for img, mask, T, box in zip(corrected_imgs, masks, transforms, boxes):
+            if box is None or box[3] <= y0 or box[1] >= y1:
+                continue
+            
+            # Warp only the part of the footprint inside this strip
+            bx0, bx1 = box[0], box[2]
+            by0, by1 = max(box[1], y0), min(box[3], y1)
+            img_warped = _warp_to_roi(img, T, bx0, by0, bx1, by1)
+            mask_warped = _warp_to_roi(mask, T, bx0, by0, bx1, by1)
+            
+            rows = slice(by0 - y0, by1 - y0)
+            cols = slice(bx0 - cx0, bx1 - cx0)
+            result[rows, cols] += img_warped * mask_warped[:, :, None]
+            weights[rows, cols] += mask_warped
+        
+        weights = np.maximum(weights, 1e-6)  # Avoid division by zero
+        result /= weights[:, :, None]
+        out[y0 - cy0:y1 - cy0] = np.clip(result, 0, 255).astype(np.uint8)
+    
+    out.flush()
+    del out
+    return np.load(out_path, mmap_mode="r")
+
+def rescale_transform(T, src_scale, dst_scale):
+    """
+    Convert a transform estimated on resized proxies to full-resolution coordinates.
+    
+    FORMULA:
+        T_full = S_dst^-1 · T · S_src,  S = diag(sx, sy, 1)
+    
+    PARAMETERS:
+        T: 3x3 transform from proxy 1 to proxy 2
+        src_scale: (sx, sy) proxy/full scale of image 1
+        dst_scale: (sx, sy) proxy/full scale of image 2
+    
+    RETURNS:
+        3x3 transform from full-resolution image 1 to full-resolution image 2
+    """
+    S_src = np.diag([src_scale[0], src_scale[1], 1.0])
+    S_dst_inv = np.diag([1.0 / dst_scale[0], 1.0 / dst_scale[1], 1.0])
+    return (S_dst_inv @ T @ S_src).astype(T.dtype)
+
+def estimate_translation_phase_correlation(img1, img2, expected_overlap=PHASE_EXPECTED_OVERLAP):
+    """
+    Estimate a sub-pixel translation between neighbours by FFT phase correlation.
+    
+    ALGORITHM:
+        1. Take the right band of img1 and the left band of img2
+           (band width = 2 × expected overlap, so the true overlap sits
+           inside both bands even if the prior is off)
+        2. Apply a Hanning window to suppress band-edge effects
+        3. cv2.phaseCorrelate: peak location = sub-pixel band shift,
+           peak value = confidence (1.0 = perfect match)
+        4. Unwrap the band shift (the correlation is circular, and a shift
+           near the prior sits at the wrap point): img2 lies to the right,
+           so the shift is in (-band, 0]
+        5. Convert the band shift to an img1 -> img2 translation
+    
+    PARAMETERS:
+        img1: Left image
+        img2: Right image
+        expected_overlap: Expected overlap as a fraction of image width (0.3)
+    
+    RETURNS:
+        T: 3x3 translation matrix (img1 -> img2 coordinates)
+        response: Normalized correlation peak value
+    """
+    h = min(img1.shape[0], img2.shape[0])
+    w1 = img1.shape[1]
+    band = max(8, int(min(w1, img2.shape[1]) * min(1.0, 2 * expected_overlap)))
+    
+    gray1 = cv2.cvtColor(img1[:h, w1 - band:], cv2.COLOR_BGR2GRAY).astype(np.float32)
+    gray2 = cv2.cvtColor(img2[:h, :band], cv2.COLOR_BGR2GRAY).astype(np.float32)
+    window = cv2.createHanningWindow((band, h), cv2.CV_32F)
+    
+    (dx, dy), response = cv2.phaseCorrelate(gray1, gray2, window)
+    if dx > 0:
+        dx -= band
+    
+    # Band coordinates: x2 = (x1 - (w1 - band)) + dx
+    T = np.array([
+        [1, 0, dx - (w1 - band)],
+        [0, 1, dy],
+        [0, 0, 1]
+    ], dtype=np.float32)
+    return T, response
+
+def overlap_correlation(img1, img2, T):
+    """
+    Normalized cross-correlation of the region two images share under T.
+    
+    Used to confirm a phase-correlation shift before it is accepted: the
+    correct shift lines the overlap up almost exactly, a wrong peak does not.
+    
+    PARAMETERS:
+        img1: First image
+        img2: Second image
+        T: 3x3 translation matrix (img1 -> img2 coordinates), rounded to
+           whole pixels
+    
+    RETURNS:
+        Correlation in [-1, 1] (-1.0 if the overlap is under 8 pixels wide or tall)
+    """
+    dx, dy = int(round(float(T[0, 2]))), int(round(float(T[1, 2])))
+    x1, y1 = max(0, -dx), max(0, -dy)
+    w = min(img1.shape[1] - x1, img2.shape[1] - (x1 + dx))
+    h = min(img1.shape[0] - y1, img2.shape[0] - (y1 + dy))
+    if w < 8 or h < 8:
+        return -1.0
+    gray1 = cv2.cvtColor(img1[y1:y1 + h, x1:x1 + w], cv2.COLOR_BGR2GRAY)
+    gray2 = cv2.cvtColor(img2[y1 + dy:y1 + dy + h, x1 + dx:x1 + dx + w], cv2.COLOR_BGR2GRAY)
+    return float(cv2.matchTemplate(gray1, gray2, cv2.TM_CCOEFF_NORMED)[0, 0])
+
+def estimate_overlap(img1, img2, prior=OVERLAP_PRIOR, thumb_width=256):
+    """
+    Coarse overlap fraction between left/right neighbours.
+    
+    ALGORITHM:
+        1. Downscale both images to thumb_width-wide thumbnails
+        2. Phase correlation of the thumbnails
+           (estimate_translation_phase_correlation)
+        3. Return the prior if the peak is below PHASE_MIN_RESPONSE,
+           else the overlap implied by the shift
+    
+    PARAMETERS:
+        img1: Left image
+        img2: Right image
+        prior: Expected overlap fraction (OVERLAP_PRIOR)
+        thumb_width: Thumbnail width in pixels (256)
+    
+    RETURNS:
+        Overlap as a fraction of the narrower image's width (0-1)
+    """
+    scale = min(1.0, thumb_width / max(img1.shape[1], img2.shape[1]))
+    small = [cv2.resize(img, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA) if scale < 1.0
+             else img for img in (img1, img2)]
+    T, response = estimate_translation_phase_correlation(small[0], small[1], expected_overlap=prior)
+    if response < PHASE_MIN_RESPONSE:
+        return prior
+    w1, w2 = small[0].shape[1], small[1].shape[1]
+    return float(np.clip((w1 + T[0, 2]) / min(w1, w2), 0.0, 1.0))
+
+def overlap_band(width, overlap, side, slack=OVERLAP_BAND_SLACK, min_band=OVERLAP_MIN_BAND):
+    """
+    Columns of an image expected to overlap its neighbour.
+    
+    PARAMETERS:
+        width: Image width
+        overlap: Expected overlap fraction
+        side: "right" (neighbour follows) or "left" (neighbour precedes)
+        slack: Widening, as a fraction of the overlap (OVERLAP_BAND_SLACK)
+        min_band: Narrowest band, as a fraction of the width (OVERLAP_MIN_BAND)
+    
+    RETURNS:
+        (x0, x1) column range
+    """
+    band = int(np.ceil(width * min(1.0, max(min_band, overlap * (1 + slack)))))
+    return (0, band) if side == "left" else (width - band, width)
+
+def band_features(img, x0, x1, keypoints=None, descriptors=None, feature_config=None):
+    """
+    Features inside columns x0:x1 of an image.
+    
+    ALGORITHM:
+        1. With whole-image features (keypoints/descriptors given), keep
+           those inside the band, so only the band is indexed and matched
+        2. Otherwise detect on the cropped band only, and compute
+           descriptors for the engine's feature budget (nfeatures) scaled
+           by the band's share of the width, so detection, description and
+           matching cost all shrink with the band
+        3. Shift keypoints back to image coordinates
+    
+    PARAMETERS:
+        img: Image
+        x0, x1: Band column range
+        keypoints: Whole-image KeypointArrays (None = detect in the band)
+        descriptors: Whole-image descriptors, matching keypoints
+        feature_config: Feature engine config or name (None = FEATURE_ENGINE)
+    
+    RETURNS:
+        kp: KeypointArrays (image coordinates)
+        des: Descriptors
+    """
+    if keypoints is not None:
+        x = keypoints.pts[:, 0]
+        keep = (x >= x0) & (x < x1)
+        return keypoints.subset(keep), None if descriptors is None else descriptors[keep]
+    band = img[:, x0:x1]
+    detector = get_detector(feature_config)
+    budget = getattr(resolve_feature_config(feature_config), "nfeatures", 0)
+    with METRICS.stage("detect_features", images=1, workers=1, band=[x0, x1]):
+        kp = detector.detect(band, None)
+        if budget:
+            keep = max(1, int(round(budget * (x1 - x0) / img.shape[1])))
+            kp = sorted(kp, key=lambda k: -k.response)[:keep]
+        kp, des = detector.compute(band, kp)
+        METRICS.annotate(keypoints=len(kp))
+    kp = KeypointArrays.from_cv(kp)
+    kp.pts[:, 0] += x0
+    return kp, des
+
+def register_pair(kp1, kp2, des1, des2, pano_w, img_w, src_scale=(1.0, 1.0), dst_scale=(1.0, 1.0),
+                  feature_config=None, index2=None, strict=False, seed=None):
+    """
+    Estimate the transform and blend overlap between consecutive images.
+    
+    ALGORITHM:
+        1. Match features
+        2. If fewer than 10 matches: translation-only transform
+        3. Otherwise homography (RANSAC), falling back to translation
+        4. Rescale the transform from proxy to render resolution
+        5. Derive the blend overlap width from the horizontal shift
+    
+    PARAMETERS:
+        kp1, kp2: Keypoints of the previous and current image
+        des1, des2: Descriptors of the previous and current image
+        pano_w: Width of the panorama built so far (render resolution)
+        img_w: Width of the current image (render resolution)
+        src_scale: (sx, sy) proxy/render scale of the previous image
+        dst_scale: (sx, sy) proxy/render scale of the current image
+        feature_config: Engine config or name used for matching (None = FEATURE_ENGINE)
+        index2: Optional prebuilt DescriptorIndex of des2
+        strict: Return no transform instead of a low-match translation (False)
+        seed: RANSAC seed (None = RANSAC_SEED)
+    
+    RETURNS:
+        T: 3x3 transform (None if no transform could be estimated)
+        overlap_width: Overlap width in pixels
+    """
+    with METRICS.stage("match_features"):
+        matches = match_features(des1, des2, feature_config, index=index2)
+    _log(f"  Matches found: {len(matches)}")
+    METRICS.annotate(matches=len(matches))
+    
+    if strict and len(matches) < 10:
+        METRICS.annotate(transform="none")
+        return None, min(img_w // 4, pano_w // 4)
+    if len(matches) < 10:
+        _log(f"  ⚠️  Low matches, using translation transform")
+        H = None
+    else:
+        # Try homography first (for perspective correction)
+        H = compute_homography_ransac(kp1, kp2, matches, seed=seed)
+        if H is None:
+            _log(f"  ⚠️  Homography failed, using translation")
+    
+    if H is None:
+        T = compute_translation_transform(kp1, kp2, matches, seed=seed)
+        if T is None:
+            METRICS.annotate(transform="none")
+            return None, min(img_w // 4, pano_w // 4)
+        T = rescale_transform(T, src_scale, dst_scale)
+        METRICS.annotate(transform="translation", shift=float(T[0, 2]))
+        return T, int(abs(T[0, 2]) * 0.7)
+    
+    _log(f"  ✓ Homography computed")
+    H = rescale_transform(H, src_scale, dst_scale)
+    
+    # Calculate overlap from transformation
+    shift = H[0, 2]
+    overlap_width = int(abs(shift) * 0.7) if abs(shift) > 0 else min(img_w // 4, pano_w // 4)
+    overlap_width = max(50, min(overlap_width, min(pano_w, img_w) // 2))
+    
+    _log(f"  Shift: {shift:.1f}, Overlap: {overlap_width}")
+    # compute_homography_ransac may already have reduced H to a translation
+    is_translation = np.allclose(H[:2, :2], np.eye(2)) and np.allclose(H[2], (0, 0, 1))
+    METRICS.annotate(transform="translation" if is_translation else "homography", shift=float(shift))
+    return H, overlap_width
+
+def solve_global_translations(n_images, constraints, anchor=0, outlier_px=None,
+                              n_iters=GLOBAL_IRLS_ITERS):
+    """
+    Solve all tile positions together from pairwise translation constraints.
+    
+    ALGORITHM:
+        1. One equation per constraint and axis: pos_j - pos_i = (dx, dy)
+        2. Fix the anchor tile at (0, 0) (gauge) by dropping its column
+        3. Weighted least squares via the sparse normal equations
+           (AᵀWA) p = AᵀWd, solved for x and y at once with a sparse
+           direct solver; AᵀWA is a graph Laplacian with one row per tile
+           and one entry per constraint, so thousands of tiles solve in
+           well under a second
+        4. Robust refinement (IRLS): constraints are reweighted by their
+           residual r with Cauchy weights 1 / (1 + (r / outlier_px)²) and
+           the system re-solved, so gross mismatches lose their pull
+    
+    PARAMETERS:
+        n_images: Number of tiles
+        constraints: List of (i, j, dx, dy, weight), meaning tile j's position
+                     minus tile i's position ≈ (dx, dy)
+        anchor: Tile fixed at the origin (0)
+        outlier_px: Cauchy scale in the constraints' units (None = no reweighting)
+                    (tiles not connected to the anchor make the system singular)
+        n_iters: Maximum reweighting iterations (GLOBAL_IRLS_ITERS)
+    
+    RETURNS:
+        positions: (n_images, 2) float64 tile positions (anchor at 0, 0)
+        residuals: (n_constraints,) residual length of each constraint
+    """
+    if not constraints:
+        return np.zeros((n_images, 2)), np.zeros(0)
+    c = np.asarray(constraints, dtype=np.float64)
+    ii, jj = c[:, 0].astype(np.intp), c[:, 1].astype(np.intp)
+    d = c[:, 2:4]
+    base_w = np.sqrt(np.maximum(c[:, 4], 0.0))
+    m = len(c)
+    
+    # Unknown columns without the anchor; -1 marks the anchor
+    col = np.arange(n_images) - (np.arange(n_images) > anchor)
+    col[anchor] = -1
+    rows = np.concatenate([np.arange(m), np.arange(m)])
+    cols = np.concatenate([col[jj], col[ii]])
+    signs = np.concatenate([np.ones(m), -np.ones(m)])
+    keep = cols >= 0
+    
+    A = coo_matrix((signs[keep], (rows[keep], cols[keep])), shape=(m, n_images - 1)).tocsr()
+    At = A.T.tocsr()
+    
+    positions = np.zeros((n_images, 2))
+    w = base_w.copy()
+    for _ in range(max(1, n_iters)):
+        W = coo_matrix((w * w, (np.arange(m), np.arange(m))), shape=(m, m)).tocsr()
+        normal = (At @ W @ A).tocsc()
+        rhs = At @ (d * (w * w)[:, None])
+        sol = spsolve(normal, rhs).reshape(-1, 2)
+        positions = np.insert(sol, anchor, 0.0, axis=0)
+        residuals = np.linalg.norm(positions[jj] - positions[ii] - d, axis=1)
+        if outlier_px is None:
+            break
+        w_new = base_w / np.sqrt(1.0 + (residuals / outlier_px) ** 2)
+        if np.allclose(w_new, w, rtol=1e-3, atol=1e-6):
+            break
+        w = w_new
+    
+    return positions, residuals
+
+def _pair_translation(kp1, kp2, des1, des2, feature_config=None, index2=None, min_matches=10,
+                      min_inliers=0, min_inlier_ratio=0.0, seed=None):
+    """
+    Translation between two proxies from feature matches (for extra
+    global-alignment constraints).
+    
+    PARAMETERS:
+        min_matches: Ratio-test matches needed to estimate at all (10)
+        min_inliers: RANSAC inliers needed to accept the translation (0)
+        min_inlier_ratio: Inliers / matches needed to accept it (0.0)
+        seed: RANSAC seed (None = RANSAC_SEED)
+    
+    RETURNS:
+        T: 3x3 translation (image 1 -> image 2, proxy pixels), or None
+        n_matches: Number of ratio-test matches
+        n_inliers: Number of RANSAC inliers (0 if not estimated)
+    """
+    if des1 is None or des2 is None or len(des1) < 2 or len(des2) < 2:
+        return None, 0, 0
+    matches = match_features(des1, des2, feature_config, index=index2)
+    if len(matches) < min_matches:
+        return None, len(matches), 0
+    T, n_inliers = compute_translation_transform(kp1, kp2, matches, seed=seed, return_inliers=True)
+    if n_inliers < min_inliers or n_inliers < min_inlier_ratio * len(matches):
+        return None, len(matches), n_inliers
+    return T, len(matches), n_inliers
+
+def stitch_sequential(images, keypoints=None, descriptors=None, render_images=None,
+                      registration=REGISTRATION_MODE, feature_config=None, return_transforms=False,
+                      global_align=GLOBAL_ALIGNMENT, overlap_features=OVERLAP_FEATURES,
+                      extract_kwargs=None, seed=None):
     """
     Stitch images sequentially with exposure matching and advanced blending.
     
     ALGORITHM:
-        1. Initialize panorama with first image
-        2. For each subsequent image:
-           a. Match features
-           b. Estimate transformation (homography or translation)
-           c. Match exposures
-           d. Blend using pyramid method
-        3. Apply global shift adjustment
-        4. Crop borders
+        1. Register each image against the previous one:
+           a. Phase correlation of the overlap bands ("phase" mode only),
+              accepted if the peak passes PHASE_MIN_RESPONSE and the
+              shifted overlap passes PHASE_MIN_OVERLAP_NCC
+           b. Overlap-restricted features (overlap_features only): match
+              the right band of the previous image against the left band
+              of the current one, sized from the previous pair's overlap
+              (estimate_overlap for the first pair)
+           c. Otherwise match features and estimate transformation
+              (homography or translation, register_pair)
+        2. Global alignment (global_align, off by default): add
+           constraints between non-adjacent images whose predicted overlap
+           is large enough, solve all positions together
+           (solve_global_translations) and replace the pairwise
+           translations with the solved ones. Only the returned transforms
+           and the overlap widths change: tiles are still placed by
+           overlap width (step 4), so the solved y offsets and absolute
+           positions are not rendered. Without non-adjacent overlap (below
+           about 50% neighbour overlap) the solve adds nothing
+        3. Compute the canvas size from the overlaps and allocate it once
+        4. For each subsequent image:
+           a. Match exposures
+           b. Blend in place into its canvas region
+        5. Crop borders
     
     PARAMETERS:
         images: List of images
-        keypoints: List of SIFT keypoint lists
-        descriptors: List of SIFT descriptor lists
+        keypoints: List of KeypointArrays (None = extract, using the feature cache)
+        descriptors: List of SIFT descriptor lists (None = extract, using the feature cache)
+        render_images: Optional full-resolution versions of images. Transforms are
+                       estimated on images and rescaled to render from these.
+        registration: "sift" (features) or "phase" (phase correlation with
+                      feature fallback for weak or inconsistent peaks)
+        feature_config: Feature engine config or name (None = FEATURE_ENGINE)
+        return_transforms: Also return the pairwise transforms and overlaps (False)
+        global_align: Jointly refine translations and overlap widths over all
+                      pairs; only useful with heavy overlap (GLOBAL_ALIGNMENT)
+        overlap_features: Detect and match only in the expected overlap bands,
+                          whole images as fallback (OVERLAP_FEATURES)
+        extract_kwargs: Options for every extract_features call made here,
+                        including on-demand fallbacks (n_workers, use_cache,
+                        cache_dir; None = module defaults)
+        seed: Seed for translation RANSAC and exposure sampling; equal
+              seeds give identical output (None = RANSAC_SEED)
     
     RETURNS:
         Final panorama image
+        transforms: Image i-1 -> image i transforms at render resolution
+                    (identity for the first image, None where registration
+                    failed; only if return_transforms)
+        overlaps: Blend overlap widths (only if return_transforms)
     """
-    print("\nStarting sequential stitching with exposure matching...")
+    if render_images is None:
+        render_images = images
+    _seed_opencv(seed)
+    # proxy/full scale per image (1.0 when rendering the proxies themselves)
+    scales = [(p.shape[1] / r.shape[1], p.shape[0] / r.shape[0])
+              for p, r in zip(images, render_images)]
+
+    n_images = len(images)
+    if keypoints is None or descriptors is None:
+        if registration == "phase" or overlap_features:
+            # Whole-image features are only detected for pairs that fall back to them
+            keypoints, descriptors = [None] * n_images, [None] * n_images
+        else:
+            _log("\nDetecting features...")
+            keypoints, descriptors = extract_features(images, feature_config=feature_config,
+                                                      **(extract_kwargs or {}))
+    detected = set(range(n_images)) if keypoints[0] is not None else set()
     
-    # Initialize panorama with first image
-    pano = images[0].copy()
-    print(f"Starting with image 1: {pano.shape}")
+    _log("\nStarting sequential stitching with exposure matching...")
     
-    # Store homographies for later use
+    # Pass 1: register all pairs to size the canvas up front
+    # Store homographies for later use (None = no transform found)
     homographies = [np.eye(3)]
+    overlaps = [0]
     
-    # Store shift values for global adjustment
-    shifts = [0]
+    # Descriptor indices are built once per image and reused for the run
+    indices = DescriptorIndexCache(feature_config)
+    reset_matcher_stats()
     
+    pano_w = render_images[0].shape[1]
+    expected_overlap = None
     for i in range(1, len(images)):
-        print(f"\nStitching image {i+1}...")
-        current_img = images[i]
-        
-        # Match with previous image
-        matches = match_features(descriptors[i-1], descriptors[i])
-        print(f"  Matches found: {len(matches)}")
-        
-        if len(matches) < 10:
-            print(f"  ⚠️  Low matches, using translation transform")
-            T = compute_translation_transform(keypoints[i-1], keypoints[i], matches)
-            if T is not None:
-                shift = T[0, 2]
-                shifts.append(shift)
-                homographies.append(T)
-                overlap_width = int(abs(shift) * 0.7)
-            else:
-                overlap_width = min(current_img.shape[1] // 4, pano.shape[1] // 4)
+        with METRICS.stage("register", pair=i):
+            _log(f"\nRegistering image {i+1}...")
+            T = None
+            if registration == "phase":
+                T_phase, response = estimate_translation_phase_correlation(images[i-1], images[i])
+                _log(f"  Phase correlation peak: {response:.3f}")
+                METRICS.annotate(phase_response=float(response))
+                if response < PHASE_MIN_RESPONSE:
+                    _log(f"  ⚠️  Weak correlation peak, falling back to SIFT")
+                else:
+                    ncc = overlap_correlation(images[i-1], images[i], T_phase)
+                    METRICS.annotate(phase_ncc=ncc)
+                    if ncc >= PHASE_MIN_OVERLAP_NCC:
+                        T = rescale_transform(T_phase, scales[i-1], scales[i])
+                        overlap_width = int(abs(T[0, 2]) * 0.7)
+                        METRICS.annotate(transform="phase", shift=float(T[0, 2]))
+                    else:
+                        _log(f"  ⚠️  Overlap does not line up (NCC {ncc:.3f}), falling back to SIFT")
             
-            # Apply exposure matching before blending
-            gamma = match_exposure_pair(pano, current_img, np.eye(3) if T is None else T)
-            current_img = apply_gamma_correction(current_img, gamma)
+            if T is None and overlap_features:
+                if expected_overlap is None:
+                    expected_overlap = estimate_overlap(images[i-1], images[i])
+                band1 = overlap_band(images[i-1].shape[1], expected_overlap, "right")
+                band2 = overlap_band(images[i].shape[1], expected_overlap, "left")
+                _log(f"  Overlap bands: {expected_overlap:.0%} expected, columns {band1} -> {band2}")
+                kp1, des1 = band_features(images[i-1], *band1, keypoints[i-1], descriptors[i-1],
+                                          feature_config)
+                kp2, des2 = band_features(images[i], *band2, keypoints[i], descriptors[i], feature_config)
+                METRICS.annotate(expected_overlap=expected_overlap, band_keypoints=[len(kp1), len(kp2)])
+                T, overlap_width = register_pair(
+                    kp1, kp2, des1, des2, pano_w, render_images[i].shape[1], scales[i-1], scales[i],
+                    feature_config=feature_config, strict=True, seed=seed)
+                if T is None:
+                    _log(f"  ⚠️  Too few matches in the overlap bands, using whole images")
             
-            pano = stitch_with_pyramid_blending(pano, current_img, overlap_width)
-            print(f"  Panorama shape now: {pano.shape}")
-            continue
-        
-        # Try homography first (for perspective correction)
-        H = compute_homography_ransac(keypoints[i-1], keypoints[i], matches)
+            if T is None:
+                missing = [j for j in (i - 1, i) if j not in detected]
+                if missing:
+                    kps, dess = extract_features([images[j] for j in missing],
+                                                 feature_config=feature_config,
+                                                 **(extract_kwargs or {}))
+                    for j, kp, des in zip(missing, kps, dess):
+                        keypoints[j], descriptors[j] = kp, des
+                    detected.update(missing)
+                index2 = None
+                if descriptors[i] is not None and len(descriptors[i]) >= 2:
+                    index2 = indices.get(i, descriptors[i])
+                T, overlap_width = register_pair(
+                    keypoints[i-1], keypoints[i], descriptors[i-1], descriptors[i],
+                    pano_w, render_images[i].shape[1], scales[i-1], scales[i],
+                    feature_config=feature_config, index2=index2, seed=seed)
+            overlap_width = max(0, min(overlap_width, pano_w, render_images[i].shape[1]))
+            METRICS.annotate(overlap=overlap_width)
+            if overlap_features:
+                # This pair's overlap sizes the next pair's bands
+                expected_overlap = None
+                if T is not None:
+                    w_prev, w_cur = render_images[i-1].shape[1], render_images[i].shape[1]
+                    measured = (w_prev + float(T[0, 2])) / min(w_prev, w_cur)
+                    if 0.0 < measured <= 1.0:
+                        expected_overlap = measured
+            homographies.append(T)
+            overlaps.append(overlap_width)
+        pano_w += render_images[i].shape[1] - overlap_width
+    
+    if global_align and n_images > 2:
+        with METRICS.stage("global_alignment"):
+            pano_w = _global_alignment(images, render_images, scales, keypoints, descriptors,
+                                       detected, homographies, overlaps, indices, feature_config,
+                                       extract_kwargs, seed)
+    
+    indices.clear()
+    _log(f"\nMatcher: {MATCHER_STATS['indices_built']} index(es) built, "
+          f"{MATCHER_STATS['queries']} quer(ies), "
+          f"{MATCHER_STATS['bf_fallbacks']} brute-force fallback(s)")
+    for name, value in MATCHER_STATS.items():
+        METRICS.count(f"matcher_{name}", value)
+    
+    # Allocate the panorama canvas once
+    canvas_h = max(img.shape[0] for img in render_images)
+    canvas = np.zeros((canvas_h, pano_w, 3), dtype=render_images[0].dtype)
+    METRICS.alloc("canvas", canvas.nbytes)
+    _log(f"\nCanvas allocated: {canvas.shape}")
+    
+    # Pass 2: blend each image in place into its own region
+    h0, w0 = render_images[0].shape[:2]
+    canvas[:h0, :w0] = render_images[0]
+    _log(f"Starting with image 1: {render_images[0].shape}")
+    x_end, filled_h = w0, h0
+    prev_start = 0
+    
+    for i in range(1, len(images)):
+        _log(f"\nStitching image {i+1}...")
+        current_img = render_images[i]
+        T = homographies[i]
         
-        if H is None:
-            print(f"  ⚠️  Homography failed, using translation")
-            T = compute_translation_transform(keypoints[i-1], keypoints[i], matches)
+        # Match exposures between the previous tile (as blended) and current image
+        with METRICS.stage("exposure", pair=i):
             if T is not None:
-                shift = T[0, 2]
-                shifts.append(shift)
-                homographies.append(T)
-                overlap_width = int(abs(shift) * 0.7)
+                prev_h, prev_w = render_images[i-1].shape[:2]
+                prev_tile = canvas[:prev_h, prev_start:prev_start + prev_w]
+                gamma = match_exposure_pair(prev_tile, current_img, T, seed=seed)
             else:
-                overlap_width = min(current_img.shape[1] // 4, pano.shape[1] // 4)
-            
-            # Apply exposure matching
-            gamma = match_exposure_pair(pano, current_img, np.eye(3) if T is None else T)
+                gamma = 1.0
+            METRICS.annotate(gamma=gamma)
+            _log(f"  Exposure gamma: {gamma:.3f}")
             current_img = apply_gamma_correction(current_img, gamma)
-            
-            pano = stitch_with_pyramid_blending(pano, current_img, overlap_width)
-            print(f"  Panorama shape now: {pano.shape}")
-            continue
-        
-        print(f"  ✓ Homography computed")
-        homographies.append(H)
-        
-        # Calculate overlap from transformation
-        shift = H[0, 2]
-        shifts.append(shift)
-        overlap_width = int(abs(shift) * 0.7) if abs(shift) > 0 else min(current_img.shape[1] // 4, pano.shape[1] // 4)
-        overlap_width = max(50, min(overlap_width, min(pano.shape[1], current_img.shape[1]) // 2))
-        
-        print(f"  Shift: {shift:.1f}, Overlap: {overlap_width}")
         
-        # Match exposures between panorama and current image
-        gamma = match_exposure_pair(pano, current_img, H)
-        print(f"  Exposure gamma: {gamma:.3f}")
-        current_img = apply_gamma_correction(current_img, gamma)
-        
-        # Stitch using pyramid blending
-        pano = stitch_with_pyramid_blending(pano, current_img, overlap_width)
-        print(f"  Panorama shape now: {pano.shape}")
+        # Blend in place
+        prev_start = x_end - overlaps[i]
+        with METRICS.stage("blend", pair=i, overlap=overlaps[i]):
+            x_end = blend_into_canvas(canvas, current_img, x_end, overlaps[i], filled_h=filled_h)
+        filled_h = max(filled_h, current_img.shape[0])
+        _log(f"  Panorama extent now: {(filled_h, x_end)}")
     
-    # Global adjustment: end-to-end shift compensation
-    print("\nApplying global adjustment...")
-    if len(shifts) > 1:
-        total_shift = sum(shifts[1:])
-        avg_shift_per_image = total_shift / (len(shifts) - 1)
-        print(f"  Total shift: {total_shift:.1f}, Average per image: {avg_shift_per_image:.1f}")
+    pano = canvas
     
     # Final cropping
-    print("\nCropping black borders...")
+    _log("\nCropping black borders...")
+    with METRICS.stage("crop"):
+        pano = crop_black_borders(pano)
+    if return_transforms:
+        return pano, homographies, overlaps
+    return pano
+
+def _global_alignment(images, render_images, scales, keypoints, descriptors, detected,
+                      homographies, overlaps, indices, feature_config=None, extract_kwargs=None,
+                      seed=None):
+    """
+    Global alignment stage of stitch_sequential (updates homographies and
+    overlaps in place).
+    
+    The solved positions are not rendered: blend_into_canvas places each
+    tile by its overlap width alone, so the solution reaches the panorama
+    only through the recomputed overlap widths (from the solved x shift),
+    and the solved y shifts only through the returned transforms. With
+    less than about 50% overlap between neighbours no non-adjacent pair
+    is matched and the solve returns the pairwise chain. stitch_grid
+    renders tiles at their solved positions.
+    
+    ALGORITHM:
+        1. Adjacent constraints from the pairwise translations; failed pairs
+           get a weak constraint from the fallback layout so the graph stays
+           connected
+        2. Predict positions by chaining, and match non-adjacent pairs
+           (up to GLOBAL_MAX_SKIP apart) whose predicted overlap is at least
+           GLOBAL_MIN_OVERLAP
+        3. Solve all positions (solve_global_translations) in render pixels
+        4. Replace each registered translation with the solved relative
+           shift and recompute its overlap width
+    
+    RETURNS:
+        New panorama width
+    """
+    n_images = len(images)
+    widths = [img.shape[1] for img in render_images]
+    
+    _log("\nGlobal alignment...")
+    # 1. Adjacent constraints (pos_i - pos_{i-1} = -t for T mapping i-1 -> i)
+    constraints = []
+    translation_only = [False] * n_images
+    for i in range(1, n_images):
+        T = homographies[i]
+        if T is None:
+            constraints.append((i - 1, i, widths[i-1] - overlaps[i], 0.0, 1e-4))
+            continue
+        T = np.asarray(T, dtype=np.float64)
+        translation_only[i] = np.allclose(T[:2, :2], np.eye(2), atol=1e-6) and np.allclose(T[2], (0, 0, 1))
+        constraints.append((i - 1, i, -T[0, 2], -T[1, 2], 1.0))
+    
+    # 2. Non-adjacent constraints where the chained layout predicts overlap
+    predicted, _ = solve_global_translations(n_images, constraints)
+    n_extra = 0
+    for i in range(n_images):
+        for j in range(i + 2, min(n_images, i + GLOBAL_MAX_SKIP + 1)):
+            overlap = min(widths[i], widths[j]) - abs(predicted[j, 0] - predicted[i, 0])
+            if overlap < GLOBAL_MIN_OVERLAP * min(widths[i], widths[j]):
+                continue
+            missing = [k for k in (i, j) if k not in detected]
+            if missing:
+                kps, dess = extract_features([images[k] for k in missing], feature_config=feature_config,
+                                             **(extract_kwargs or {}))
+                for k, kp, des in zip(missing, kps, dess):
+                    keypoints[k], descriptors[k] = kp, des
+                detected.update(missing)
+            index2 = None
+            if descriptors[j] is not None and len(descriptors[j]) >= 2:
+                index2 = indices.get(j, descriptors[j])
+            with METRICS.stage("register_non_adjacent", pair=(i, j)):
+                T, n_matches, _ = _pair_translation(keypoints[i], keypoints[j], descriptors[i], descriptors[j],
+                                                    feature_config, index2=index2, seed=seed)
+                METRICS.annotate(matches=n_matches)
+            if T is None:
+                continue
+            T = rescale_transform(T, scales[i], scales[j])
+            constraints.append((i, j, -float(T[0, 2]), -float(T[1, 2]), 1.0))
+            n_extra += 1
+    
+    # 3. Joint solve (robust threshold in render pixels)
+    outlier_px = GLOBAL_OUTLIER_PX / min(min(s) for s in scales)
+    positions, residuals = solve_global_translations(n_images, constraints, outlier_px=outlier_px)
+    real = np.array([c[4] >= 1.0 for c in constraints])
+    max_residual = float(residuals[real].max()) if real.any() else 0.0
+    _log(f"  {len(constraints)} constraint(s) ({n_extra} non-adjacent), "
+         f"max residual: {max_residual:.2f}px")
+    METRICS.annotate(constraints=len(constraints), non_adjacent=n_extra, max_residual=max_residual)
+    
+    # 4. Solved relative shifts replace the pairwise translations
+    pano_w = widths[0]
+    for i in range(1, n_images):
+        if homographies[i] is not None and translation_only[i]:
+            T = np.array(homographies[i], dtype=np.float64)
+            T[:2, 2] = positions[i-1] - positions[i]
+            homographies[i] = T.astype(np.asarray(homographies[i]).dtype)
+            overlaps[i] = max(0, min(int(abs(T[0, 2]) * 0.7), pano_w, widths[i]))
+        pano_w += widths[i] - overlaps[i]
+    return pano_w
+
+def crop_black_borders(pano):
+    """
+    Crop a panorama to the bounding box of its largest non-black region
+    (plus a 5 pixel border).
+    """
     gray = cv2.cvtColor(pano, cv2.COLOR_BGR2GRAY)
     _, thresh = cv2.threshold(gray, 1, 255, cv2.THRESH_BINARY)
     contours, _ = cv2.findContours(thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
@@ -733,49 +2599,1413 @@ def stitch_sequential(images, keypoints, descriptors):
         largest_contour = max(contours, key=cv2.contourArea)
         x, y, w, h = cv2.boundingRect(largest_contour)
         pano = pano[max(0, y-5):y+h+5, max(0, x-5):x+w+5]
-        print(f"  Cropped to: {pano.shape}")
+        _log(f"  Cropped to: {pano.shape}")
     
     return pano
 
-def main():
+def _thumbnail_histograms(thumb):
+    """Hellinger-normalized hue/saturation, gradient-orientation and luminance histograms."""
+    hsv = cv2.cvtColor(thumb, cv2.COLOR_BGR2HSV)
+    color = cv2.calcHist([hsv], [0, 1], None, [16, 8], [0, 180, 0, 256]).ravel()
+    gray = cv2.cvtColor(thumb, cv2.COLOR_BGR2GRAY).astype(np.float32)
+    mag, ang = cv2.cartToPolar(cv2.Sobel(gray, cv2.CV_32F, 1, 0), cv2.Sobel(gray, cv2.CV_32F, 0, 1))
+    bins = (ang.ravel() * (16 / (2 * np.pi))).astype(np.intp) % 16
+    texture = np.bincount(bins, weights=mag.ravel(), minlength=16)
+    luminance = np.bincount((gray.ravel() // 16).astype(np.intp), minlength=16)
+    parts = [np.sqrt(h / max(float(h.sum()), 1e-12)) for h in (color, texture, luminance)]
+    return np.concatenate(parts)
+
+def global_descriptor(img, size=ORDER_THUMB_SIZE):
     """
-    Main entry point.
+    Cheap descriptors of an image's border bands, for finding its likely
+    neighbours.
     
-    TASKS:
-        1. Load images with adaptive resizing
-        2. Detect SIFT features
-        3. Stitch sequentially with exposure matching
-        4. Save final panorama
+    ALGORITHM:
+        1. Downscale to a size × size thumbnail
+        2. Split off the left, right, top and bottom thirds (where an
+           overlap with a neighbour sits)
+        3. Per band: hue/saturation (16 × 8), gradient-orientation (16,
+           magnitude weighted) and luminance (16) histograms, each
+           square-root normalized (Hellinger) so L2 distance compares
+           the distributions
+    
+    The histograms do not depend on where content sits inside a band, so
+    the matching bands of two neighbours stay close although they are
+    shifted against each other.
+    
+    RETURNS:
+        (4, 160) float32 array, one row per band (left, right, top, bottom)
+    """
+    thumb = cv2.resize(img, (size, size), interpolation=cv2.INTER_AREA)
+    third = max(1, size // 3)
+    bands = (thumb[:, :third], thumb[:, -third:], thumb[:third], thumb[-third:])
+    return np.stack([_thumbnail_histograms(band) for band in bands]).astype(np.float32)
+
+def candidate_pairs(global_descriptors, k=ORDER_NEIGHBOURS):
+    """
+    Likely overlapping pairs: each image with the k images whose border
+    bands are nearest to one of its own (FLANN KD-tree over all bands),
+    symmetrized.
+    
+    PARAMETERS:
+        global_descriptors: Per-image band descriptors (global_descriptor)
+        k: Neighbours per image (ORDER_NEIGHBOURS)
+    
+    RETURNS:
+        Sorted list of (i, j) pairs, i < j (all pairs when there are at
+        most k + 1 images)
+    """
+    n = len(global_descriptors)
+    if n <= k + 1:
+        return [(i, j) for i in range(n) for j in range(i + 1, n)]
+    n_bands = len(global_descriptors[0])
+    data = np.ascontiguousarray(np.concatenate(global_descriptors), dtype=np.float32)
+    owner = np.repeat(np.arange(n), n_bands)
+    index = cv2.flann_Index(data, dict(algorithm=FLANN_INDEX_KDTREE, trees=4))
+    # Band neighbours per band; own bands and repeat hits on one image are skipped
+    idx, dist = index.knnSearch(data, min(len(data), n_bands * (k + 2)), params=dict(checks=128))
+    
+    pairs = set()
+    for i in range(n):
+        rows = slice(i * n_bands, (i + 1) * n_bands)
+        found = idx[rows].ravel()
+        valid = found >= 0
+        by_distance = owner[found[valid]][np.argsort(dist[rows].ravel()[valid], kind="stable")]
+        nearest = []
+        for j in by_distance:
+            if j != i and j not in nearest:
+                nearest.append(j)
+                if len(nearest) == k:
+                    break
+        pairs.update((min(i, int(j)), max(i, int(j))) for j in nearest)
+    return sorted(pairs)
+
+def _ordered_groups(n_images, constraints, tolerance):
+    """
+    Connected groups of linked images, each sorted by solved x position.
+    
+    ALGORITHM:
+        1. Connected groups of the link graph
+        2. Maximum spanning tree weighted by inlier count: positions are
+           chained from each group's first image along the strongest links
+        3. Links that disagree with the tree positions by more than
+           tolerance are dropped; the rest are solved together
+           (solve_global_translations) and each group sorted by x
+    
+    PARAMETERS:
+        n_images: Number of images
+        constraints: List of (i, j, dx, dy, inliers) links, one per pair
+        tolerance: Largest disagreement (pixels) with the tree positions
+    
+    RETURNS:
+        groups: List of index lists, largest group first
+        n_dropped: Links dropped as inconsistent with the tree
+    """
+    links = np.array([(i, j) for i, j, *_ in constraints], dtype=np.intp).reshape(-1, 2)
+    inliers = np.array([c[4] for c in constraints], dtype=np.float64)
+    adjacency = coo_matrix((np.ones(len(links)), (links[:, 0], links[:, 1])),
+                           shape=(n_images, n_images))
+    n_groups, labels = connected_components(adjacency, directed=False)
+    
+    # Maximum spanning tree: minimum over costs that fall as inliers rise (all > 0)
+    cost = inliers.max() + 1.0 - inliers if len(inliers) else inliers
+    tree = minimum_spanning_tree(coo_matrix((cost, (links[:, 0], links[:, 1])),
+                                            shape=(n_images, n_images)).tocsr())
+    offsets = {}
+    for i, j, dx, dy, _ in constraints:
+        offsets[i, j] = np.array([dx, dy])
+        offsets[j, i] = -offsets[i, j]
+    seed = np.zeros((n_images, 2))
+    for g in range(n_groups):
+        members = np.flatnonzero(labels == g)
+        if len(members) > 1:
+            visited, parents = breadth_first_order(tree, members[0], directed=False)
+            for m in visited[1:]:
+                seed[m] = seed[parents[m]] + offsets[parents[m], m]
+    
+    consistent = [c for c in constraints
+                  if np.hypot(*(seed[c[1]] - seed[c[0]] - c[2:4])) <= tolerance]
+    groups = []
+    for g in range(n_groups):
+        members = np.flatnonzero(labels == g)
+        if len(members) > 1:
+            local = {int(m): pos for pos, m in enumerate(members)}
+            sub = [(local[i], local[j], dx, dy, w) for i, j, dx, dy, w in consistent if i in local]
+            positions, _ = solve_global_translations(len(members), sub, outlier_px=GLOBAL_OUTLIER_PX)
+            members = members[np.argsort(positions[:, 0], kind="stable")]
+        groups.append([int(m) for m in members])
+    groups.sort(key=lambda members: (-len(members), min(members)))
+    return groups, len(constraints) - len(consistent)
+
+def order_images(images, keypoints=None, descriptors=None, feature_config=None,
+                 k=ORDER_NEIGHBOURS, min_matches=ORDER_MIN_MATCHES, min_inliers=ORDER_MIN_INLIERS,
+                 min_inlier_ratio=ORDER_MIN_INLIER_RATIO, extract_kwargs=None, seed=None):
+    """
+    Recover left-to-right order for an unordered image set.
+    
+    ALGORITHM:
+        1. Border-band descriptors per image from a thumbnail (global_descriptor)
+        2. Candidate pairs from a nearest-neighbour index over those
+           descriptors (candidate_pairs): about k × n pairs instead of n²/2
+        3. Feature matching and translation estimation on the candidate
+           pairs only. A pair links its images only with at least
+           min_matches matches, min_inliers translation inliers making up
+           at least min_inlier_ratio of the matches, and a shift that
+           leaves the images overlapping
+        4. Per connected group of images, seed positions from a maximum
+           spanning tree over the links weighted by inliers, drop links
+           inconsistent with it (ORDER_TREE_TOLERANCE), solve the rest
+           (solve_global_translations) and sort the group by x
+        5. If the candidates left several groups, match the first and last
+           image of each group against those of the others and regroup;
+           groups that still do not link follow each other, largest first
+    
+    PARAMETERS:
+        images: Registration images (proxies), in any order
+        keypoints, descriptors: Features of images (None = extract)
+        feature_config: Feature engine config or name (None = FEATURE_ENGINE)
+        k: Nearest neighbours per image (ORDER_NEIGHBOURS)
+        min_matches: Matches needed to link a pair (ORDER_MIN_MATCHES)
+        min_inliers: Translation inliers needed to link a pair (ORDER_MIN_INLIERS)
+        min_inlier_ratio: Inliers / matches needed to link a pair (ORDER_MIN_INLIER_RATIO)
+        extract_kwargs: Options for extract_features (n_workers, use_cache,
+                        cache_dir; None = module defaults)
+        seed: RANSAC seed (None = RANSAC_SEED)
+    
+    RETURNS:
+        order: List of input indices in stitching order
+    """
+    n_images = len(images)
+    if n_images < 3:
+        return list(range(n_images))
+    if keypoints is None or descriptors is None:
+        keypoints, descriptors = extract_features(images, feature_config=feature_config,
+                                                  **(extract_kwargs or {}))
+    
+    _log("\nOrdering images...")
+    _seed_opencv(seed)
+    with METRICS.stage("global_descriptors", images=n_images):
+        pairs = candidate_pairs([global_descriptor(img) for img in images], k)
+    
+    indices = DescriptorIndexCache(feature_config)
+    constraints = []
+    tried = set()
+    tolerance = ORDER_TREE_TOLERANCE * float(np.median([img.shape[1] for img in images]))
+    
+    def link(pairs):
+        for i, j in pairs:
+            tried.add((i, j))
+            with METRICS.stage("register_candidate", pair=(i, j)):
+                index2 = None
+                if descriptors[j] is not None and len(descriptors[j]) >= 2:
+                    index2 = indices.get(j, descriptors[j])
+                T, n_matches, n_inliers = _pair_translation(
+                    keypoints[i], keypoints[j], descriptors[i], descriptors[j], feature_config,
+                    index2=index2, min_matches=min_matches, min_inliers=min_inliers,
+                    min_inlier_ratio=min_inlier_ratio, seed=seed)
+                METRICS.annotate(matches=n_matches, inliers=n_inliers)
+            if T is None:
+                continue
+            dx, dy = -float(T[0, 2]), -float(T[1, 2])
+            # A shift of a whole image width (or height) leaves nothing overlapping
+            if (abs(dx) >= min(images[i].shape[1], images[j].shape[1])
+                    or abs(dy) >= min(images[i].shape[0], images[j].shape[0])):
+                continue
+            constraints.append((i, j, dx, dy, float(n_inliers)))
+    
+    link(pairs)
+    groups, n_dropped = _ordered_groups(n_images, constraints, tolerance)
+    _log(f"  {len(pairs)} candidate pair(s), {len(constraints)} linked "
+         f"({n_dropped} inconsistent), {len(groups)} group(s)")
+    
+    if len(groups) > 1:
+        ends = [(g, m) for g, members in enumerate(groups) for m in {members[0], members[-1]}]
+        bridges = sorted({(min(a, b), max(a, b)) for ga, a in ends for gb, b in ends
+                          if ga < gb} - tried)
+        link(bridges)
+        groups, n_dropped = _ordered_groups(n_images, constraints, tolerance)
+        _log(f"  {len(bridges)} bridging pair(s), {n_dropped} inconsistent link(s), {len(groups)} group(s)")
+        pairs = pairs + bridges
+    indices.clear()
+    
+    if len(groups) > 1:
+        _log(f"  ⚠️  {len(groups)} unconnected group(s); groups are stitched one after another")
+    METRICS.count("order_candidate_pairs", len(pairs))
+    METRICS.count("order_groups", len(groups))
+    return [m for members in groups for m in members]
+
+class FootprintIndex:
+    """
+    Uniform-grid spatial hash of axis-aligned tile footprints.
+    
+    Each footprint is registered in every bucket it touches; a query only
+    looks at the buckets its box touches. With buckets about one tile in
+    size every tile lands in a handful of buckets, so finding all
+    overlapping pairs costs O(n) instead of O(n²).
+    """
+    
+    def __init__(self, cell_size):
+        self.cell_size = float(cell_size)
+        self.boxes = {}
+        self.buckets = {}
+    
+    def _cells(self, box):
+        x0, y0, x1, y1 = box
+        c = self.cell_size
+        for cy in range(int(np.floor(y0 / c)), int(np.floor(y1 / c)) + 1):
+            for cx in range(int(np.floor(x0 / c)), int(np.floor(x1 / c)) + 1):
+                yield cx, cy
+    
+    def insert(self, key, box):
+        """Add a footprint (x0, y0, x1, y1)."""
+        self.boxes[key] = box
+        for cell in self._cells(box):
+            self.buckets.setdefault(cell, []).append(key)
+    
+    def query(self, box):
+        """Keys of footprints intersecting box."""
+        x0, y0, x1, y1 = box
+        found = set()
+        for cell in self._cells(box):
+            for key in self.buckets.get(cell, ()):
+                if key in found:
+                    continue
+                bx0, by0, bx1, by1 = self.boxes[key]
+                if bx0 < x1 and x0 < bx1 and by0 < y1 and y0 < by1:
+                    found.add(key)
+        return found
+    
+    def overlapping_pairs(self):
+        """All (i, j) pairs (i < j) of intersecting footprints."""
+        pairs = []
+        for i, box in self.boxes.items():
+            pairs.extend((i, j) for j in self.query(box) if j > i)
+        return sorted(pairs)
+
+def grid_positions(n_images, grid_shape, tile_w, tile_h, overlap=GRID_EXPECTED_OVERLAP,
+                   serpentine=False):
+    """
+    Initial tile positions for a row × column grid (row-major order).
+    
+    PARAMETERS:
+        n_images: Number of tiles
+        grid_shape: (rows, cols)
+        tile_w, tile_h: Tile size (pixels)
+        overlap: Expected overlap fraction between neighbours (GRID_EXPECTED_OVERLAP)
+        serpentine: Odd rows were scanned right to left (False)
+    
+    RETURNS:
+        (n_images, 2) float64 array of top-left (x, y) positions
+    """
+    rows, cols = grid_shape
+    if n_images > rows * cols:
+        raise ValueError(f"{n_images} images do not fit a {rows}x{cols} grid")
+    positions = np.zeros((n_images, 2))
+    for k in range(n_images):
+        r, c = divmod(k, cols)
+        if serpentine and r % 2 == 1:
+            c = cols - 1 - c
+        positions[k] = (c * tile_w * (1 - overlap), r * tile_h * (1 - overlap))
+    return positions
+
+def stitch_grid(images, positions=None, grid_shape=None, render_images=None, keypoints=None,
+                descriptors=None, overlap=GRID_EXPECTED_OVERLAP, serpentine=False,
+                feature_config=None, out_path=None, return_positions=False, extract_kwargs=None,
+                seed=None):
     """
-    folder = r"C:\Users\dhirender.pandey\meat cross-section stitching\nature (code, image, output)\nature_images"
-    output = r"C:\Users\dhirender.pandey\meat cross-section stitching\nature (code, image, output)\nature_images output\panorama_sequential.jpg"
+    Stitch a 2D mosaic of tiles from known or estimated positions.
     
-    print("Loading images with adaptive resizing...")
-    images, filenames = load_images_from_folder(folder, use_adaptive_resize=True)
-    print(f"Loaded {len(images)} images")
+    ALGORITHM:
+        1. Initial positions: given, or laid out from grid_shape and the
+           expected overlap (grid_positions)
+        2. Index the footprints, grown by GRID_POSITION_TOLERANCE, in a
+           spatial hash (FootprintIndex); only pairs whose footprints
+           overlap by at least GRID_MIN_OVERLAP are matched, so the pair
+           count grows linearly with the tile count
+        3. Translation per pair from feature matches (same estimator as
+           stitch_sequential); offsets far from the prior are rejected
+        4. Solve all positions together (solve_global_translations), with
+           weak priors keeping unmatched tiles at their initial positions
+        5. Render with distance-weighted merging (intelligent_merge)
+    
+    PARAMETERS:
+        images: Registration images in row-major order (proxies when resized)
+        positions: (n, 2) initial top-left positions in render pixels
+                   (None = derive from grid_shape)
+        grid_shape: (rows, cols), used when positions is None
+        render_images: Optional full-resolution versions of images
+        keypoints, descriptors: Features of images (None = extract)
+        overlap: Expected overlap fraction for grid_shape layouts
+        serpentine: Odd rows scanned right to left (grid_shape layouts)
+        feature_config: Feature engine config or name (None = FEATURE_ENGINE)
+        out_path: Merge out of core into this .npy file (see intelligent_merge)
+        return_positions: Also return the solved positions (False)
+        extract_kwargs: Options for extract_features (n_workers, use_cache,
+                        cache_dir; None = module defaults)
+        seed: RANSAC and exposure sampling seed (None = RANSAC_SEED)
+    
+    RETURNS:
+        Mosaic image
+        positions: (n, 2) solved top-left positions (only if return_positions)
+    """
+    if render_images is None:
+        render_images = images
+    _seed_opencv(seed)
+    n_images = len(images)
+    scales = [(p.shape[1] / r.shape[1], p.shape[0] / r.shape[0])
+              for p, r in zip(images, render_images)]
+    tile_w = max(img.shape[1] for img in render_images)
+    tile_h = max(img.shape[0] for img in render_images)
+    
+    if positions is None:
+        if grid_shape is None:
+            raise ValueError("stitch_grid needs positions or grid_shape")
+        positions = grid_positions(n_images, grid_shape, tile_w, tile_h, overlap, serpentine)
+    prior = np.asarray(positions, dtype=np.float64)
+    
+    if keypoints is None or descriptors is None:
+        _log("\nDetecting features...")
+        keypoints, descriptors = extract_features(images, feature_config=feature_config,
+                                                  **(extract_kwargs or {}))
+    
+    # Spatial index of the (tolerance-grown) footprints
+    _log("\nFinding overlapping tiles...")
+    tol_x, tol_y = GRID_POSITION_TOLERANCE * tile_w, GRID_POSITION_TOLERANCE * tile_h
+    index = FootprintIndex(max(tile_w, tile_h))
+    for k, img in enumerate(render_images):
+        h, w = img.shape[:2]
+        x, y = prior[k]
+        index.insert(k, (x - tol_x, y - tol_y, x + w + tol_x, y + h + tol_y))
+    
+    candidates = []
+    for i, j in index.overlapping_pairs():
+        (hi, wi), (hj, wj) = render_images[i].shape[:2], render_images[j].shape[:2]
+        dx, dy = prior[j] - prior[i]
+        ov_w = min(wi, dx + wj) - max(0.0, dx)
+        ov_h = min(hi, dy + hj) - max(0.0, dy)
+        if ov_w <= 0 or ov_h <= 0:
+            continue
+        if ov_w * ov_h >= GRID_MIN_OVERLAP * min(wi * hi, wj * hj):
+            candidates.append((i, j))
+    _log(f"  {len(candidates)} candidate pair(s) for {n_images} tiles")
+    METRICS.count("grid_candidate_pairs", len(candidates))
+    
+    # Pairwise translations (render pixels), checked against the prior
+    indices = DescriptorIndexCache(feature_config)
+    constraints = []
+    for i, j in candidates:
+        with METRICS.stage("register", pair=(i, j)):
+            index2 = None
+            if descriptors[j] is not None and len(descriptors[j]) >= 2:
+                index2 = indices.get(j, descriptors[j])
+            T, n_matches, _ = _pair_translation(keypoints[i], keypoints[j], descriptors[i], descriptors[j],
+                                                feature_config, index2=index2, seed=seed)
+            METRICS.annotate(matches=n_matches)
+            if T is None:
+                continue
+            T = rescale_transform(T, scales[i], scales[j])
+            d = -np.array([T[0, 2], T[1, 2]], dtype=np.float64)
+            if abs(d[0] - (prior[j, 0] - prior[i, 0])) > 2 * tol_x or \
+               abs(d[1] - (prior[j, 1] - prior[i, 1])) > 2 * tol_y:
+                METRICS.annotate(rejected=True)
+                continue
+            constraints.append((i, j, d[0], d[1], 1.0))
+    indices.clear()
+    n_matched = len(constraints)
+    
+    # Weak priors: every tile relative to tile 0
+    for k in range(1, n_images):
+        constraints.append((0, k, prior[k, 0] - prior[0, 0], prior[k, 1] - prior[0, 1], 1e-4))
+    
+    with METRICS.stage("global_alignment"):
+        outlier_px = GLOBAL_OUTLIER_PX / min(min(s) for s in scales)
+        solved, residuals = solve_global_translations(n_images, constraints, outlier_px=outlier_px)
+        max_residual = float(residuals[:n_matched].max()) if n_matched else 0.0
+        METRICS.annotate(constraints=n_matched, max_residual=max_residual)
+    solved += prior[0]
+    _log(f"  {n_matched} matched pair(s), max residual: {max_residual:.2f}px")
+    
+    # Render: translate every tile into a canvas covering all footprints
+    x_min, y_min = solved.min(axis=0)
+    out_w = int(np.ceil(max(solved[k, 0] + img.shape[1] for k, img in enumerate(render_images)) - x_min))
+    out_h = int(np.ceil(max(solved[k, 1] + img.shape[0] for k, img in enumerate(render_images)) - y_min))
+    transforms = [np.array([[1, 0, x - x_min], [0, 1, y - y_min], [0, 0, 1]], dtype=np.float64)
+                  for x, y in solved]
+    _log(f"\nMerging {n_images} tiles into {out_w}x{out_h}...")
+    with METRICS.stage("merge", tiles=n_images):
+        mosaic = intelligent_merge(render_images, transforms, out_h, out_w, out_path=out_path,
+                                   seed=seed)
+    
+    if return_positions:
+        return mosaic, solved
+    return mosaic
+
+@dataclass(frozen=True)
+class StitcherConfig:
+    """
+    Settings for a Stitcher (defaults follow the module constants).
+    
+    feature_engine accepts an engine name ("sift", "orb", "akaze") or a
+    config instance (SIFTConfig, ORBConfig, AKAZEConfig).
+    """
+    feature_engine: object = FEATURE_ENGINE
+    registration: str = REGISTRATION_MODE
+    adaptive_resize: bool = True          # register on resized proxies
+    min_width: int = MIN_WIDTH
+    max_dim: int = MAX_DIM
+    render_full_resolution: bool = RENDER_FULL_RESOLUTION
+    global_alignment: bool = GLOBAL_ALIGNMENT     # sequential global solve (see GLOBAL_ALIGNMENT)
+    reorder: bool = False                 # recover scan order (order_images)
+    overlap_features: bool = OVERLAP_FEATURES   # features only in the overlap bands
+    feature_workers: int = 1              # >1 starts a process pool per call
+    use_feature_cache: bool = False       # keyed by proxy pixels for in-memory input
+    feature_cache_dir: str = FEATURE_CACHE_DIR
+    seed: int = None                      # RANSAC/exposure sampling seed (None = RANSAC_SEED)
+    verbose: bool = False                 # console diagnostics
+    collect_metrics: bool = True          # fill StitchResult.metrics
+
+@dataclass
+class StitchResult:
+    """Output of Stitcher.stitch."""
+    panorama: np.ndarray
+    transforms: list         # image i-1 -> i (render resolution); None = not registered
+    overlaps: list           # blend overlap width per image (0 for the first)
+    metrics: MetricsRecorder
+    order: list = None       # input indices in stitching order (None = as given)
+
+class Stitcher:
+    """
+    Library entry point: stitch in-memory images in a long-lived process.
+    
+    The detector for the configured engine is created once (get_detector)
+    and reused by every call, as are the multi-band blend buffers, so a
+    worker pays OpenCV/SciPy start-up and detector construction once.
+    Nothing is printed unless config.verbose is set, and nothing is read
+    from or written to disk unless the feature cache is enabled.
+    
+    USAGE:
+        stitcher = Stitcher(StitcherConfig(feature_engine="orb"))
+        result = stitcher.stitch([img1, img2, img3])
+        cv2.imwrite("pano.jpg", result.panorama)
+        result.metrics.write_jsonl("run.jsonl")
+    
+    One stitch() call at a time per process (module diagnostics and metrics
+    state are swapped for the duration of the call).
+    """
+    
+    def __init__(self, config=None):
+        self.config = config if config is not None else StitcherConfig()
+        self.feature_config = resolve_feature_config(self.config.feature_engine)
+        get_detector(self.feature_config)    # warm the detector now
+    
+    def _extract_kwargs(self):
+        """extract_features options from the config, for every extraction of a run."""
+        config = self.config
+        return dict(n_workers=config.feature_workers, use_cache=config.use_feature_cache,
+                    cache_dir=config.feature_cache_dir)
+    
+    def _proxy(self, img):
+        if not self.config.adaptive_resize:
+            return img
+        return adaptive_resize(img, min_width=self.config.min_width, max_dim=self.config.max_dim,
+                               report_keypoints=False)
+    
+    def stitch(self, images):
+        """
+        Stitch a sequence of overlapping images (left to right).
+        
+        PARAMETERS:
+            images: List of BGR uint8 arrays, in scan order (any order
+                    when config.reorder is set)
+        
+        RETURNS:
+            StitchResult with the panorama, pairwise transforms, overlaps
+            (in stitching order) and the run's metrics
+        """
+        if len(images) < 2:
+            raise ValueError("Need at least 2 images")
+        config = self.config
+        metrics = MetricsRecorder(enabled=config.collect_metrics)
+        
+        with _run_context(config.verbose, metrics):
+            with METRICS.stage("resize", images=len(images)):
+                proxies = [self._proxy(img) for img in images]
+            
+            extract_kwargs = self._extract_kwargs()
+            keypoints, descriptors = None, None
+            if (config.registration != "phase" and not config.overlap_features) or config.reorder:
+                with METRICS.stage("extract_features", images=len(images)):
+                    keypoints, descriptors = extract_features(
+                        proxies, feature_config=self.feature_config, **extract_kwargs)
+            
+            order = None
+            if config.reorder:
+                with METRICS.stage("order_images", images=len(images)):
+                    order = order_images(proxies, keypoints, descriptors, feature_config=self.feature_config,
+                                         extract_kwargs=extract_kwargs, seed=config.seed)
+                images = [images[k] for k in order]
+                proxies = [proxies[k] for k in order]
+                keypoints = [keypoints[k] for k in order]
+                descriptors = [descriptors[k] for k in order]
+            
+            render_images = images if config.render_full_resolution else None
+            with METRICS.stage("stitch_sequential", images=len(images)):
+                pano, transforms, overlaps = stitch_sequential(
+                    proxies, keypoints, descriptors, render_images=render_images,
+                    registration=config.registration, feature_config=self.feature_config,
+                    return_transforms=True, global_align=config.global_alignment,
+                    overlap_features=config.overlap_features, extract_kwargs=extract_kwargs,
+                    seed=config.seed)
+        
+        return StitchResult(panorama=pano, transforms=transforms, overlaps=overlaps, metrics=metrics,
+                            order=order)
+    
+    def stitch_grid(self, images, grid_shape=None, positions=None, overlap=GRID_EXPECTED_OVERLAP,
+                    serpentine=False):
+        """
+        Stitch a 2D mosaic (see stitch_grid).
+        
+        PARAMETERS:
+            images: List of BGR uint8 arrays in row-major order
+            grid_shape: (rows, cols), used when positions is None
+            positions: (n, 2) initial top-left positions (full-resolution pixels)
+            overlap: Expected overlap fraction between grid neighbours
+            serpentine: Odd rows scanned right to left
+        
+        RETURNS:
+            StitchResult; transforms are tile -> mosaic translations and
+            overlaps is empty
+        """
+        config = self.config
+        metrics = MetricsRecorder(enabled=config.collect_metrics)
+        
+        with _run_context(config.verbose, metrics):
+            with METRICS.stage("resize", images=len(images)):
+                proxies = [self._proxy(img) for img in images]
+            with METRICS.stage("extract_features", images=len(images)):
+                keypoints, descriptors = extract_features(
+                    proxies, feature_config=self.feature_config, **self._extract_kwargs())
+            render_images = images if config.render_full_resolution else proxies
+            if positions is not None and not config.render_full_resolution:
+                scale = proxies[0].shape[1] / images[0].shape[1]
+                positions = np.asarray(positions, dtype=np.float64) * scale
+            with METRICS.stage("stitch_grid", images=len(images)):
+                mosaic, solved = stitch_grid(
+                    proxies, positions=positions, grid_shape=grid_shape, render_images=render_images,
+                    keypoints=keypoints, descriptors=descriptors, overlap=overlap,
+                    serpentine=serpentine, feature_config=self.feature_config, return_positions=True,
+                    seed=config.seed)
+        
+        origin = solved.min(axis=0)
+        transforms = [np.array([[1, 0, x - origin[0]], [0, 1, y - origin[1]], [0, 0, 1]]) for x, y in solved]
+        return StitchResult(panorama=mosaic, transforms=transforms, overlaps=[], metrics=metrics)
+
+class StreamingStitcher:
+    """
+    Incremental sequential stitcher: frames are registered and blended as
+    they arrive instead of after the whole scan is loaded.
+    
+    Each frame is registered against the previous one only (same pairwise
+    logic as stitch_sequential), exposure-matched against the previous tile
+    as blended, and blended into a canvas that grows with amortized
+    doubling. Only the previous frame's proxy and features are kept.
+    
+    With preview_max_width set, a downscaled preview is kept up to date
+    incrementally: only the columns a frame changed are resized, so the
+    per-frame cost does not grow with the scan length.
+    
+    USAGE:
+        stream = StreamingStitcher(preview_max_width=2048)
+        for img in frames:
+            stream.add(img)
+            cv2.imwrite("preview.jpg", stream.preview())
+    """
+    
+    def __init__(self, registration=REGISTRATION_MODE, feature_config=None,
+                 render_full_resolution=RENDER_FULL_RESOLUTION, seed=None, preview_max_width=None):
+        self.registration = registration
+        self.seed = seed     # RANSAC and exposure sampling seed (None = RANSAC_SEED)
+        self.preview_max_width = preview_max_width    # None = no downscaled preview
+        self.feature_config = resolve_feature_config(feature_config)
+        self.render_full_resolution = render_full_resolution
+        self.canvas = None
+        self.x_end = 0
+        self.filled_h = 0
+        self.n_frames = 0
+        self.transforms = []
+        self._prev = None    # previous frame: proxy, render shape, scale, start column, kp, des
+        self._preview = None          # downscaled canvas (preview_max_width only)
+        self._preview_shape = (0, 0)  # valid rows, columns of the preview
+        self.preview_factor = 1       # one preview pixel = factor × factor canvas pixels
+    
+    def _ensure_capacity(self, h, w):
+        """Grow the canvas to at least h x w, doubling the width to amortize copies."""
+        cap_h, cap_w = self.canvas.shape[:2]
+        if h <= cap_h and w <= cap_w:
+            return
+        new_h = max(h, cap_h)
+        new_w = max(w, 2 * cap_w) if w > cap_w else cap_w
+        grown = np.zeros((new_h, new_w, 3), dtype=self.canvas.dtype)
+        METRICS.alloc("canvas", grown.nbytes)
+        grown[:self.filled_h, :self.x_end] = self.canvas[:self.filled_h, :self.x_end]
+        self.canvas = grown
+    
+    def _update_preview(self, x0):
+        """
+        Bring the preview up to date after a frame changed canvas columns x0 on.
+        
+        The preview is the canvas averaged over factor × factor blocks
+        (INTER_AREA), the factor doubling whenever the panorama outgrows
+        preview_max_width. Only the changed columns are resized; a factor
+        change halves the existing preview instead of resizing the canvas.
+        """
+        max_w = self.preview_max_width
+        k = self.preview_factor
+        while self.x_end // k > max_w:
+            k *= 2
+        if k != self.preview_factor and self._preview is not None:
+            step = k // self.preview_factor
+            rows, cols = (n // step for n in self._preview_shape)
+            coarse = None
+            if rows and cols:
+                coarse = cv2.resize(self._preview[:rows * step, :cols * step], (cols, rows),
+                                    interpolation=cv2.INTER_AREA)
+            self._preview[:] = 0
+            if coarse is not None:
+                self._preview[:rows, :cols] = coarse
+            self._preview_shape = (rows, cols)
+            x0 = min(x0, cols * k)
+        self.preview_factor = k
+        
+        rows, cols = self.filled_h // k, self.x_end // k
+        if self._preview is None or rows > self._preview.shape[0]:
+            grown = np.zeros((rows, max_w, 3), dtype=self.canvas.dtype)
+            METRICS.alloc("preview", grown.nbytes)
+            if self._preview is not None:
+                grown[:self._preview.shape[0]] = self._preview
+            self._preview = grown
+        if rows != self._preview_shape[0]:
+            x0 = 0    # new block rows also cover older columns
+        x0 = x0 // k * k
+        if rows and cols * k > x0:
+            self._preview[:rows, x0 // k:cols] = cv2.resize(
+                self.canvas[:rows * k, x0:cols * k], (cols - x0 // k, rows), interpolation=cv2.INTER_AREA)
+        self._preview_shape = (rows, cols)
+    
+    def _features(self, frame):
+        """Detect (once) and return the frame's keypoints and descriptors."""
+        if frame["kp"] is None:
+            with METRICS.stage("detect_features", images=1, workers=1):
+                frame["kp"], frame["des"] = detect_features(frame["proxy"], self.feature_config)
+        return frame["kp"], frame["des"]
+    
+    def _register(self, prev, cur):
+        """Transform and overlap width of cur relative to prev (render resolution)."""
+        img_w = cur["shape"][1]
+        if self.registration == "phase":
+            T_phase, response = estimate_translation_phase_correlation(prev["proxy"], cur["proxy"])
+            _log(f"  Phase correlation peak: {response:.3f}")
+            METRICS.annotate(phase_response=float(response))
+            if response < PHASE_MIN_RESPONSE:
+                _log(f"  ⚠️  Weak correlation peak, falling back to SIFT")
+            else:
+                ncc = overlap_correlation(prev["proxy"], cur["proxy"], T_phase)
+                METRICS.annotate(phase_ncc=ncc)
+                if ncc >= PHASE_MIN_OVERLAP_NCC:
+                    T = rescale_transform(T_phase, prev["scale"], cur["scale"])
+                    METRICS.annotate(transform="phase", shift=float(T[0, 2]))
+                    return T, int(abs(T[0, 2]) * 0.7)
+                _log(f"  ⚠️  Overlap does not line up (NCC {ncc:.3f}), falling back to SIFT")
+        _seed_opencv(self.seed)
+        kp1, des1 = self._features(prev)
+        kp2, des2 = self._features(cur)
+        return register_pair(kp1, kp2, des1, des2, self.x_end, img_w,
+                             prev["scale"], cur["scale"], feature_config=self.feature_config,
+                             seed=self.seed)
+    
+    def add(self, img):
+        """
+        Register and blend one new frame.
+        
+        PARAMETERS:
+            img: Full-resolution BGR frame
+        
+        RETURNS:
+            T: Transform of the frame relative to the previous one
+               (identity for the first frame, None if registration failed)
+        """
+        proxy = adaptive_resize(img, report_keypoints=False)
+        render = img if self.render_full_resolution else proxy
+        h, w = render.shape[:2]
+        cur = dict(proxy=proxy, shape=(h, w), kp=None, des=None,
+                   scale=(proxy.shape[1] / w, proxy.shape[0] / h))
+        self.n_frames += 1
+        
+        if self._prev is None:
+            # First frame: room for a few more frames before the first grow
+            self.canvas = np.zeros((h, 4 * w, 3), dtype=render.dtype)
+            METRICS.alloc("canvas", self.canvas.nbytes)
+            self.canvas[:h, :w] = render
+            self.x_end, self.filled_h = w, h
+            cur["start"] = 0
+            self._prev = cur
+            if self.preview_max_width:
+                with METRICS.stage("preview_update"):
+                    self._update_preview(0)
+            T = np.eye(3)
+            self.transforms.append(T)
+            return T
+        
+        prev = self._prev
+        pair = self.n_frames - 1
+        with METRICS.stage("register", pair=pair):
+            T, overlap_width = self._register(prev, cur)
+            overlap_width = max(0, min(overlap_width, self.x_end, w))
+            METRICS.annotate(overlap=overlap_width)
+        
+        # Exposure against the previous tile as blended
+        with METRICS.stage("exposure", pair=pair):
+            if T is not None:
+                prev_h, prev_w = prev["shape"]
+                prev_tile = self.canvas[:prev_h, prev["start"]:prev["start"] + prev_w]
+                gamma = match_exposure_pair(prev_tile, render, T, seed=self.seed)
+            else:
+                gamma = 1.0
+            METRICS.annotate(gamma=gamma)
+            _log(f"  Exposure gamma: {gamma:.3f}")
+            render = apply_gamma_correction(render, gamma)
+        
+        self._ensure_capacity(max(self.filled_h, h), self.x_end + w - overlap_width)
+        cur["start"] = self.x_end - overlap_width
+        with METRICS.stage("blend", pair=pair, overlap=overlap_width):
+            self.x_end = blend_into_canvas(self.canvas, render, self.x_end, overlap_width,
+                                           filled_h=self.filled_h)
+        self.filled_h = max(self.filled_h, h)
+        if self.preview_max_width:
+            # The blend rewrites the overlap plus its context margin
+            with METRICS.stage("preview_update"):
+                self._update_preview(max(0, cur["start"] - BLEND_MARGIN))
+        
+        # Keep only what the next registration needs
+        prev.clear()
+        self._prev = cur
+        self.transforms.append(T)
+        return T
+    
+    def panorama(self):
+        """View of the panorama built so far (no copy)."""
+        if self.canvas is None:
+            return None
+        return self.canvas[:self.filled_h, :self.x_end]
+    
+    def preview(self):
+        """View of the preview (the panorama itself without preview_max_width)."""
+        if not self.preview_max_width:
+            return self.panorama()
+        if self._preview is None:
+            return None
+        rows, cols = self._preview_shape
+        return self._preview[:rows, :cols]
+
+def write_image_atomic(path, img):
+    """Write an image via a temporary file so readers never see a partial file."""
+    root, ext = os.path.splitext(path)
+    tmp_path = f"{root}.tmp{os.getpid()}{ext}"
+    if not cv2.imwrite(tmp_path, img):
+        raise IOError(f"Could not write image to {path}")
+    os.replace(tmp_path, path)
+
+def _write_tile(path, tile, ext, params):
+    """Encode one tile and write it (runs on a DZI worker thread)."""
+    ok, buf = cv2.imencode(ext, tile, params)
+    if not ok:
+        raise IOError(f"Could not encode tile {path}")
+    with open(path, "wb") as f:
+        f.write(buf.tobytes())
+
+def write_deep_zoom(img, path, tile_size=DZI_TILE_SIZE, overlap=DZI_OVERLAP, fmt=DZI_FORMAT,
+                    quality=DZI_QUALITY, workers=DZI_WORKERS):
+    """
+    Write an image as a Deep Zoom tile pyramid (<name>.dzi + <name>_files/).
+    
+    Viewers (OpenSeadragon and others) fetch only the tiles on screen at
+    the current zoom, so nothing decodes the full panorama.
+    
+    ALGORITHM:
+        1. Level max_level = full resolution, each lower level half the
+           size (rounded up), down to 1×1 at level 0
+        2. Walk a level one row of tiles at a time: the strip is read once
+           (memmap friendly), its tiles are encoded in parallel on a thread
+           pool, and meanwhile the strip is downsampled (INTER_AREA) into
+           the next level. An odd last row or column is replicated first,
+           so every pixel of the next level is an exact 2×2 average and
+           the result does not depend on the strip height (in-memory and
+           memmap inputs give the same tiles for any level size)
+        3. The next level is a 1/4-size buffer, memory-mapped next to the
+           tiles when the input is an np.memmap (see intelligent_merge
+           with out_path), so a panorama larger than RAM stays out of core
+        4. Write the .dzi descriptor last, so a complete descriptor means a
+           complete pyramid
+    
+    PARAMETERS:
+        img: Panorama (array or np.memmap)
+        path: Output .dzi path
+        tile_size: Tile edge in pixels, excluding overlap; even (DZI_TILE_SIZE)
+        overlap: Pixels shared with each neighbouring tile (DZI_OVERLAP)
+        fmt: Tile format, "jpg" or "png" (DZI_FORMAT)
+        quality: JPEG quality (DZI_QUALITY)
+        workers: Encoder threads (DZI_WORKERS)
+    
+    RETURNS:
+        Number of tiles written
+    """
+    if tile_size % 2:
+        raise ValueError("tile_size must be even (rows of a tile row halve exactly)")
+    tiles_dir = os.path.splitext(path)[0] + "_files"
+    h, w = img.shape[:2]
+    max_level = int(np.ceil(np.log2(max(h, w, 1))))
+    ext = "." + fmt
+    params = [cv2.IMWRITE_JPEG_QUALITY, int(quality)] if fmt in ("jpg", "jpeg") else []
+    out_of_core = isinstance(img, np.memmap)
+    
+    n_tiles = 0
+    level_img = img
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        for level in range(max_level, -1, -1):
+            lh, lw = level_img.shape[:2]
+            level_dir = os.path.join(tiles_dir, str(level))
+            os.makedirs(level_dir, exist_ok=True)
+            
+            next_img = None
+            if level > 0:
+                next_shape = ((lh + 1) // 2, (lw + 1) // 2) + level_img.shape[2:]
+                if out_of_core:
+                    next_img = np.lib.format.open_memmap(os.path.join(tiles_dir, f"level{level - 1}.npy"),
+                                                         mode="w+", dtype=level_img.dtype, shape=next_shape)
+                else:
+                    next_img = np.empty(next_shape, dtype=level_img.dtype)
+                    METRICS.alloc("dzi_level", next_img.nbytes)
+            
+            with METRICS.stage("dzi_level", level=level, shape=[lh, lw]):
+                for row, y in enumerate(range(0, lh, tile_size)):
+                    y0, y1 = max(0, y - overlap), min(lh, y + tile_size + overlap)
+                    strip = np.array(level_img[y0:y1])    # one read; a copy, not a view of the memmap
+                    jobs = [pool.submit(_write_tile, os.path.join(level_dir, f"{col}_{row}{ext}"),
+                                        strip[:, max(0, x - overlap):min(lw, x + tile_size + overlap)],
+                                        ext, params)
+                            for col, x in enumerate(range(0, lw, tile_size))]
+                    
+                    if next_img is not None:
+                        # tile_size rows of this level -> the matching rows of the next
+                        rows = strip[y - y0:min(lh, y + tile_size) - y0]
+                        t0, t1 = y // 2, (y + len(rows) + 1) // 2
+                        if len(rows) % 2 or lw % 2:
+                            rows = cv2.copyMakeBorder(rows, 0, len(rows) % 2, 0, lw % 2, cv2.BORDER_REPLICATE)
+                        next_img[t0:t1] = cv2.resize(rows, (next_img.shape[1], t1 - t0),
+                                                     interpolation=cv2.INTER_AREA).reshape(next_img[t0:t1].shape)
+                    
+                    for job in jobs:
+                        job.result()
+                    n_tiles += len(jobs)
+                METRICS.annotate(tiles=n_tiles)
+            
+            if out_of_core and level_img is not img:
+                scratch = level_img.filename
+                del level_img
+                os.remove(scratch)
+            level_img = next_img
+    
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                f'<Image xmlns="http://schemas.microsoft.com/deepzoom/2008" TileSize="{tile_size}" '
+                f'Overlap="{overlap}" Format="{fmt}">\n'
+                f'  <Size Width="{w}" Height="{h}"/>\n'
+                '</Image>\n')
+    os.replace(path + ".tmp", path)
+    return n_tiles
+
+def watch_folder(folder, output, preview_path=None, poll_interval=STREAM_POLL_INTERVAL,
+                 settle_time=STREAM_SETTLE_TIME, idle_timeout=STREAM_IDLE_TIMEOUT,
+                 preview_max_width=STREAM_PREVIEW_MAX_WIDTH):
+    """
+    Watch a folder and extend the panorama as new frames land in it.
+    
+    ALGORITHM:
+        1. Poll the folder for image files not yet stitched
+        2. A file is ready once its size and mtime have not changed for
+           settle_time seconds (the writer has finished) and it decodes
+        3. Ready files are added in filename order (StreamingStitcher.add)
+        4. After each frame, rewrite the preview atomically; the stitcher
+           keeps it downscaled to preview_max_width incrementally
+           (StreamingStitcher.preview), so a frame costs the same however
+           long the scan is
+        5. Stop after idle_timeout seconds without new frames (or Ctrl+C),
+           then crop and save the final panorama
+    
+    Frames must arrive in scan order: a file that sorts before an already
+    stitched one is appended at the end, not inserted.
+    
+    PARAMETERS:
+        folder: Watched input folder
+        output: Final panorama path
+        preview_path: Preview image path (default: <output>_preview.jpg)
+        poll_interval: Seconds between folder scans (STREAM_POLL_INTERVAL)
+        settle_time: Seconds a file must be unchanged (STREAM_SETTLE_TIME)
+        idle_timeout: Seconds without new frames before stopping
+                      (STREAM_IDLE_TIMEOUT, None = until interrupted)
+        preview_max_width: Preview width limit (STREAM_PREVIEW_MAX_WIDTH, None = full size)
+    
+    RETURNS:
+        summary: Dict with status, frame count, panorama shape and mean
+                 per-frame latency (seconds from file ready to preview written)
+    """
+    if preview_path is None:
+        preview_path = os.path.splitext(output)[0] + "_preview.jpg"
+    for path in (output, preview_path):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+    
+    stream = StreamingStitcher(preview_max_width=preview_max_width)
+    done = set()
+    seen = {}       # path -> (size, mtime, first time this signature was seen)
+    latencies = []
+    last_frame = time.monotonic()
+    _log(f"Watching {folder} (Ctrl+C to stop)...")
+    
+    try:
+        while True:
+            now = time.monotonic()
+            ready = []
+            for path in _image_paths(folder):
+                if path in done:
+                    continue
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                sig = (st.st_size, st.st_mtime)
+                if path not in seen or seen[path][:2] != sig:
+                    seen[path] = sig + (now,)
+                elif st.st_size > 0 and now - seen[path][2] >= settle_time:
+                    ready.append(path)
+            
+            for path in ready:
+                img = cv2.imread(path)
+                done.add(path)
+                seen.pop(path, None)
+                if img is None:
+                    _log(f"  ⚠️  Could not read {os.path.basename(path)}, skipped")
+                    continue
+                t = time.perf_counter()
+                _log(f"\nFrame {stream.n_frames + 1}: {os.path.basename(path)}")
+                stream.add(img)
+                with METRICS.stage("preview"):
+                    write_image_atomic(preview_path, stream.preview())
+                latencies.append(time.perf_counter() - t)
+                _log(f"  Panorama extent now: {(stream.filled_h, stream.x_end)} "
+                      f"({latencies[-1]:.2f}s)")
+                last_frame = time.monotonic()
+            
+            if idle_timeout is not None and time.monotonic() - last_frame >= idle_timeout:
+                _log(f"\nNo new frames for {idle_timeout}s, stopping")
+                break
+            if not ready:
+                time.sleep(poll_interval)
+    except KeyboardInterrupt:
+        _log("\nInterrupted, finishing panorama")
+    
+    summary = dict(input=folder, output=output, status="ok", frames=stream.n_frames,
+                   mean_latency=float(np.mean(latencies)) if latencies else None)
+    if stream.n_frames == 0:
+        summary["status"] = "skipped"
+        return summary
+    
+    _log("\nCropping black borders...")
+    pano = crop_black_borders(stream.panorama())
+    write_image_atomic(output, pano)
+    summary["shape"] = list(pano.shape)
+    _log(f"\n✓ Panorama saved to: {output}")
+    _log(f"Final panorama size: {pano.shape}")
+    return summary
+
+def stitch_folder(folder, output, feature_workers=FEATURE_WORKERS, grid_shape=None,
+                  grid_overlap=GRID_EXPECTED_OVERLAP, serpentine=False, unordered=False,
+                  overlap_features=OVERLAP_FEATURES):
+    """
+    Stitch one capture set from a folder and save the panorama.
+    
+    TASKS:
+        1. Load images with adaptive resizing (originals kept for rendering)
+        2. Detect features on the resized proxies
+        3. Recover the scan order when the filenames do not give it (unordered)
+        4. Stitch sequentially with exposure matching at full resolution
+           (or as a 2D mosaic when grid_shape is given)
+        5. Save final panorama (one image, or Deep Zoom tiles for .dzi)
+    
+    PARAMETERS:
+        folder: Input image folder
+        output: Output image path (.dzi = Deep Zoom tile pyramid, write_deep_zoom)
+        feature_workers: Worker processes for feature extraction
+        grid_shape: (rows, cols) for grid mosaics, images in row-major
+                    filename order (None = single left-to-right strip)
+        grid_overlap: Expected overlap fraction between grid neighbours
+        serpentine: Odd grid rows were scanned right to left
+        unordered: Filename order is not scan order; order the images by
+                   content first (order_images, sequential stitching only)
+        overlap_features: Detect and match only in the expected overlap
+                          bands (sequential stitching only)
+    
+    RETURNS:
+        summary: Dict with status, image count, panorama shape, per-stage
+                 timings (seconds) and the stitching order (unordered only)
+    """
+    timings = {}
+    summary = dict(input=folder, output=output, status="ok", timings=timings)
+    t_start = time.perf_counter()
+    
+    _log("Loading images with adaptive resizing...")
+    t = time.perf_counter()
+    with METRICS.stage("load_images"):
+        images, filenames, originals = load_images_from_folder(
+            folder, use_adaptive_resize=True, report_keypoints=not USE_FEATURE_CACHE,
+            return_originals=True)
+        METRICS.annotate(images=len(images))
+    timings["load"] = time.perf_counter() - t
+    summary["images"] = len(images)
+    _log(f"Loaded {len(images)} images")
     
     if len(images) < 2:
-        print("Need at least 2 images")
-        return
+        _log("Need at least 2 images")
+        summary["status"] = "skipped"
+        summary["reason"] = "need at least 2 images"
+        timings["total"] = time.perf_counter() - t_start
+        return summary
     
     # Detect features
-    print("\nDetecting features...")
-    keypoints = []
-    descriptors = []
+    t = time.perf_counter()
+    unordered = unordered and grid_shape is None
+    sequential = grid_shape is None and not unordered
+    extract_kwargs = dict(n_workers=feature_workers)
+    if (REGISTRATION_MODE == "phase" or overlap_features) and sequential:
+        # Phase correlation and overlap bands need no whole-image features;
+        # fallbacks detect on demand
+        keypoints, descriptors = None, None
+    else:
+        _log(f"\nDetecting features ({feature_workers} worker(s))...")
+        sources = []
+        for filename in filenames:
+            with open(os.path.join(folder, filename), "rb") as f:
+                sources.append(f.read())
+        resize_params = dict(min_width=MIN_WIDTH, max_dim=MAX_DIM)
+        with METRICS.stage("extract_features", images=len(images)):
+            keypoints, descriptors = extract_features(images, sources=sources, resize_params=resize_params,
+                                                      **extract_kwargs)
+        for i, kp in enumerate(keypoints):
+            _log(f"  Image {i+1}: {len(kp)} features")
+    timings["features"] = time.perf_counter() - t
+    
+    if unordered:
+        t = time.perf_counter()
+        with METRICS.stage("order_images", images=len(images)):
+            order = order_images(images, keypoints, descriptors, extract_kwargs=extract_kwargs)
+        images, originals, keypoints, descriptors = (
+            [seq[k] for k in order] for seq in (images, originals, keypoints, descriptors))
+        summary["order"] = [filenames[k] for k in order]
+        _log(f"  Order: {', '.join(summary['order'])}")
+        timings["order"] = time.perf_counter() - t
+    
+    # Stitch sequentially: register on resized proxies, render from originals
+    t = time.perf_counter()
+    render_images = originals if RENDER_FULL_RESOLUTION else None
+    if grid_shape is not None:
+        with METRICS.stage("stitch_grid", images=len(images)):
+            pano = stitch_grid(images, grid_shape=grid_shape, render_images=render_images,
+                               keypoints=keypoints, descriptors=descriptors,
+                               overlap=grid_overlap, serpentine=serpentine,
+                               extract_kwargs=extract_kwargs)
+    else:
+        with METRICS.stage("stitch_sequential", images=len(images)):
+            pano = stitch_sequential(images, keypoints, descriptors, render_images=render_images,
+                                     overlap_features=overlap_features, extract_kwargs=extract_kwargs)
+    timings["stitch"] = time.perf_counter() - t
+    summary["shape"] = list(pano.shape)
     
-    for i, img in enumerate(images):
-        kp, des = detect_features(img)
-        keypoints.append(kp)
-        descriptors.append(des)
-        print(f"  Image {i+1}: {len(kp)} features")
+    # Save
+    t = time.perf_counter()
+    out_dir = os.path.dirname(output)
+    if out_dir:
+        os.makedirs(out_dir, exist_ok=True)
+    with METRICS.stage("write"):
+        if output.lower().endswith(".dzi"):
+            summary["tiles"] = write_deep_zoom(pano, output)
+        else:
+            # Atomic, so an interrupted write never leaves a truncated file
+            # that is_up_to_date would take for a finished panorama
+            write_image_atomic(output, pano)
+    timings["write"] = time.perf_counter() - t
+    timings["total"] = time.perf_counter() - t_start
+    _log(f"\n✓ Panorama saved to: {output}")
+    _log(f"Final panorama size: {pano.shape}")
+    return summary
+
+def _image_paths(folder):
+    """Image files in a folder, in stitching order."""
+    return [os.path.join(folder, f) for f in sorted(os.listdir(folder))
+            if f.lower().endswith(IMAGE_EXTENSIONS)]
+
+def find_capture_sets(root, output_dir):
+    """
+    Capture sets under a root directory: every subfolder with 2+ images.
     
-    # Stitch sequentially
-    pano = stitch_sequential(images, keypoints, descriptors)
+    RETURNS:
+        List of (input_folder, output_path) pairs; panoramas are named
+        <output_dir>/<subfolder>.jpg
+    """
+    sets = []
+    for name in sorted(os.listdir(root)):
+        folder = os.path.join(root, name)
+        if os.path.isdir(folder) and len(_image_paths(folder)) >= 2:
+            sets.append((folder, os.path.join(output_dir, name + ".jpg")))
+    return sets
+
+def read_manifest(path, output_dir):
+    """
+    Capture sets listed in a manifest file.
     
-    # Save
-    cv2.imwrite(output, pano)
-    print(f"\n✓ Panorama saved to: {output}")
-    print(f"Final panorama size: {pano.shape}")
+    FORMAT (one set per line, '#' starts a comment):
+        input_folder
+        input_folder<TAB>output_path
+    
+    Sets without an output path go to <output_dir>/<folder name>.jpg.
+    Relative paths are resolved against the manifest's directory.
+    
+    RETURNS:
+        List of (input_folder, output_path) pairs
+    """
+    base = os.path.dirname(os.path.abspath(path))
+    sets = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.split("#", 1)[0].strip()
+            if not line:
+                continue
+            parts = [p.strip() for p in line.split("\t") if p.strip()]
+            folder = os.path.join(base, parts[0])
+            if len(parts) > 1:
+                output = os.path.join(base, parts[1])
+            else:
+                output = os.path.join(output_dir, os.path.basename(os.path.normpath(folder)) + ".jpg")
+            sets.append((folder, output))
+    return sets
+
+def is_up_to_date(folder, output):
+    """True if output exists and is newer than every input image."""
+    if not os.path.exists(output):
+        return False
+    paths = _image_paths(folder)
+    if not paths:
+        return False
+    newest_input = max(os.path.getmtime(p) for p in paths)
+    return os.path.getmtime(output) >= newest_input
+
+def estimate_set_memory_mb(folder):
+    """
+    Estimated peak memory of stitching one set, in MB.
+    
+    Image sizes come from 1/8-scale decodes (cheap for JPEG), so no
+    full-resolution image is loaded by the scheduler.
+    """
+    pixels = 0
+    for path in _image_paths(folder):
+        thumb = cv2.imread(path, cv2.IMREAD_REDUCED_GRAYSCALE_8)
+        if thumb is not None:
+            pixels += thumb.shape[0] * thumb.shape[1] * 64
+    return BATCH_BASE_MEMORY_MB + pixels * BATCH_BYTES_PER_PIXEL / (1024 * 1024)
+
+def _run_stitch_job(folder, output, log_path, feature_workers=1):
+    """
+    Batch worker: stitch one set with its console output sent to a log file.
+    
+    Feature extraction runs serially inside the job by default; parallelism
+    comes from running several jobs at once.
+    """
+    with open(log_path, "w", encoding="utf-8") as log, contextlib.redirect_stdout(log):
+        t_start = time.perf_counter()
+        try:
+            summary = stitch_folder(folder, output, feature_workers=feature_workers)
+        except Exception as e:
+            summary = dict(input=folder, output=output, status="failed",
+                           error=f"{type(e).__name__}: {e}",
+                           timings=dict(total=time.perf_counter() - t_start))
+    summary["log"] = log_path
+    return summary
+
+def run_batch(sets, jobs=BATCH_JOBS, memory_budget_mb=BATCH_MEMORY_BUDGET_MB,
+              force=False, summary_path=None, feature_workers=1):
+    """
+    Stitch many capture sets concurrently.
+    
+    ALGORITHM:
+        1. Skip sets whose panorama is newer than all their inputs (unless force)
+        2. Estimate each remaining set's peak memory
+        3. Admit sets to a process pool while running jobs < jobs and their
+           summed estimates fit the memory budget (a set larger than the
+           whole budget runs alone)
+        4. Append one JSON line per set (status, timings, shape) to the summary
+    
+    PARAMETERS:
+        sets: List of (input_folder, output_path) pairs
+        jobs: Maximum concurrent sets (BATCH_JOBS)
+        memory_budget_mb: Memory budget for concurrent sets (BATCH_MEMORY_BUDGET_MB)
+        force: Re-stitch sets that are already up to date (False)
+        summary_path: JSON-lines summary file (None = no file)
+        feature_workers: Feature extraction processes inside each set (1)
+    
+    RETURNS:
+        List of per-set summary dicts, in completion order
+    """
+    results = []
+    
+    def record(summary):
+        results.append(summary)
+        _log(f"  [{summary['status']:>8}] {summary['input']} "
+              f"({summary['timings'].get('total', 0.0):.1f}s)")
+        if summary_path:
+            with open(summary_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(summary) + "\n")
+    
+    pending = []
+    for folder, output in sets:
+        if not force and is_up_to_date(folder, output):
+            record(dict(input=folder, output=output, status="current", timings={}))
+        else:
+            pending.append((folder, output, estimate_set_memory_mb(folder)))
+    
+    _log(f"\nBatch: {len(pending)} set(s) to stitch, {len(results)} up to date")
+    
+    running = {}
+    in_flight_mb = 0.0
+    with ProcessPoolExecutor(max_workers=max(1, jobs)) as pool:
+        while pending or running:
+            # Admit jobs in order while they fit
+            while pending and len(running) < jobs:
+                folder, output, est_mb = pending[0]
+                if running and in_flight_mb + est_mb > memory_budget_mb:
+                    break
+                pending.pop(0)
+                os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+                log_path = os.path.splitext(output)[0] + ".log"
+                future = pool.submit(_run_stitch_job, folder, output, log_path, feature_workers)
+                running[future] = (folder, output, est_mb)
+                in_flight_mb += est_mb
+            
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                folder, output, est_mb = running.pop(future)
+                in_flight_mb -= est_mb
+                try:
+                    summary = future.result()
+                except Exception as e:
+                    summary = dict(input=folder, output=output, status="failed",
+                                   error=f"{type(e).__name__}: {e}", timings={})
+                summary["memory_estimate_mb"] = round(est_mb, 1)
+                record(summary)
+    
+    return results
+
+def main(argv=None):
+    """
+    Main entry point.
+    
+    MODES:
+        (no arguments)             Stitch DEFAULT_INPUT_FOLDER to DEFAULT_OUTPUT_PATH
+        -i FOLDER -o FILE          Stitch one capture set
+        -i FOLDER -o FILE --watch  Stitch frames as they arrive in FOLDER
+        -i FOLDER -o FILE --grid RxC  Stitch a row × column grid mosaic
+        -i FOLDER -o FILE --unordered Stitch a set whose filenames are not in scan order
+        --root DIR --output-dir D  Stitch every subfolder of DIR concurrently
+        --manifest FILE            Stitch the sets listed in FILE concurrently
+    """
+    parser = argparse.ArgumentParser(description="Sequential panorama stitching")
+    parser.add_argument("-i", "--input", default=DEFAULT_INPUT_FOLDER, help="input image folder (single set)")
+    parser.add_argument("-o", "--output", default=DEFAULT_OUTPUT_PATH, help="output panorama (single set; .dzi writes a Deep Zoom tile pyramid)")
+    parser.add_argument("--watch", action="store_true",
+                        help="watch the input folder and extend the panorama as frames arrive")
+    parser.add_argument("--preview", help="preview image kept up to date in watch mode "
+                                          "(default: <output>_preview.jpg)")
+    parser.add_argument("--idle-timeout", type=float, default=STREAM_IDLE_TIMEOUT,
+                        help="watch mode: stop after this many seconds without new frames")
+    parser.add_argument("--metrics", help="write per-stage metrics as JSON lines to this file")
+    parser.add_argument("--trace", help="write a Chrome trace (chrome://tracing, Perfetto) to this file")
+    parser.add_argument("--grid", help="stitch a ROWSxCOLS grid mosaic (images in row-major order)")
+    parser.add_argument("--grid-overlap", type=float, default=GRID_EXPECTED_OVERLAP,
+                        help="expected overlap fraction between grid neighbours")
+    parser.add_argument("--serpentine", action="store_true", help="odd grid rows scanned right to left")
+    parser.add_argument("--unordered", action="store_true",
+                        help="recover the scan order from image content instead of filenames")
+    parser.add_argument("--overlap-features", action="store_true",
+                        help="detect and match features only in the expected overlap bands")
+    parser.add_argument("--workers", type=int,
+                        help="feature extraction processes per set (default: FEATURE_WORKERS "
+                             "for one set, 1 per batch job)")
+    parser.add_argument("--root", help="directory whose subfolders are capture sets")
+    parser.add_argument("--manifest", help="file listing capture sets (folder[<TAB>output] per line)")
+    parser.add_argument("--output-dir", help="batch output directory (default: <root>_output)")
+    parser.add_argument("--jobs", type=int, default=BATCH_JOBS, help="maximum concurrent sets")
+    parser.add_argument("--memory-budget-mb", type=float, default=BATCH_MEMORY_BUDGET_MB,
+                        help="memory budget for concurrent sets")
+    parser.add_argument("--force", action="store_true", help="re-stitch sets that are up to date")
+    parser.add_argument("--summary", help="JSON-lines summary file (default: <output-dir>/batch_summary.jsonl)")
+    args = parser.parse_args(argv)
+    
+    if args.watch or (not args.root and not args.manifest):
+        if args.metrics or args.trace:
+            METRICS.enabled = True
+            METRICS.reset()
+        if args.watch:
+            watch_folder(args.input, args.output, preview_path=args.preview,
+                         idle_timeout=args.idle_timeout)
+        else:
+            grid_shape = None
+            if args.grid:
+                rows, cols = args.grid.lower().split("x")
+                grid_shape = (int(rows), int(cols))
+            workers = FEATURE_WORKERS if args.workers is None else args.workers
+            stitch_folder(args.input, args.output, feature_workers=workers, grid_shape=grid_shape,
+                          grid_overlap=args.grid_overlap, serpentine=args.serpentine,
+                          unordered=args.unordered, overlap_features=args.overlap_features)
+        if args.metrics:
+            METRICS.write_jsonl(args.metrics)
+            _log(f"Metrics written to: {args.metrics}")
+        if args.trace:
+            METRICS.write_chrome_trace(args.trace)
+            _log(f"Trace written to: {args.trace}")
+        return
+    
+    if args.output_dir:
+        output_dir = args.output_dir
+    elif args.root:
+        output_dir = os.path.normpath(args.root) + "_output"
+    else:
+        output_dir = os.path.splitext(args.manifest)[0] + "_output"
+    os.makedirs(output_dir, exist_ok=True)
+    
+    sets = []
+    if args.root:
+        sets += find_capture_sets(args.root, output_dir)
+    if args.manifest:
+        sets += read_manifest(args.manifest, output_dir)
+    
+    summary_path = args.summary or os.path.join(output_dir, "batch_summary.jsonl")
+    results = run_batch(sets, jobs=args.jobs, memory_budget_mb=args.memory_budget_mb,
+                        force=args.force, summary_path=summary_path,
+                        feature_workers=1 if args.workers is None else args.workers)
+    
+    counts = {}
+    for r in results:
+        counts[r["status"]] = counts.get(r["status"], 0) + 1
+    _log(f"\n✓ Batch finished: {counts}")
+    _log(f"Summary written to: {summary_path}")
 
 if __name__ == "__main__":
     main()